@@ -0,0 +1,136 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Any, Dict, List
+
+
+class _Request:
+    __slots__ = ("img", "session_id", "state", "future", "enqueued_at")
+
+    def __init__(self, img: Any, session_id: Any, state: Optional[Dict[str, Any]], future: asyncio.Future):
+        self.img = img
+        self.session_id = session_id
+        self.state = state
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchInferenceEngine:
+    """
+    Shared inference engine that groups frames from all active sessions into
+    micro-batches and runs one batched forward pass per group.
+
+    A batch is dispatched as soon as max_batch_size frames are waiting, or when
+    the oldest waiting frame has waited max_wait_ms. Each caller awaits infer()
+    and receives the detections for its own frame. batch_fn(imgs, states) also
+    gets each frame's per-session detector state (e.g. its text queries).
+    """
+
+    def __init__(self,
+                 batch_fn: Callable[[List[Any], List[Optional[Dict[str, Any]]]], List[Any]],
+                 max_batch_size: int = 4,
+                 max_wait_ms: float = 10.0):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self.batches = 0
+        self.frames = 0
+        self.busy_time = 0.0
+        self.frames_by_session: Dict[Any, int] = {}
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-inference")
+        self._task = asyncio.create_task(self._run())
+
+    async def infer(self, img: Any, session_id: Any = None, state: Optional[Dict[str, Any]] = None) -> Any:
+        """Queues one frame and waits for its detections."""
+        if self._task is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Request(img, session_id, state, future))
+        return await future
+
+    async def _collect(self) -> List[_Request]:
+        batch = [await self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Callers that went away (session closed) do not need a forward pass
+        return [r for r in batch if not r.future.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.batch_fn, [r.img for r in batch], [r.state for r in batch]
+                )
+                # zip() would silently leave the frames without a result waiting forever
+                if len(results) != len(batch):
+                    raise RuntimeError(f"batch_fn returned {len(results)} results for {len(batch)} frames")
+            except Exception as e:
+                print(f"[BatchEngine] Batched inference failed: {e}")
+                for r in batch:
+                    if not r.future.done():
+                        r.future.set_exception(e)
+                continue
+            self.busy_time += time.perf_counter() - start
+            self.batches += 1
+            self.frames += len(batch)
+
+            # Route each result back to the session that sent the frame
+            for r, result in zip(batch, results):
+                self.frames_by_session[r.session_id] = self.frames_by_session.get(r.session_id, 0) + 1
+                if not r.future.done():
+                    r.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch_size": (self.frames / self.batches) if self.batches else 0.0,
+            "avg_batch_ms": (self.busy_time / self.batches * 1000.0) if self.batches else 0.0,
+        }
+
+    def forget_session(self, session_id: Any):
+        self.frames_by_session.pop(session_id, None)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._queue is not None:
+            while not self._queue.empty():
+                r = self._queue.get_nowait()
+                if not r.future.done():
+                    r.future.cancel()
+            self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
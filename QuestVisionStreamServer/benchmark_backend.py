@@ -0,0 +1,101 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from typing import List, Optional, Tuple
+from detectors import get_detector
+from config import DETECTOR_INPUT_SIZES, LETTERBOX, DETECTOR_PRECISION
+from benchmark_precision import load_images, synthetic_images, summarize, agreement
+
+# Compares the ONNX Runtime backend against the PyTorch path on identical
+# frames: load time (the first ONNX run includes the export), per-frame
+# latency and how many PyTorch detections ONNX Runtime reproduces.
+#
+#   python benchmark_backend.py --detector yolo --images samples/ --threads 4
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='PyTorch vs ONNX Runtime latency / agreement benchmark')
+    parser.add_argument('--detector', choices=['yolo', 'owlv2'], default='yolo')
+    parser.add_argument('--images', default=None,
+                       help='Directory of benchmark images (default: synthetic frames, latency only)')
+    parser.add_argument('--precision', default=None,
+                       help='Precision for both backends (default: DETECTOR_PRECISION)')
+    parser.add_argument('--threads', type=int, default=None,
+                       help='torch threads and ONNX Runtime intra-op threads (default: each runtime\'s own)')
+    parser.add_argument('--inter-op', type=int, default=1, help='ONNX Runtime inter-op threads')
+    parser.add_argument('--frames', type=int, default=16, help='Synthetic frames when --images is not set')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed runs before measuring')
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    return parser.parse_args()
+
+
+def run(detector_name: str, backend: str, precision: str, images: List[np.ndarray], warmup: int,
+        threads: Optional[int], inter_op: int) -> Tuple[str, float, List[float], List[list]]:
+    detector = get_detector(detector_name, input_size=DETECTOR_INPUT_SIZES.get(detector_name),
+                            letterbox=LETTERBOX, precision=precision,
+                            backend=backend, onnx_threads=(threads, inter_op))
+    start = time.perf_counter()
+    detector.load()
+    for img in images[:max(0, warmup)]:
+        detector.detect(img, state={})
+    load_seconds = time.perf_counter() - start
+    if threads and "torch" in sys.modules:
+        # Same core budget for both runtimes
+        sys.modules["torch"].set_num_threads(threads)
+
+    latencies, outputs = [], []
+    for img in images:
+        start = time.perf_counter()
+        outputs.append(detector.detect(img, state={}))
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return detector.precision, load_seconds, latencies, outputs
+
+
+def main():
+    args = parse_arguments()
+    precision = args.precision or DETECTOR_PRECISION.get(args.detector, "fp32")
+    probe = get_detector(args.detector)
+    if args.images:
+        images = load_images(args.images, probe.color_order)
+        if not images:
+            print(f"No images found in {args.images}")
+            return
+    else:
+        print("No --images given: synthetic frames, agreement numbers are not meaningful")
+        images = synthetic_images(args.frames)
+
+    print(f"Benchmarking {args.detector} ({precision}) on {len(images)} frames")
+    report = {"detector": args.detector, "frames": len(images), "threads": args.threads,
+              "inter_op": args.inter_op, "backends": {}}
+    baseline = None
+    for backend in ("torch", "onnx"):
+        used, load_seconds, latencies, outputs = run(args.detector, backend, precision, images, args.warmup,
+                                                     args.threads, args.inter_op)
+        entry = summarize(latencies)
+        entry["precision"] = used
+        entry["load_s"] = load_seconds
+        if baseline is None:
+            baseline = (entry, outputs)
+        else:
+            entry["speedup"] = baseline[0]["mean_ms"] / entry["mean_ms"] if entry["mean_ms"] else 0.0
+            entry["agreement"] = agreement(baseline[1], outputs)
+        report["backends"][backend] = entry
+
+    print(f"{'backend':<8} {'prec':<5} {'load s':>7} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'speedup':>8} {'recall':>7} {'f1':>6}")
+    for backend, entry in report["backends"].items():
+        agree = entry.get("agreement", {"recall": 1.0, "f1": 1.0})
+        print(f"{backend:<8} {entry['precision']:<5} {entry['load_s']:7.1f} {entry['mean_ms']:9.1f} "
+              f"{entry['p50_ms']:9.1f} {entry['p95_ms']:9.1f} {entry.get('speedup', 1.0):8.2f} "
+              f"{agree['recall']:7.2f} {agree['f1']:6.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
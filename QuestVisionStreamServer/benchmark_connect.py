@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import json
+import time
+import websockets
+from typing import Dict, List
+from aiortc import RTCConfiguration, RTCIceServer, RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+from config import PORT, ICE_SERVERS
+from benchmark_precision import summarize
+
+# Connect latency as a headset sees it: a loopback peer offers a video track
+# and the detections data channel to a running server, and times offer sent
+# -> answer received -> peer connection connected -> data channel open, then
+# disconnects and repeats. The server logs its own offer-to-connected split.
+#
+#   python server.py --lan &
+#   python benchmark_connect.py --lan --runs 20
+
+STEPS = ("answer", "connected", "channel_open")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Offer-to-connected latency against a running server')
+    parser.add_argument('--url', default=f'ws://127.0.0.1:{PORT}', help='Server signaling URL')
+    parser.add_argument('--runs', type=int, default=10, help='Connections to time')
+    parser.add_argument('--lan', action='store_true',
+                       help='Host candidates only on this side too (otherwise ICE_SERVERS)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Seconds before a connect attempt fails')
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    return parser.parse_args()
+
+
+async def connect_once(url: str, lan: bool, timeout: float) -> Dict[str, float]:
+    servers = [] if lan else [RTCIceServer(urls=s["urls"], username=s.get("username"), credential=s.get("credential"))
+                              for s in ICE_SERVERS]
+    pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=servers))
+    timing: Dict[str, float] = {}
+    connected, opened = asyncio.Event(), asyncio.Event()
+
+    channel = pc.createDataChannel("detections")
+    pc.addTrack(VideoStreamTrack())
+
+    @pc.on("connectionstatechange")
+    def _on_state():
+        if pc.connectionState == "connected":
+            connected.set()
+
+    @channel.on("open")
+    def _on_open():
+        opened.set()
+
+    try:
+        async with websockets.connect(url) as websocket:
+            # Gathering happens here, before the clock starts, as on the headset
+            await pc.setLocalDescription(await pc.createOffer())
+            start = time.perf_counter()
+            await websocket.send(json.dumps({"type": "offer", "sdp": pc.localDescription.sdp}))
+
+            async def handshake():
+                async for message in websocket:
+                    data = json.loads(message)
+                    if data.get("type") == "answer":
+                        timing["answer"] = (time.perf_counter() - start) * 1000.0
+                        await pc.setRemoteDescription(RTCSessionDescription(sdp=data["sdp"], type="answer"))
+                        break
+                await connected.wait()
+                timing["connected"] = (time.perf_counter() - start) * 1000.0
+                await opened.wait()
+                timing["channel_open"] = (time.perf_counter() - start) * 1000.0
+
+            await asyncio.wait_for(handshake(), timeout)
+    finally:
+        await pc.close()
+    return timing
+
+
+async def run(args):
+    results: Dict[str, List[float]] = {step: [] for step in STEPS}
+    failures = 0
+    for i in range(args.runs):
+        try:
+            timing = await connect_once(args.url, args.lan, args.timeout)
+        except (asyncio.TimeoutError, OSError, websockets.WebSocketException) as e:
+            failures += 1
+            print(f"Run {i + 1}: failed ({str(e) or 'timeout'})")
+            continue
+        print(f"Run {i + 1}: " + ", ".join(f"{step} {timing[step]:.0f}ms" for step in STEPS))
+        for step in STEPS:
+            results[step].append(timing[step])
+    return results, failures
+
+
+def main():
+    args = parse_arguments()
+    print(f"Connecting to {args.url} {args.runs}x ({'host candidates only' if args.lan else 'ICE_SERVERS'})")
+    results, failures = asyncio.run(run(args))
+    report = {"url": args.url, "runs": args.runs, "lan": args.lan, "failures": failures, "steps": {}}
+    if not results["connected"]:
+        print("No connection succeeded")
+    else:
+        print(f"{'offer to':<13} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+        for step in STEPS:
+            entry = report["steps"][step] = summarize(results[step])
+            print(f"{step:<13} {entry['mean_ms']:9.1f} {entry['p50_ms']:9.1f} {entry['p95_ms']:9.1f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import time
+import av
+import numpy as np
+from fractions import Fraction
+from typing import Dict, List, Tuple
+from detectors import get_detector, DETECTOR_NAMES
+from config import DETECTOR_INPUT_SIZES, LETTERBOX
+from frame_preprocessor import FramePreprocessor
+from benchmark_precision import summarize
+
+# Server-side cost of a frame at the resolution the headset sends today vs
+# the one StreamNegotiator asks for: synthetic video is encoded at both sizes,
+# then decoded the way aiortc does (libavcodec) and converted to the
+# detector's input by FramePreprocessor, timing each step per frame.
+#
+#   python benchmark_decode.py --detector yolo --source 1920x1080 --codec h264
+
+ENCODERS = {"h264": "libx264", "vp8": "libvpx"}
+
+
+def parse_size(value):
+    try:
+        width, height = (int(v) for v in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH, got '{value}'")
+    return width, height
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Per-frame decode time, full stream vs detector-sized stream')
+    parser.add_argument('--detector', choices=DETECTOR_NAMES, default='yolo',
+                       help='Detector whose input size sets the target')
+    parser.add_argument('--source', type=parse_size, default=(1920, 1080), help='Stream size today, WxH')
+    parser.add_argument('--target', type=parse_size, default=None,
+                       help='Requested stream size (default: the detector input size)')
+    parser.add_argument('--codec', choices=sorted(ENCODERS), default='h264')
+    parser.add_argument('--frames', type=int, default=120)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    return parser.parse_args()
+
+
+def synthetic_frames(width: int, height: int, count: int) -> List[np.ndarray]:
+    """Moving gradient with drifting blocks, so the encoder has motion and detail to code."""
+    rng = np.random.default_rng(0)
+    ys, xs = np.mgrid[0:height, 0:width]
+    blocks = rng.integers(0, [width, height], size=(12, 2))
+    frames = []
+    for i in range(count):
+        img = np.empty((height, width, 3), dtype=np.uint8)
+        img[..., 0] = (xs + 4 * i) % 256
+        img[..., 1] = (ys + 2 * i) % 256
+        img[..., 2] = ((xs + ys) // 2) % 256
+        for x, y in (blocks + [6 * i, 3 * i]) % [width, height]:
+            img[y:y + height // 10, x:x + width // 10] = rng.integers(0, 256, 3)
+        frames.append(img)
+    return frames
+
+
+def encode(frames: List[np.ndarray], codec: str, fps: int) -> List[bytes]:
+    height, width = frames[0].shape[:2]
+    encoder = av.CodecContext.create(ENCODERS[codec], "w")
+    encoder.width, encoder.height = width, height
+    encoder.pix_fmt = "yuv420p"
+    encoder.time_base = Fraction(1, fps)
+    encoder.bit_rate = int(width * height * fps * 0.1)
+    encoder.options = {"tune": "zerolatency", "preset": "veryfast"} if codec == "h264" else {"deadline": "realtime"}
+    packets = []
+    for i, img in enumerate(frames):
+        frame = av.VideoFrame.from_ndarray(img, format="bgr24").reformat(format="yuv420p")
+        frame.pts = i
+        packets += [bytes(p) for p in encoder.encode(frame)]
+    packets += [bytes(p) for p in encoder.encode(None)]
+    return packets
+
+
+def decode(packets: List[bytes], codec: str, max_size: Tuple[int, int]) -> Dict[str, List[float]]:
+    decoder = av.CodecContext.create(codec, "r")
+    preprocessor = FramePreprocessor(color_order="bgr", max_size=max_size)
+    times: Dict[str, List[float]] = {"codec": [], "convert": [], "total": []}
+    for data in packets:
+        start = time.perf_counter()
+        frames = decoder.decode(av.Packet(data))
+        decoded = time.perf_counter()
+        for frame in frames:
+            preprocessor(frame)
+        done = time.perf_counter()
+        if frames:
+            times["codec"].append((decoded - start) * 1000.0)
+            times["convert"].append((done - decoded) * 1000.0)
+            times["total"].append((done - start) * 1000.0)
+    return times
+
+
+def fit(size: Tuple[int, int], box: Tuple[int, int]) -> Tuple[int, int]:
+    """Largest even size with size's aspect ratio inside box, as the sender would scale."""
+    scale = min(box[0] / size[0], box[1] / size[1], 1.0)
+    return max(2, int(size[0] * scale) & ~1), max(2, int(size[1] * scale) & ~1)
+
+
+def main():
+    args = parse_arguments()
+    # Only the detector's metadata is needed; nothing is loaded
+    probe = get_detector(args.detector, input_size=DETECTOR_INPUT_SIZES.get(args.detector), letterbox=LETTERBOX)
+    input_size = probe.input_size or args.source
+    target = fit(args.source, args.target or input_size)
+    print(f"{args.codec}, {args.frames} frames: {args.source[0]}x{args.source[1]} stream vs "
+          f"{target[0]}x{target[1]}, decoded for a {input_size[0]}x{input_size[1]} detector")
+
+    report = {"codec": args.codec, "frames": args.frames, "input_size": list(input_size), "streams": {}}
+    for name, size in (("before", args.source), ("after", target)):
+        packets = encode(synthetic_frames(size[0], size[1], args.frames), args.codec, args.fps)
+        times = decode(packets, args.codec, input_size)
+        report["streams"][name] = {"size": list(size), "kbytes": sum(map(len, packets)) / 1024,
+                                   **{step: summarize(values) for step, values in times.items()}}
+
+    print(f"{'stream':<7} {'size':>10} {'codec ms':>9} {'convert ms':>11} {'total ms':>9} {'p95 ms':>8}")
+    for name, entry in report["streams"].items():
+        size = f"{entry['size'][0]}x{entry['size'][1]}"
+        print(f"{name:<7} {size:>10} {entry['codec']['mean_ms']:9.2f} {entry['convert']['mean_ms']:11.2f} "
+              f"{entry['total']['mean_ms']:9.2f} {entry['total']['p95_ms']:8.2f}")
+    before, after = report["streams"]["before"]["total"]["mean_ms"], report["streams"]["after"]["total"]["mean_ms"]
+    if after:
+        print(f"Decode {before / after:.1f}x faster per frame")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+import av
+import cv2
+import numpy as np
+from typing import List, Dict, Any, Optional
+from video_processor import VideoProcessor, EXECUTION_MODES, PIPELINE_STAGE_NAMES
+from model_loader import ModelLoader
+from detectors import get_detectors, DETECTOR_NAMES, PRECISIONS
+from inference_setup import add_inference_arguments, detector_arguments, create_inference, connect_processor
+from config import *
+
+# Offline replay of recorded or synthetic frames through VideoProcessor and a
+# detector, without WebRTC. Prints one JSON report (throughput, per-stage and
+# end-to-end p50/p95/p99) so runs can be compared over time.
+#
+#   python benchmark_pipeline.py --detector yolo --mode max
+#   python benchmark_pipeline.py --detector owlv2 --video clip.mp4 --mode realtime --fps 30 --json owlv2.json
+#   python benchmark_pipeline.py --detector yolo --backend onnx --workers 2
+#
+# The detector is set up and connected exactly as server.py does it
+# (inference_setup): --backend, --batch-size / --batch-wait-ms (batched
+# detectors) and --workers (DetectorPool) default to the same config values.
+#
+# max      - frames are offered as fast as they are consumed; pipeline queues
+#            block instead of dropping, so every frame is processed
+# realtime - frames arrive at --fps like a headset stream, with the configured
+#            drop policies
+
+MAX_CACHED_FRAMES = 240
+
+
+class ReplayEnded(Exception):
+    pass
+
+
+class ReplayTrack:
+    """Stands in for an aiortc video track, handing out prepared frames."""
+
+    id = "replay"
+
+    def __init__(self, frames: List[av.VideoFrame], count: int, fps: Optional[float], drain):
+        self.frames = frames
+        self.count = count
+        self.interval = 1.0 / fps if fps else 0.0
+        self.drain = drain
+        self.sent = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    async def recv(self) -> av.VideoFrame:
+        now = time.perf_counter()
+        if self.started_at is None:
+            self.started_at = now
+        if self.sent >= self.count:
+            # drain() returns when the last frame was published
+            self.finished_at = await self.drain()
+            raise ReplayEnded()
+        if self.interval:
+            delay = self.started_at + self.sent * self.interval - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+        frame = self.frames[self.sent % len(self.frames)]
+        self.sent += 1
+        return frame
+
+
+def synthetic_frames(count: int, width: int, height: int) -> List[av.VideoFrame]:
+    """Textured background with a moving block, as yuv420p like a decoded stream."""
+    rng = np.random.default_rng(0)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    box_w, box_h = width // 6, height // 6
+    frames = []
+    for i in range(count):
+        img = background.copy()
+        x = int((width - box_w) * (0.5 + 0.5 * math.sin(i / 15.0)))
+        y = int((height - box_h) * (0.5 + 0.5 * math.cos(i / 23.0)))
+        cv2.rectangle(img, (x, y), (x + box_w, y + box_h), (40, 40, 220), -1)
+        frames.append(av.VideoFrame.from_ndarray(img, format="bgr24").reformat(format="yuv420p"))
+    return frames
+
+
+def load_video(path: str, limit: int) -> List[av.VideoFrame]:
+    """Decodes up to limit frames up front so file decoding is not measured."""
+    frames = []
+    with av.open(path) as container:
+        for frame in container.decode(video=0):
+            frames.append(frame.reformat(format="yuv420p"))
+            if len(frames) >= limit:
+                break
+    return frames
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Offline pipeline / detector benchmark')
+    parser.add_argument('--detector', choices=DETECTOR_NAMES, default='yolo')
+    parser.add_argument('--video', default=None, help='Video file to replay (default: synthetic frames)')
+    parser.add_argument('--width', type=int, default=1280, help='Synthetic frame width')
+    parser.add_argument('--height', type=int, default=960, help='Synthetic frame height')
+    parser.add_argument('--frames', type=int, default=300, help='Frames to feed (the source is looped)')
+    parser.add_argument('--mode', choices=['max', 'realtime'], default='max')
+    parser.add_argument('--fps', type=float, default=30.0, help='Arrival rate in realtime mode')
+    parser.add_argument('--execution-mode', choices=EXECUTION_MODES, default=EXECUTION_MODE)
+    parser.add_argument('--input-size', default=None, help='Detector input size WxH')
+    parser.add_argument('--precision', choices=PRECISIONS, default=None)
+    add_inference_arguments(parser)
+    parser.add_argument('--no-gate', action='store_true', help='Disable MOTION_GATE')
+    parser.add_argument('--no-tracker', action='store_true', help='Disable TRACKER')
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    return parser.parse_args()
+
+
+async def run(args) -> Dict[str, Any]:
+    input_size = tuple(int(v) for v in args.input_size.lower().split('x')) if args.input_size else None
+    detector_args = detector_arguments([(args.detector, None)], input_size, args.precision, args.backend)
+    input_size = detector_args["input_sizes"][args.detector]
+    detector = get_detectors(**detector_args)
+    pool, inference_engine, scheduler = create_inference(
+        detector, detector_args, args.workers, args.batch_size, args.batch_wait_ms, args.inference_slots
+    )
+    loader = ModelLoader(detector, pool=pool, warmup_runs=WARMUP_RUNS,
+                         warmup_batch=args.batch_size if inference_engine is not None and pool is None else 1)
+    await loader.run()
+    if loader.error is not None:
+        raise SystemExit(f"Detector failed to load: {loader.error}")
+
+    if args.video:
+        frames = load_video(args.video, min(args.frames, MAX_CACHED_FRAMES))
+        if not frames:
+            raise SystemExit(f"No frames decoded from {args.video}")
+    else:
+        frames = synthetic_frames(min(args.frames, MAX_CACHED_FRAMES), args.width, args.height)
+
+    stages = dict(PIPELINE_STAGES)
+    if args.mode == "max":
+        # Measure every frame rather than how many get dropped
+        stages = {name: {**stages.get(name, {}), "drop_policy": "block"} for name in PIPELINE_STAGE_NAMES}
+
+    processor = VideoProcessor(
+        enable_display=False,
+        flip_vertical=FLIP_VERTICAL,
+        flip_horizontal=FLIP_HORIZONTAL,
+        rotate_180=ROTATE_180,
+        log_interval=max(args.frames + 1, 1),
+        execution_mode=args.execution_mode,
+        pipeline_stages=stages,
+        color_order=detector.color_order,
+        decode_max_size=detector.input_size if DECODE_AT_MODEL_SIZE else None,
+        motion_gate=None if args.no_gate else MOTION_GATE,
+        tracker=None if args.no_tracker else TRACKER,
+    )
+    state: Dict[str, Any] = {}
+    processor.detector_state = state
+    connect_processor(processor, detector, state, inference_engine, scheduler)
+
+    payload_bytes = []
+
+    def sink(payload: Dict[str, Any]):
+        start = time.perf_counter()
+        payload_bytes.append(len(json.dumps(payload)))
+        processor.stage_latency["serialize"].record((time.perf_counter() - start) * 1000.0)
+
+    processor.set_data_channel_sender(sink)
+
+    pipeline_stats: Dict[str, Any] = {}
+
+    async def drain():
+        # Let in-flight frames finish: published count stable and queues empty
+        quiet_for = max(0.5, 3 * processor.stage_latency["infer"].summary()["mean_ms"] / 1000.0)
+        last, stable_since = -1, time.perf_counter()
+        while time.perf_counter() - stable_since < quiet_for:
+            queued = sum(s["queued"] for s in processor.pipeline.stats().values()) if processor.pipeline else 0
+            if processor.frames_published != last or queued:
+                last, stable_since = processor.frames_published, time.perf_counter()
+            await asyncio.sleep(0.05)
+        if processor.pipeline is not None:
+            pipeline_stats.update(processor.pipeline.stats())
+        if processor.inference_worker is not None:
+            pipeline_stats["worker"] = processor.inference_worker.stats()
+        return stable_since
+
+    track = ReplayTrack(frames, args.frames, args.fps if args.mode == "realtime" else None, drain)
+    try:
+        await processor.process_video_stream(track)
+    finally:
+        scheduler.shutdown()
+        if pool is not None:
+            await pool.stop()
+        elif inference_engine is not None:
+            await inference_engine.stop()
+
+    wall = (track.finished_at or time.perf_counter()) - (track.started_at or 0.0)
+    report: Dict[str, Any] = {
+        "detector": args.detector,
+        "input_size": list(input_size) if input_size else None,
+        "precision": detector.precision,
+        "backend": detector.backend,
+        "workers": args.workers if pool is not None else 1,
+        "batch_size": inference_engine.max_batch_size if inference_engine is not None and pool is None else 1,
+        "source": args.video or f"synthetic {args.width}x{args.height}",
+        "mode": args.mode,
+        "fps_target": args.fps if args.mode == "realtime" else None,
+        "execution_mode": args.execution_mode,
+        "frames_in": track.sent,
+        "frames_published": processor.frames_published,
+        "wall_s": wall,
+        "throughput_fps": processor.frames_published / wall if wall > 0 else 0.0,
+        "latency": processor.latency_report(),
+        "payload_bytes_avg": float(np.mean(payload_bytes)) if payload_bytes else 0.0,
+        "pipeline": pipeline_stats,
+    }
+    if inference_engine is not None:
+        report["inference_engine"] = inference_engine.stats()
+    if processor.motion_gate is not None:
+        report["motion_gate"] = processor.motion_gate.stats()
+    if processor.tracker is not None:
+        report["tracker"] = processor.tracker.stats()
+    return report
+
+
+def main():
+    args = parse_arguments()
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
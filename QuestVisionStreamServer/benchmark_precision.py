@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import time
+import cv2
+import numpy as np
+from typing import List, Dict, Any, Tuple
+from detectors import get_detector, PRECISIONS
+from config import DETECTOR_INPUT_SIZES, LETTERBOX
+
+# Compares a reduced-precision detector against its fp32 baseline on a fixed
+# image set: per-frame latency and how many fp32 detections it reproduces.
+#
+#   python benchmark_precision.py --detector owlv2 --images samples/ --precision int8 bf16
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MATCH_IOU = 0.5
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Reduced-precision latency / agreement benchmark')
+    parser.add_argument('--detector', choices=['florence2', 'owlv2', 'grounding_dino'], default='owlv2')
+    parser.add_argument('--images', default=None,
+                       help='Directory of benchmark images (default: synthetic frames, latency only)')
+    parser.add_argument('--precision', nargs='+', choices=[p for p in PRECISIONS if p != 'fp32'],
+                       default=['int8', 'bf16'], help='Precisions to compare against fp32')
+    parser.add_argument('--frames', type=int, default=16, help='Synthetic frames when --images is not set')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed runs before measuring')
+    parser.add_argument('--json', default=None, help='Also write the report to this file')
+    return parser.parse_args()
+
+
+def load_images(directory: str, color_order: str) -> List[np.ndarray]:
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        img = cv2.imread(os.path.join(directory, name), cv2.IMREAD_COLOR)
+        if img is None:
+            continue
+        images.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB) if color_order == "rgb" else img)
+    return images
+
+
+def synthetic_images(count: int, width: int = 640, height: int = 480) -> List[np.ndarray]:
+    # Fixed seed so every precision sees identical frames
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def match(baseline: List[Dict[str, Any]], candidate: List[Dict[str, Any]]) -> int:
+    """Greedy one-to-one matches with the same label and IoU >= MATCH_IOU."""
+    if not baseline or not candidate:
+        return 0
+    ious = iou_matrix(np.array([d["bbox"] for d in baseline], dtype=np.float32),
+                      np.array([d["bbox"] for d in candidate], dtype=np.float32))
+    same_label = np.array([[b["label"] == c["label"] for c in candidate] for b in baseline])
+    ious[~same_label] = 0.0
+    matches = 0
+    while True:
+        i, j = np.unravel_index(np.argmax(ious), ious.shape)
+        if ious[i, j] < MATCH_IOU:
+            return matches
+        matches += 1
+        ious[i, :] = 0.0
+        ious[:, j] = 0.0
+
+
+def run(detector_name: str, precision: str, images: List[np.ndarray], warmup: int) -> Tuple[str, List[float], List[list]]:
+    detector = get_detector(detector_name, input_size=DETECTOR_INPUT_SIZES.get(detector_name),
+                            letterbox=LETTERBOX, precision=precision)
+    detector.load()
+    for img in images[:max(0, warmup)]:
+        detector.detect(img, state={})
+
+    latencies, outputs = [], []
+    for img in images:
+        # Fresh state per frame so nothing carries over between frames
+        start = time.perf_counter()
+        outputs.append(detector.detect(img, state={}))
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return detector.precision, latencies, outputs
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = np.asarray(latencies, dtype=np.float64)
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+    }
+
+
+def agreement(baseline: List[list], candidate: List[list]) -> Dict[str, float]:
+    matched = sum(match(b, c) for b, c in zip(baseline, candidate))
+    base_total = sum(len(b) for b in baseline)
+    cand_total = sum(len(c) for c in candidate)
+    recall = matched / base_total if base_total else 1.0
+    precision = matched / cand_total if cand_total else 1.0
+    f1 = 2 * recall * precision / (recall + precision) if (recall + precision) else 0.0
+    return {"matched": matched, "baseline_boxes": base_total, "boxes": cand_total,
+            "recall": recall, "precision": precision, "f1": f1}
+
+
+def main():
+    args = parse_arguments()
+    probe = get_detector(args.detector)
+    if args.images:
+        images = load_images(args.images, probe.color_order)
+        if not images:
+            print(f"No images found in {args.images}")
+            return
+    else:
+        print("No --images given: synthetic frames, agreement numbers are not meaningful")
+        images = synthetic_images(args.frames)
+
+    print(f"Benchmarking {args.detector} on {len(images)} frames")
+    _, base_latencies, base_outputs = run(args.detector, "fp32", images, args.warmup)
+    report = {"detector": args.detector, "frames": len(images),
+              "fp32": summarize(base_latencies), "modes": {}}
+
+    for precision in args.precision:
+        used, latencies, outputs = run(args.detector, precision, images, args.warmup)
+        if used != precision:
+            print(f"Skipping {precision}: not available here")
+            continue
+        entry = summarize(latencies)
+        entry["speedup"] = report["fp32"]["mean_ms"] / entry["mean_ms"] if entry["mean_ms"] else 0.0
+        entry["agreement"] = agreement(base_outputs, outputs)
+        report["modes"][precision] = entry
+
+    print(f"{'mode':<6} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'speedup':>8} {'recall':>7} {'f1':>6}")
+    fp32 = report["fp32"]
+    print(f"{'fp32':<6} {fp32['mean_ms']:9.1f} {fp32['p50_ms']:9.1f} {fp32['p95_ms']:9.1f} {1.0:8.2f} {1.0:7.2f} {1.0:6.2f}")
+    for precision, entry in report["modes"].items():
+        agree = entry["agreement"]
+        print(f"{precision:<6} {entry['mean_ms']:9.1f} {entry['p50_ms']:9.1f} {entry['p95_ms']:9.1f} "
+              f"{entry['speedup']:8.2f} {agree['recall']:7.2f} {agree['f1']:6.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
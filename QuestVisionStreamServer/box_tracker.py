@@ -0,0 +1,259 @@
+import itertools
+import cv2
+import numpy as np
+from typing import Optional, Any, Dict, List, Sequence, Tuple
+
+
+class _Track:
+    __slots__ = ("id", "detection", "box", "points", "missed")
+
+    def __init__(self, track_id: int, detection: Dict[str, Any], box: np.ndarray):
+        self.id = track_id
+        self.detection = detection
+        self.box = box                  # float32 [x1, y1, x2, y2]
+        self.points: Optional[np.ndarray] = None  # (N, 1, 2) float32 feature points
+        self.missed = 0                 # consecutive keyframes without a matching detection
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) xyxy boxes."""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def _move_points(points: List[List[float]], old: Sequence[float], new: Sequence[float]) -> List[List[float]]:
+    """Carries [x, y, ...] points (e.g. pose landmarks) along with their box from old to new."""
+    points = np.array(points, dtype=np.float64)
+    old_w, old_h = max(old[2] - old[0], 1e-3), max(old[3] - old[1], 1e-3)
+    points[:, 0] = (points[:, 0] - old[0]) * ((new[2] - new[0]) / old_w) + new[0]
+    points[:, 1] = (points[:, 1] - old[1]) * ((new[3] - new[1]) / old_h) + new[1]
+    return np.round(points, 2).tolist()
+
+
+def _class_key(detection: Dict[str, Any]) -> Tuple[Any, Any]:
+    """Tracks only match detections of the same label from the same detector."""
+    return detection.get("source"), detection.get("label")
+
+
+class BoxTracker:
+    """
+    Keeps boxes fresh between detector keyframes for one stream.
+
+    On a keyframe, detections are associated with existing tracks (greedy IoU,
+    same label) so every object keeps a persistent id, and a few feature points
+    are seeded inside each box. On the frames in between, the points are
+    followed with pyramidal Lucas-Kanade optical flow on a grayscale copy of the
+    processed frame and each box is shifted / scaled by the median motion of its
+    points; the flow-propagated boxes are what the next keyframe is matched
+    against. A keyframe is requested every keyframe_interval frames, or sooner
+    when too many tracks lose their points.
+
+    A keyframe whose detector only saw part of the frame (a region-of-interest
+    crop) passes that region: tracks centered outside it were not looked for,
+    so they are carried over with flow instead of counting a miss.
+    """
+
+    def __init__(self,
+                 keyframe_interval: int = 5,
+                 iou_threshold: float = 0.3,
+                 max_missed: int = 2,
+                 max_points: int = 12,
+                 min_points: int = 3,
+                 max_lost_ratio: float = 0.5):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.iou_threshold = iou_threshold
+        self.max_missed = max(0, max_missed)
+        self.max_points = max_points
+        self.min_points = min_points
+        self.max_lost_ratio = max_lost_ratio
+
+        self.tracks: List[_Track] = []
+        self._ids = itertools.count(1)
+        self._gray_buffers: List[np.ndarray] = []
+        self._gray_index = 0
+        self._prev: Optional[np.ndarray] = None
+        self._since_keyframe = 0
+        self._lost_ratio = 0.0
+        self._force = False
+        self._lk_params = dict(winSize=(15, 15), maxLevel=2,
+                               criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+        self.keyframes = 0
+        self.tracked_frames = 0
+
+    def reset(self):
+        """Requests a keyframe on the next frame (any thread)."""
+        self._force = True
+
+    def needs_keyframe(self) -> bool:
+        return (self._force
+                or self._prev is None
+                or self._since_keyframe >= self.keyframe_interval - 1
+                or self._lost_ratio > self.max_lost_ratio)
+
+    def _to_gray(self, img: np.ndarray) -> np.ndarray:
+        shape = img.shape[:2]
+        if not self._gray_buffers or self._gray_buffers[0].shape != shape:
+            # Two buffers: the previous frame must survive while the next is written
+            self._gray_buffers = [np.empty(shape, dtype=np.uint8) for _ in range(2)]
+            self._prev = None
+        self._gray_index ^= 1
+        gray = self._gray_buffers[self._gray_index]
+        # Channel order does not matter for flow
+        cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=gray)
+        return gray
+
+    def _seed_points(self, gray: np.ndarray, track: _Track):
+        height, width = gray.shape
+        x1, y1, x2, y2 = track.box
+        x1, y1 = int(max(0, x1)), int(max(0, y1))
+        x2, y2 = int(min(width, x2)), int(min(height, y2))
+        points = None
+        if x2 - x1 >= 8 and y2 - y1 >= 8:
+            points = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], maxCorners=self.max_points,
+                                             qualityLevel=0.01, minDistance=4)
+        if points is None or len(points) < self.min_points:
+            # Textureless box: fall back to a 3x3 grid over its inner area
+            gx = np.linspace(x1 + 0.25 * (x2 - x1), x2 - 0.25 * (x2 - x1), 3) - x1
+            gy = np.linspace(y1 + 0.25 * (y2 - y1), y2 - 0.25 * (y2 - y1), 3) - y1
+            points = np.stack(np.meshgrid(gx, gy), axis=-1).reshape(-1, 1, 2)
+        track.points = (points.reshape(-1, 1, 2) + np.array([x1, y1], dtype=np.float32)).astype(np.float32)
+
+    def _associate(self, boxes: np.ndarray, labels: List[Tuple[Any, Any]]) -> Dict[int, int]:
+        """detection index -> track index, greedy by IoU among same-label (and same-source) pairs."""
+        if not self.tracks or boxes.shape[0] == 0:
+            return {}
+        ious = _iou(boxes, np.stack([t.box for t in self.tracks]))
+        track_labels = [_class_key(t.detection) for t in self.tracks]
+        ious[np.array([[label != tl for tl in track_labels] for label in labels])] = 0.0
+        matches = {}
+        while True:
+            d, t = np.unravel_index(np.argmax(ious), ious.shape)
+            if ious[d, t] < self.iou_threshold:
+                return matches
+            matches[int(d)] = int(t)
+            ious[d, :] = 0.0
+            ious[:, t] = 0.0
+
+    def update(self, img: np.ndarray, detections: Any,
+               region: Optional[Tuple[int, int, int, int]] = None) -> Any:
+        """
+        Keyframe: fresh detections in, the same detections with track ids out.
+        region is the (x1, y1, x2, y2) part of img the detections cover, None = all of it.
+        """
+        if not isinstance(detections, list):
+            # Not boxes (e.g. an annotated image): nothing to track, keep detecting
+            self._prev = None
+            return detections
+        gray = self._to_gray(img)
+        boxes = np.array([det["bbox"] for det in detections], dtype=np.float32).reshape(-1, 4)
+        matches = self._associate(boxes, [_class_key(det) for det in detections])
+
+        matched_tracks = set(matches.values())
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks and self._covered(track, region):
+                track.missed += 1
+        tracks = []
+        for d, det in enumerate(detections):
+            if d in matches:
+                track = self.tracks[matches[d]]
+                track.detection, track.box, track.missed = det, boxes[d].copy(), 0
+            else:
+                track = _Track(next(self._ids), det, boxes[d].copy())
+            tracks.append(track)
+        # Unmatched tracks linger a few keyframes so a missed detection keeps its id
+        tracks += [t for i, t in enumerate(self.tracks) if i not in matched_tracks and t.missed <= self.max_missed]
+        self.tracks = tracks
+
+        for track in self.tracks:
+            self._seed_points(gray, track)
+        self._prev = gray
+        self._since_keyframe = 0
+        self._lost_ratio = 0.0
+        self._force = False
+        self.keyframes += 1
+        return self._output(gray.shape)
+
+    @staticmethod
+    def _covered(track: _Track, region: Optional[Tuple[int, int, int, int]]) -> bool:
+        """Whether the keyframe's detector looked where the track is."""
+        if region is None:
+            return True
+        cx, cy = (track.box[0] + track.box[2]) / 2, (track.box[1] + track.box[3]) / 2
+        return region[0] <= cx < region[2] and region[1] <= cy < region[3]
+
+    def propagate(self, img: np.ndarray) -> List[Dict[str, Any]]:
+        """In-between frame: moves every track's box with the optical flow of its points."""
+        gray = self._to_gray(img)
+        prev = self._prev
+        self._prev = gray
+        self._since_keyframe += 1
+        self.tracked_frames += 1
+        live = [t for t in self.tracks if t.points is not None and len(t.points)]
+        if prev is None or not live:
+            return self._output(gray.shape)
+
+        # One LK call for the points of all tracks
+        old = np.concatenate([t.points for t in live])
+        new, status, _ = cv2.calcOpticalFlowPyrLK(prev, gray, old, None, **self._lk_params)
+        status = status.reshape(-1).astype(bool)
+
+        lost = 0
+        start = 0
+        for track in live:
+            end = start + len(track.points)
+            ok = status[start:end]
+            p0, p1 = old[start:end][ok].reshape(-1, 2), new[start:end][ok].reshape(-1, 2)
+            start = end
+            if len(p1) < self.min_points:
+                # Box stays where it was; counts towards an early keyframe
+                track.points = p1.reshape(-1, 1, 2) if len(p1) else None
+                lost += 1
+                continue
+
+            dx, dy = np.median(p1 - p0, axis=0)
+            d0 = np.linalg.norm(p0 - p0.mean(axis=0), axis=1)
+            d1 = np.linalg.norm(p1 - p1.mean(axis=0), axis=1)
+            spread = d0 > 1.0
+            scale = float(np.clip(np.median(d1[spread] / d0[spread]), 0.8, 1.25)) if spread.sum() >= 2 else 1.0
+
+            cx, cy = (track.box[0] + track.box[2]) / 2 + dx, (track.box[1] + track.box[3]) / 2 + dy
+            half_w, half_h = (track.box[2] - track.box[0]) * scale / 2, (track.box[3] - track.box[1]) * scale / 2
+            track.box = np.array([cx - half_w, cy - half_h, cx + half_w, cy + half_h], dtype=np.float32)
+            track.points = p1.reshape(-1, 1, 2)
+
+        self._lost_ratio = lost / len(live)
+        return self._output(gray.shape)
+
+    def _output(self, shape) -> List[Dict[str, Any]]:
+        # Only objects seen on (or outside the region of) the last keyframe are reported
+        visible = [t for t in self.tracks if t.missed == 0]
+        if not visible:
+            return []
+        height, width = shape
+        boxes = np.stack([t.box for t in visible])
+        np.clip(boxes[:, 0::2], 0, width - 1, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height - 1, out=boxes[:, 1::2])
+        output = []
+        for track, bbox in zip(visible, boxes.tolist()):
+            detection = {**track.detection, "bbox": bbox, "id": track.id}
+            if detection.get("landmarks"):
+                # Keypoints move with the box between keyframes
+                detection["landmarks"] = _move_points(detection["landmarks"], track.detection["bbox"], bbox)
+            output.append(detection)
+        return output
+
+    def stats(self) -> Dict[str, Any]:
+        frames = self.keyframes + self.tracked_frames
+        return {
+            "tracks": len(self.tracks),
+            "keyframes": self.keyframes,
+            "tracked_frames": self.tracked_frames,
+            "keyframe_rate": (self.keyframes / frames) if frames else 0.0,
+        }
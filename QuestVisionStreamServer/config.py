@@ -1,14 +1,186 @@
 ENABLE_DISPLAY = True      # Set to False for headless mode, avoid showing the image on the screen
+# Debug preview (window and / or MJPEG stream) is drawn on its own thread at
+# most PREVIEW_FPS times per second, never on the inference path. The window
+# is pumped from the event loop and needs it on the main thread (macOS HighGUI);
+# otherwise it is disabled with a log line.
+# PREVIEW_STREAM serves it at http://METRICS_HOST:METRICS_PORT/preview/<session>
+# (/preview/ = newest session), usable on headless machines.
+PREVIEW_FPS = 10
+PREVIEW_STREAM = False
 LOG_INTERVAL = 30         
 
+# Per-detector model input size (width, height). Frames are scaled down and
+# letterboxed to this size in one shared stage and boxes are mapped back to the
+# frame's coordinates. None = feed the detector's native resolution.
+# Smaller sizes trade accuracy for latency, e.g. "florence2": (384, 384).
+DETECTOR_INPUT_SIZES = {
+    "yolo": None,
+    "florence2": None,
+    "owlv2": None,
+    "grounding_dino": None,
+    "body": None,
+}
+LETTERBOX = True           # keep aspect ratio and pad; False stretches to the input size
+
+# Per-detector numeric precision for the transformer detectors:
+#   "fp32" - full precision
+#   "int8" - dynamic int8 quantization of Linear layers (CPU only)
+#   "bf16" - bfloat16 autocast, where the CPU supports it natively
+# Unsupported combinations fall back to fp32. Compare with benchmark_precision.py.
+DETECTOR_PRECISION = {
+    "florence2": "fp32",
+    "owlv2": "fp32",
+    "grounding_dino": "fp32",
+}
+
+# Per-detector inference runtime:
+#   "torch" - PyTorch / ultralytics (default)
+#   "onnx"  - ONNX Runtime on the CPU (yolo, owlv2); the graph is exported from
+#             the PyTorch model on first use and cached in MODEL_CACHE_DIR.
+#             fp32, or int8 via ONNX Runtime quantization (DETECTOR_PRECISION,
+#             e.g. "yolo": "int8")
+# Compare both on your own frames with benchmark_backend.py.
+DETECTOR_BACKEND = {
+    "yolo": "torch",
+    "owlv2": "torch",
+}
+# ONNX Runtime thread pools: intra_op = threads inside one operator (None =
+# WORKER_THREADS in detector worker processes, else one per physical core),
+# inter_op > 1 also runs independent graph branches in parallel
+ONNX_THREADS = {"intra_op": None, "inter_op": 1}
+
+# With several detectors (python server.py --detector yolo body), each runs on
+# every Nth frame of a session and its last output is reused in between.
+# Also settable per run as --detector yolo body:3. Missing = every frame.
+DETECTOR_CADENCE = {
+    "body": 2,
+}
+
+# How frames are processed:
+#   "inline"   - decode, detect and send sequentially on the event loop
+#   "worker"   - detector on a worker thread, frames arriving while it is busy replace each other
+#   "pipeline" - decode / preprocess / infer / publish run concurrently with bounded queues
+EXECUTION_MODE = "pipeline"
+
+# Pipeline mode queue per stage: maxsize and drop_policy ("block", "drop_oldest", "drop_newest")
+PIPELINE_STAGES = {
+    "decode":     {"maxsize": 2, "drop_policy": "drop_oldest"},
+    "preprocess": {"maxsize": 2, "drop_policy": "drop_oldest"},
+    "infer":      {"maxsize": 1, "drop_policy": "drop_oldest"},
+    "publish":    {"maxsize": 4, "drop_policy": "drop_oldest"},
+}
+
 # Image pre-processing settings
 FLIP_VERTICAL = True       
 FLIP_HORIZONTAL = False    
 ROTATE_180 = False         
 
+# Decode frames directly at the active detector's working resolution (e.g. 640 px
+# for YOLO) instead of full stream resolution; boxes and the payload's
+# width/height refer to the decoded frame.
+DECODE_AT_MODEL_SIZE = True
+
+# Video requested from the headset in the SDP answer and the loading / ready
+# message (see stream_negotiation.py): codecs in order of preference and a
+# target size, frame rate and bitrate. max_size None = the active detector's
+# input size, bitrate_kbps None = derived from size and fps. None answers
+# whatever the headset offers.
+STREAM = {
+    "codecs": ["H264", "VP8"],
+    "max_size": None,
+    "fps": 30,
+    "bitrate_kbps": None,
+}
+
+# Cross-session batched inference (yolo, owlv2, grounding_dino).
+# Frames from all connected headsets are grouped into one forward pass of up to
+# MAX_BATCH_SIZE frames, waiting at most BATCH_MAX_WAIT_MS for the batch to fill.
+MAX_BATCH_SIZE = 4         # 1 disables batching
+BATCH_MAX_WAIT_MS = 10
+
+# Number of detector calls that may run at once, shared across headsets by
+# weighted fair queuing. A headset can pass {"weight": 2.0} in its offer to get
+# twice the share of a default session under contention.
+INFERENCE_SLOTS = 1
+
+# Detector worker processes. Above 1, the model is loaded once in each of
+# DETECTOR_WORKERS processes instead of the server process; frames reach them
+# through a shared-memory ring and each frame goes to the least busy worker.
+# Replaces cross-session batching. WORKER_THREADS = torch / BLAS threads per
+# worker (None splits the cores evenly).
+DETECTOR_WORKERS = 1
+WORKER_THREADS = None
+
+# Motion-adaptive inference: each frame is compared (tiny grayscale thumbnail,
+# mean abs difference 0-255) with the last frame the detector actually ran on.
+# Below threshold the previous detections are reused, but never for more than
+# max_stale_frames frames / max_stale_ms in a row. None runs every frame.
+MOTION_GATE = {"threshold": 3.0, "max_stale_frames": 8, "max_stale_ms": 500}
+
+# Box tracking between detector keyframes: the detector runs every
+# keyframe_interval frames (sooner if tracks are lost), boxes are moved with
+# sparse optical flow in between and every detection gets a persistent "id".
+# None runs the detector on every frame that passes MOTION_GATE.
+TRACKER = {"keyframe_interval": 5, "iou_threshold": 0.3, "max_missed": 2}
+
+# Region-of-interest hints: the headset may send {"type": "set_roi",
+# "regions": [[x1, y1, x2, y2], ...], "ttl_ms": 500} (normalized, processed
+# frame, most important first). Until they expire the detector only sees the
+# padded union of the hints that fit in max_area of the frame and boxes are
+# mapped back to the full frame; every full_frame_interval-th inferred frame
+# still covers the whole frame. None ignores hints.
+ROI = {"full_frame_interval": 10, "margin": 0.1, "max_area": 0.6, "default_ttl_ms": 500, "max_ttl_ms": 5000}
+
+# Closed-loop latency control: every interval_s the p95 receive-to-publish
+# latency of the last interval (all sessions) is compared with target_ms.
+# Above it one knob steps down its ladder: fewer detections per frame
+# (max_detections), detector keyframes further apart (keyframe_intervals,
+# needs TRACKER), then a smaller detector input (input_scales, in-process
+# detectors with an input size). Comfortably below target for settle_checks
+# intervals, the last step is undone. Every change is logged and exported on
+# /metrics. None disables it; --latency-target MS enables it per run.
+LATENCY_CONTROL = None
+LATENCY_CONTROL_DEFAULTS = {
+    "target_ms": 80.0,
+    "percentile": 95,
+    "interval_s": 2.0,
+    "headroom": 0.7,
+    "settle_checks": 3,
+    "max_detections": (None, 50, 20),
+    "keyframe_intervals": (5, 8, 12),   # first entry = TRACKER keyframe_interval
+    "input_scales": (1.0, 0.75, 0.5),   # onnx owlv2 exports one graph per size
+}
+
+# Startup: the server accepts connections immediately and the detector loads
+# in the background; headsets get {"type": "loading"} until it is warm, then
+# {"type": "ready"}. WARMUP_RUNS dummy frames at the detector's input size
+# (and one full batch when batching) run before ready.
+WARMUP_RUNS = 2
+# Converted model artifacts (int8 models, exports) are cached here across
+# restarts; None = ~/.cache/questvision
+MODEL_CACHE_DIR = None
+
 # Server settings
 HOST = "0.0.0.0"
 PORT = 3000
 
+# Local metrics endpoint: Prometheus text on /metrics, the same snapshot as
+# JSON on /metrics.json. Bound to localhost; None disables it.
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+
 # STUN server
-STUN_SERVER = "stun:stun.l.google.com:19302" 
\ No newline at end of file
+STUN_SERVER = "stun:stun.l.google.com:19302"
+
+# ICE servers offered to every peer connection, as in the browser's
+# RTCConfiguration: {"urls": [...], "username": ..., "credential": ...}.
+# The server gathers all of its candidates before answering, so every server
+# here (and any that is unreachable) adds to connection setup time.
+ICE_SERVERS = [
+    {"urls": [STUN_SERVER]},
+    {"urls": ["turn:openrelay.metered.ca:443?transport=tcp"],
+     "username": "openrelayproject", "credential": "openrelayproject"},
+]
+# Headset and server on the same network: no STUN / TURN, host candidates
+# only, so the answer goes out without waiting on any server (--lan)
+ICE_LAN_ONLY = False
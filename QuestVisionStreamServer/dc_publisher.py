@@ -0,0 +1,135 @@
+import json
+import time
+from typing import Optional, Callable, Any, Dict, List, Union
+from metrics import LatencyRecorder
+
+Message = Union[str, bytes]
+
+# Data channel backpressure, in bytes buffered but not yet sent by SCTP.
+# Above HIGH_WATERMARK detections are held back (only the newest is kept);
+# they are flushed once the buffer drains to LOW_WATERMARK.
+HIGH_WATERMARK = 64 * 1024
+LOW_WATERMARK = 16 * 1024
+
+
+class ChannelPublisher:
+    """
+    Sends detections over one data channel without letting them queue up
+    behind a slow link.
+
+    While the channel's bufferedAmount is above high_watermark, published
+    payloads are not handed to SCTP; a newer payload replaces the pending one
+    (coalescing), so when the link recovers the headset gets the freshest
+    frame instead of a backlog of stale ones. The pending payload is flushed
+    on the channel's "bufferedamountlow" event (or the next publish once below
+    low_watermark). Payloads are encoded only when actually sent, so stateful
+    encodings (binary deltas) never reference a frame that was dropped.
+
+    Control messages (acks, ready) bypass this and are never dropped.
+    """
+
+    def __init__(self,
+                 channel: Any,
+                 encode: Optional[Callable[[Dict[str, Any]], List[Message]]] = None,
+                 high_watermark: int = HIGH_WATERMARK,
+                 low_watermark: int = LOW_WATERMARK,
+                 latency: Optional[Dict[str, LatencyRecorder]] = None):
+        self.channel = channel
+        self.encode = encode or (lambda payload: [json.dumps(payload)])
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        # Optional "serialize" / "send" recorders (the session's stage histograms)
+        self.latency = latency or {}
+
+        self._pending: Optional[Dict[str, Any]] = None
+        self._pending_since = 0.0
+
+        self.published = 0
+        self.sent = 0
+        self.dropped = 0
+        self.deferred = 0
+        self.bytes_sent = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        try:
+            channel.bufferedAmountLowThreshold = self.low_watermark
+            channel.on("bufferedamountlow", self.flush)
+        except Exception:
+            pass
+
+    @property
+    def is_open(self) -> bool:
+        return self.channel is not None and self.channel.readyState == "open"
+
+    def _buffered(self) -> int:
+        return int(getattr(self.channel, "bufferedAmount", 0) or 0)
+
+    def _write(self, messages: List[Message]):
+        start = time.perf_counter()
+        for message in messages:
+            self.channel.send(message)
+            self.bytes_sent += len(message)
+        self._time("send", start)
+
+    def _encode(self, payload: Dict[str, Any]) -> List[Message]:
+        start = time.perf_counter()
+        messages = self.encode(payload)
+        self._time("serialize", start)
+        return messages
+
+    def _time(self, name: str, start: float):
+        recorder = self.latency.get(name)
+        if recorder is not None:
+            recorder.record((time.perf_counter() - start) * 1000.0)
+
+    def publish(self, payload: Dict[str, Any]):
+        """Sends now if the link keeps up, otherwise keeps only the newest payload."""
+        if not self.is_open:
+            return
+        self.published += 1
+        now = time.perf_counter()
+        if self._pending is not None:
+            # Newer frame supersedes the one still waiting
+            self.dropped += 1
+            self._pending, self._pending_since = payload, now
+            self.flush()
+            return
+        if self._buffered() > self.high_watermark:
+            self.deferred += 1
+            self._pending, self._pending_since = payload, now
+            return
+        self._record_wait(0.0)
+        self._write(self._encode(payload))
+        self.sent += 1
+
+    def flush(self):
+        """Sends the pending payload once the buffer has drained enough."""
+        if self._pending is None or not self.is_open:
+            return
+        if self._buffered() > self.low_watermark:
+            return
+        payload, self._pending = self._pending, None
+        self._record_wait(time.perf_counter() - self._pending_since)
+        self._write(self._encode(payload))
+        self.sent += 1
+
+    def send_control(self, payload: Dict[str, Any]):
+        if self.is_open:
+            self._write([json.dumps(payload)])
+
+    def _record_wait(self, waited: float):
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "published": self.published,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "deferred": self.deferred,
+            "bytes_sent": self.bytes_sent,
+            "buffered": self._buffered() if self.channel is not None else 0,
+            "avg_queue_ms": (self.wait_total / self.sent * 1000.0) if self.sent else 0.0,
+            "max_queue_ms": self.wait_max * 1000.0,
+        }
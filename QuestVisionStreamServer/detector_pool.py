@@ -0,0 +1,368 @@
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Optional, Any, Dict, List, Tuple
+
+# Largest frame (bytes) that travels through shared memory; bigger frames are
+# pickled onto the request queue instead (slower, logged once)
+DEFAULT_SLOT_BYTES = 1920 * 1080 * 3
+
+
+def _worker_main(index: int,
+                 detector_args: Dict[str, Any],
+                 threads: Optional[int],
+                 warmup_runs: int,
+                 shm_name: str,
+                 slot_bytes: int,
+                 requests: "mp.Queue",
+                 results: "mp.Queue"):
+    """
+    Detector worker process: loads the model once, then serves requests
+    (req_id, slot, shape, dtype, state) until it receives None. The frame is
+    read in place from the shared ring slot; slot None means the frame itself
+    was sent in place of the shape. ("forget", session_id) releases what the
+    detector keeps for a closed session.
+    """
+    if threads:
+        # Before torch / BLAS are imported, so their pools start at this size
+        os.environ["OMP_NUM_THREADS"] = str(threads)
+        os.environ["MKL_NUM_THREADS"] = str(threads)
+    try:
+        from detectors import get_detectors
+        from model_loader import warm_up
+        start = time.perf_counter()
+        detector = get_detectors(**detector_args)
+        detector.load()
+        warm_up(detector, warmup_runs)
+        if threads and "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(threads)
+        shm = shared_memory.SharedMemory(name=shm_name)
+    except Exception as e:
+        results.put(("error", index, repr(e)))
+        return
+    results.put(("ready", index, time.perf_counter() - start))
+
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            if request[0] == "forget":
+                try:
+                    detector.forget({"session_id": request[1]})
+                except Exception as e:
+                    print(f"[DetectorPool] Worker {index} failed to forget session {request[1]}: {e!r}")
+                continue
+            req_id, slot, shape, dtype, state = request
+            if slot is None:
+                img = shape
+            else:
+                img = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=slot * slot_bytes)
+            start = time.perf_counter()
+            try:
+                result = detector.detect(img, state=state)
+                results.put(("result", req_id, result, time.perf_counter() - start))
+            except Exception as e:
+                results.put(("failed", req_id, repr(e), time.perf_counter() - start))
+            del img
+    finally:
+        shm.close()
+
+
+class _Pending:
+    __slots__ = ("future", "slot", "worker", "session_id")
+
+    def __init__(self, future: asyncio.Future, slot: Optional[int], worker: int, session_id: Any):
+        self.future = future
+        self.slot = slot
+        self.worker = worker
+        self.session_id = session_id
+
+
+class DetectorPool:
+    """
+    Runs the detector in separate worker processes, each with its own copy of
+    the model, so inference does not share the server's GIL with signaling,
+    RTP and decoding. A drop-in for BatchInferenceEngine: callers await
+    infer(img, session_id, state).
+
+    Frames are copied once into a shared-memory ring (2 slots per worker) and
+    only the slot index and shape go through the worker's request queue;
+    detections come back pickled over a single result queue. Each session
+    sticks to one worker (the alive one with the fewest sessions when it
+    first shows up), so detectors that track a stream see all of its frames;
+    it only moves when that worker dies. When every slot is in use, infer()
+    waits for one to free up.
+
+    detector_args are detectors.get_detectors() arguments. state is a copy of
+    the session's detector state plus its "session_id"; changes a detector
+    makes to it inside a worker are not sent back (detectors that track a
+    stream key on session_id). For that reason a MultiDetector's per-detector
+    cadence is kept here, with cadence (the server process's own, unloaded
+    MultiDetector): only the detectors due on a frame run in the worker, and
+    frames with none due never leave the server process.
+    """
+
+    def __init__(self,
+                 detector_args: Dict[str, Any],
+                 workers: int = 2,
+                 threads_per_worker: Optional[int] = None,
+                 slot_bytes: int = DEFAULT_SLOT_BYTES,
+                 warmup_runs: int = 2,
+                 ready_timeout: float = 600.0,
+                 cadence: Any = None):
+        self.detector_args = detector_args
+        self.cadence = cadence
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.slot_bytes = slot_bytes
+        self.slots = 2 * self.workers
+        self.warmup_runs = warmup_runs
+        self.ready_timeout = ready_timeout
+
+        self.frames = 0
+        self.failed = 0
+        self.pickled = 0
+        self.busy_time = 0.0
+        self.frames_by_session: Dict[Any, int] = {}
+        self.load_seconds: List[float] = []
+
+        # spawn: forked CUDA / OpenMP state is not safe to reuse in the children
+        self._ctx = mp.get_context("spawn")
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._processes: List[mp.Process] = []
+        self._requests: List[Any] = []
+        self._results: Any = None
+        self._alive: List[bool] = []
+        self._in_flight: List[int] = []
+        self._assigned: Dict[Any, int] = {}
+        self._free: Optional[asyncio.Queue] = None
+        self._pending: Dict[int, _Pending] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._running = False
+
+    @property
+    def started(self) -> bool:
+        return self._running
+
+    async def start(self):
+        """Spawns the workers and waits until each has loaded and warmed up its model."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._running:
+                return
+            self._loop = asyncio.get_running_loop()
+            self._shm = shared_memory.SharedMemory(create=True, size=self.slots * self.slot_bytes)
+            self._results = self._ctx.Queue()
+            for index in range(self.workers):
+                requests = self._ctx.Queue()
+                process = self._ctx.Process(
+                    target=_worker_main,
+                    args=(index, self.detector_args, self.threads_per_worker, self.warmup_runs,
+                          self._shm.name, self.slot_bytes, requests, self._results),
+                    name=f"detector-{index}",
+                    daemon=True,
+                )
+                process.start()
+                self._requests.append(requests)
+                self._processes.append(process)
+            print(f"[DetectorPool] Loading {'+'.join(self.detector_args.get('names', []))} in {self.workers} "
+                  f"processes ({self.threads_per_worker} threads each)...")
+            await self._loop.run_in_executor(None, self._wait_ready)
+
+            self._alive = [True] * self.workers
+            self._in_flight = [0] * self.workers
+            self._free = asyncio.Queue()
+            for slot in range(self.slots):
+                self._free.put_nowait(slot)
+            self._running = True
+            self._reader = threading.Thread(target=self._read_results, name="detector-pool-results", daemon=True)
+            self._reader.start()
+            print(f"[DetectorPool] {self.workers} workers ready (load {max(self.load_seconds):.1f}s)")
+
+    def _wait_ready(self):
+        deadline = time.perf_counter() + self.ready_timeout
+        while len(self.load_seconds) < self.workers:
+            try:
+                kind, index, value = self._results.get(timeout=0.5)
+            except queue.Empty:
+                dead = [p.name for p in self._processes if not p.is_alive()]
+                if dead or time.perf_counter() > deadline:
+                    self._terminate()
+                    reason = f"{', '.join(dead)} exited" if dead else f"not ready after {self.ready_timeout:.0f}s"
+                    raise RuntimeError(f"Detector workers failed to start: {reason}")
+                continue
+            if kind == "error":
+                self._terminate()
+                raise RuntimeError(f"Detector worker {index} failed to load: {value}")
+            self.load_seconds.append(value)
+
+    async def infer(self, img: np.ndarray, session_id: Any = None, state: Optional[Dict[str, Any]] = None) -> Any:
+        """Copies one frame into the ring and waits for its detections."""
+        if not self._running:
+            await self.start()
+        if not any(self._alive):
+            raise RuntimeError("No live detector workers left")
+        request_state = {**(state or {}), "session_id": session_id}
+        cache, names = None, None
+        if self.cadence is not None:
+            cache, names = self.cadence.due(state)
+            if not names:
+                return self.cadence.merge(cache, [], [])
+            # The cached detections stay here; the worker only needs which detectors to run
+            request_state.pop("multi", None)
+            request_state["multi_only"] = names
+        slot = await self._free.get()
+        try:
+            # Workers may have died while this frame waited for a slot
+            worker = self._worker_for(session_id)
+        except RuntimeError:
+            self._free.put_nowait(slot)
+            raise
+        req_id = next(self._ids)
+        future = self._loop.create_future()
+
+        if img.nbytes <= self.slot_bytes:
+            view = np.ndarray(img.shape, dtype=img.dtype, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+            np.copyto(view, img)
+            del view
+            request = (req_id, slot, img.shape, img.dtype.str, request_state)
+        else:
+            if not self.pickled:
+                print(f"[DetectorPool] {img.shape} frame exceeds the {self.slot_bytes} byte slot, pickling it")
+            self.pickled += 1
+            self._free.put_nowait(slot)
+            slot = None
+            request = (req_id, None, img, None, request_state)
+
+        self._pending[req_id] = _Pending(future, slot, worker, session_id)
+        self._in_flight[worker] += 1
+        self._requests[worker].put(request)
+        result = await future
+        if cache is not None:
+            return self.cadence.merge(cache, names, result)
+        return result
+
+    def _worker_for(self, session_id: Any) -> int:
+        alive = [i for i, ok in enumerate(self._alive) if ok]
+        if not alive:
+            raise RuntimeError("No live detector workers left")
+        worker = self._assigned.get(session_id)
+        if worker is not None and self._alive[worker]:
+            return worker
+        load = {i: 0 for i in alive}
+        for assigned in self._assigned.values():
+            if assigned in load:
+                load[assigned] += 1
+        worker = min(alive, key=lambda i: (load[i], self._in_flight[i]))
+        if session_id is not None:
+            if session_id in self._assigned:
+                print(f"[DetectorPool] Session {session_id} moved to worker {worker}")
+            self._assigned[session_id] = worker
+        return worker
+
+    def _read_results(self):
+        while self._running:
+            try:
+                message = self._results.get(timeout=0.5)
+            except queue.Empty:
+                self._loop.call_soon_threadsafe(self._check_workers)
+                continue
+            except (EOFError, OSError):
+                break
+            self._loop.call_soon_threadsafe(self._complete, message)
+
+    def _finish(self, req_id: int) -> Optional[_Pending]:
+        pending = self._pending.pop(req_id, None)
+        if pending is None:
+            return None
+        self._in_flight[pending.worker] -= 1
+        if pending.slot is not None:
+            self._free.put_nowait(pending.slot)
+        return pending
+
+    def _complete(self, message: Tuple):
+        kind, req_id, value, elapsed = message
+        pending = self._finish(req_id)
+        if pending is None:
+            return
+        self.busy_time += elapsed
+        if kind == "failed":
+            self.failed += 1
+            print(f"[DetectorPool] Inference failed in worker {pending.worker}: {value}")
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError(value))
+            return
+        self.frames += 1
+        self.frames_by_session[pending.session_id] = self.frames_by_session.get(pending.session_id, 0) + 1
+        if not pending.future.done():
+            pending.future.set_result(value)
+
+    def _check_workers(self):
+        for index, process in enumerate(self._processes):
+            if self._alive[index] and not process.is_alive():
+                self._alive[index] = False
+                print(f"[DetectorPool] Worker {index} exited (code {process.exitcode})")
+                # Its frames will never come back; their slots are safe to reuse
+                for req_id in [r for r, p in self._pending.items() if p.worker == index]:
+                    pending = self._finish(req_id)
+                    if not pending.future.done():
+                        pending.future.set_exception(RuntimeError(f"Detector worker {index} exited"))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": sum(self._alive) if self._alive else 0,
+            "frames": self.frames,
+            "failed": self.failed,
+            "pickled": self.pickled,
+            "in_flight": len(self._pending),
+            "avg_infer_ms": (self.busy_time / self.frames * 1000.0) if self.frames else 0.0,
+        }
+
+    def forget_session(self, session_id: Any):
+        self.frames_by_session.pop(session_id, None)
+        worker = self._assigned.pop(session_id, None)
+        if worker is not None and self._alive[worker]:
+            try:
+                self._requests[worker].put(("forget", session_id))
+            except (OSError, ValueError):
+                pass
+
+    def _terminate(self):
+        for requests in self._requests:
+            try:
+                requests.put(None)
+            except (OSError, ValueError):
+                pass
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        self._processes.clear()
+        self._requests.clear()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    async def stop(self):
+        self._running = False
+        for pending in self._pending.values():
+            if not pending.future.done():
+                pending.future.cancel()
+        self._pending.clear()
+        await asyncio.get_running_loop().run_in_executor(None, self._terminate)
+        if self._reader is not None:
+            self._reader.join(timeout=1.0)
+            self._reader = None
@@ -1,22 +1,82 @@
 # Detectors package with lazy loading
 # Only imports the requested detector when needed
+#
+# Every detector implements detectors.base.Detector: load() / warmup() /
+# detect(img, state) / detect_batch(imgs, states). state is a dict owned by one stream
+# session for anything kept between frames.
 
-def get_detector(detector_name):
-    """Get detector function by name with lazy loading"""
+from .base import Detector
+from .letterbox import LetterboxDetector
+from .multi import MultiDetector
+from .precision import PRECISIONS
+from .onnx_runtime import BACKENDS
+
+DETECTOR_NAMES = ['yolo', 'florence2', 'owlv2', 'grounding_dino', 'body']
+
+def _create_detector(detector_name):
     if detector_name == 'yolo':
-        from .yolo_detector import detect_objects
-        return detect_objects
+        from .yolo_detector import YoloDetector
+        return YoloDetector()
     elif detector_name == 'florence2':
-        from .florence2_detector import detect_objects
-        return detect_objects
+        from .florence2_detector import Florence2Detector
+        return Florence2Detector()
     elif detector_name == 'owlv2':
-        from .owlv2_detector import detect_objects
-        return detect_objects
+        from .owlv2_detector import Owlv2Detector
+        return Owlv2Detector()
     elif detector_name == 'grounding_dino':
-        from .grounding_dino_detector import detect_objects
-        return detect_objects
+        from .grounding_dino_detector import GroundingDinoDetector
+        return GroundingDinoDetector()
     elif detector_name == 'body':
-        from .body_tracker import track_body
-        return track_body
+        from .body_tracker import BodyTracker
+        return BodyTracker()
     else:
         return None
+
+def get_detector(detector_name, input_size=None, letterbox=True, precision="fp32",
+                 backend="torch", onnx_threads=None):
+    """
+    Get an (unloaded) Detector instance by name with lazy loading.
+    With input_size (width, height), frames are scaled down / letterboxed to that
+    size before the detector and boxes are mapped back to the original frame.
+    precision ("fp32", "int8", "bf16") applies to detectors that support it.
+    backend ("torch", "onnx") selects the runtime; onnx_threads = (intra_op, inter_op).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    detector = _create_detector(detector_name)
+    # Backend first: the precisions a detector offers may depend on it
+    if detector is not None and backend != "torch":
+        if backend in detector.backends:
+            detector.backend = backend
+            if onnx_threads is not None:
+                detector.onnx_threads = tuple(onnx_threads)
+        else:
+            print(f"[Detectors] {detector_name} has no {backend} backend, using torch")
+    if detector is not None and precision != "fp32":
+        if precision in detector.precisions:
+            detector.precision = precision
+        else:
+            print(f"[Detectors] {detector_name} does not support {precision}, using fp32")
+    if detector is not None and input_size is not None:
+        detector = LetterboxDetector(detector, input_size, letterbox=letterbox)
+    return detector
+
+def get_detectors(names, input_sizes=None, letterbox=True, precisions=None, every=None,
+                  backends=None, onnx_threads=None):
+    """
+    One detector for a single name, otherwise a MultiDetector running all of
+    them on each frame. input_sizes / precisions / backends are per-name dicts
+    (as in config.py); every[name] = N runs that detector on every Nth frame only.
+    """
+    input_sizes, precisions, backends = input_sizes or {}, precisions or {}, backends or {}
+    detectors = []
+    for name in names:
+        detector = get_detector(name, input_size=input_sizes.get(name), letterbox=letterbox,
+                                precision=precisions.get(name, "fp32"),
+                                backend=backends.get(name, "torch"), onnx_threads=onnx_threads)
+        if detector is None:
+            return None
+        detectors.append(detector)
+    if len(detectors) == 1:
+        return detectors[0]
+    return MultiDetector(detectors, every=every)
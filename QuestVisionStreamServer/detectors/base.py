@@ -0,0 +1,127 @@
+import numpy as np
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+# Detection format shared by every detector and sent to the headset:
+#   { 'label': str, 'conf': float, 'bbox': [x1, y1, x2, y2] }  (pixels, processed frame)
+Detection = Dict[str, Any]
+
+
+class Detector:
+    """
+    Common interface for all detectors.
+
+    - load():   loads the model (heavy; call once, not at import time)
+    - warmup(): runs a few dummy frames so the first real frame is not a cold start
+    - apply_input_size(size): adapt to frames pre-scaled by detectors.letterbox
+    - detect(img, state): detections for one frame in color_order (BGR by default)
+    - detect_batch(imgs, states): one detections list per frame; batched detectors
+      override this with a single forward pass and set supports_batch = True
+    - forget(state): releases what the detector kept in a session's state once
+      that session has ended (in detector worker processes state is only
+      {"session_id": ...}, matching what detect() was given there)
+
+    state is a per-session dict for anything a detector keeps between frames.
+    """
+
+    name = "detector"
+    supports_batch = False
+    # Pixel layout detect() expects, so frames can be decoded straight into it
+    color_order = "bgr"
+    # (width, height) the model works at internally; frames larger than this can
+    # be decoded at reduced size without losing anything. None = native size.
+    input_size: Optional[Tuple[int, int]] = None
+    # Numeric modes this detector can run in (see detectors.precision) and the
+    # one requested; set before load()
+    precisions: Tuple[str, ...] = ("fp32",)
+    precision = "fp32"
+    # Runtimes this detector can run on (see detectors.onnx_runtime), the one
+    # requested and, for "onnx", its (intra_op, inter_op) threads; set before load()
+    backends: Tuple[str, ...] = ("torch",)
+    backend = "torch"
+    onnx_threads: Tuple[Optional[int], Optional[int]] = (None, None)
+
+    def __init__(self):
+        self.loaded = False
+
+    def load(self):
+        if self.loaded:
+            return
+        self._load()
+        self.loaded = True
+
+    def _load(self):
+        raise NotImplementedError
+
+    def apply_input_size(self, size: Tuple[int, int]):
+        """
+        Called when a resize stage in front of this detector feeds it frames of
+        at most size (width, height). Detectors whose own preprocessing would
+        otherwise resample back up to a fixed resolution override this.
+        """
+        pass
+
+    @property
+    def resizable(self) -> bool:
+        """Whether apply_input_size changes the resolution this detector runs at."""
+        return type(self).apply_input_size is not Detector.apply_input_size
+
+    def warmup(self, width: int = 640, height: int = 480, runs: int = 1):
+        self.load()
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        for _ in range(max(0, runs)):
+            self.detect(dummy, state={})
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        raise NotImplementedError
+
+    def forget(self, state: Dict[str, Any]):
+        pass
+
+    def detect_batch(self, imgs: List[np.ndarray],
+                     states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Detection]]:
+        states = states or [None] * len(imgs)
+        return [self.detect(img, state=state) for img, state in zip(imgs, states)]
+
+
+def to_detections(boxes: Any,
+                  scores: Any,
+                  labels: Sequence[str],
+                  width: int,
+                  height: int,
+                  conf_thres: float = 0.0) -> List[Detection]:
+    """
+    Converts model outputs to the detection dict format with whole-array ops:
+    thresholding, clipping to the frame and dropping degenerate boxes happen on
+    the arrays, followed by a single bulk conversion to Python lists.
+
+    boxes: (N, 4) xyxy pixels, scores: (N,), labels: N label strings
+    (torch tensors are accepted and moved to CPU once).
+    """
+    boxes = _as_numpy(boxes).astype(np.float32, copy=False).reshape(-1, 4)
+    scores = _as_numpy(scores).astype(np.float32, copy=False).reshape(-1)
+    if boxes.shape[0] == 0:
+        return []
+
+    np.clip(boxes[:, 0::2], 0, width - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height - 1, out=boxes[:, 1::2])
+
+    keep = (scores >= conf_thres) & (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    idx = np.flatnonzero(keep)
+    if idx.size == 0:
+        return []
+
+    labels = np.asarray(labels, dtype=object)[idx].tolist()
+    return [
+        {"label": label, "conf": conf, "bbox": bbox}
+        for label, conf, bbox in zip(labels, scores[idx].tolist(), boxes[idx].tolist())
+    ]
+
+
+def _as_numpy(x: Any) -> np.ndarray:
+    if hasattr(x, "detach"):
+        x = x.detach().cpu()
+        if x.is_floating_point():
+            # bf16 has no NumPy equivalent
+            x = x.float()
+        x = x.numpy()
+    return np.asarray(x)
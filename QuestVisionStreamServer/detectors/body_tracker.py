@@ -1,36 +1,186 @@
 # body_tracking.py
-import cv2
+import threading
+from collections import OrderedDict
 import numpy as np
-import mediapipe as mp
+from typing import List, Dict, Any, Optional, Tuple
+from .base import Detector, Detection
 
-mp_pose = mp.solutions.pose
-mp_drawing = mp.solutions.drawing_utils
+MODEL_COMPLEXITY = 1            # 0 = lite, 1 = full, 2 = heavy
+MIN_DETECTION_CONFIDENCE = 0.5
+MIN_TRACKING_CONFIDENCE = 0.5
+WORLD_LANDMARKS = False         # also send hip-centered 3D landmarks in meters
+VISIBILITY_THRES = 0.5          # landmarks below this do not count towards the box
+# Crop each frame to the last pose (ROI_CROP), when its mean visibility
+# reached ROI_MIN_VISIBILITY. Cropping replaces MediaPipe's own tracking: the
+# graph then runs in static image mode without landmark smoothing, since its
+# tracking and smoothing assume every frame has the same framing.
+ROI_CROP = True
+ROI_MIN_VISIBILITY = 0.6
+ROI_MARGIN = 0.25               # crop padding, fraction of the pose's width / height
+# Pose graphs kept for sessions whose state arrives as a per-frame copy (detector worker processes)
+MAX_REMOTE_SESSIONS = 8
 
-pose_detector = mp_pose.Pose(
-    static_image_mode=False,
-    model_complexity=1,
-    enable_segmentation=False,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
 
-def track_body(img: np.ndarray, frame=None) -> np.ndarray:
+class BodyTracker(Detector):
     """
-    Detects and draws body landmarks on the input image using MediaPipe Pose.
+    MediaPipe Pose as a detector. Each frame yields at most one detection:
+
+      {"label": "pose", "conf": mean visibility, "bbox": [x1, y1, x2, y2],
+       "landmarks": [[x, y, visibility], ...],          # 33, pixels
+       "world_landmarks": [[x, y, z], ...]}             # 33, meters (world_landmarks=True)
+
+    Every session gets its own Pose graph in its detector state, so MediaPipe's
+    frame-to-frame tracking follows one stream (in detector worker processes,
+    where the state is a per-frame copy, graphs are kept here by session_id
+    instead). When the last pose was confident, the next frame is cropped to
+    it (plus margin) before MediaPipe sees it; a lost or uncertain pose falls
+    back to the whole frame. With roi_crop=False, whole frames go to
+    MediaPipe and its own tracking and smoothing are used instead.
+    Frames arrive as RGB, so nothing is converted or copied beyond the crop.
     """
-    # Convert BGR image to RGB for MediaPipe
-    rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-
-    # Run MediaPipe Pose
-    results = pose_detector.process(rgb)
-
-    if results.pose_landmarks:
-        mp_drawing.draw_landmarks(
-            img,
-            results.pose_landmarks,
-            mp_pose.POSE_CONNECTIONS,
-            mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-            mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2)
+
+    name = "body"
+    color_order = "rgb"
+    # MediaPipe runs its networks at 256 px or less; 640x480 keeps enough
+    # detail for a person at the usual distances
+    input_size = (640, 480)
+
+    def __init__(self,
+                 model_complexity: int = MODEL_COMPLEXITY,
+                 world_landmarks: bool = WORLD_LANDMARKS,
+                 min_detection_confidence: float = MIN_DETECTION_CONFIDENCE,
+                 min_tracking_confidence: float = MIN_TRACKING_CONFIDENCE,
+                 roi_crop: bool = ROI_CROP):
+        super().__init__()
+        self.roi_crop = roi_crop
+        self.model_complexity = model_complexity
+        self.world_landmarks = world_landmarks
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        # For callers without a session state (benchmarks)
+        self._shared_state: Dict[str, Any] = {}
+        self._shared_lock = threading.Lock()
+        self._remote: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self.cropped = 0
+        self.frames = 0
+
+    def _new_pose(self) -> Any:
+        import mediapipe as mp
+        return mp.solutions.pose.Pose(
+            # A moving crop would feed the tracker and smoother mismatched frames
+            static_image_mode=self.roi_crop,
+            smooth_landmarks=not self.roi_crop,
+            model_complexity=self.model_complexity,
+            enable_segmentation=False,
+            min_detection_confidence=self.min_detection_confidence,
+            min_tracking_confidence=self.min_tracking_confidence
         )
 
-    return img
+    def _new_body(self) -> Dict[str, Any]:
+        # The lock keeps forget() from closing the graph while a frame is in it
+        return {"pose": self._new_pose(), "roi": None, "shape": None, "lock": threading.Lock()}
+
+    def _load(self):
+        # MediaPipe is imported and the first Pose graph built on load, not at import time
+        self._shared_state["body"] = self._new_body()
+
+    def warmup(self, width: int = 640, height: int = 480, runs: int = 1):
+        self.load()
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        for _ in range(max(0, runs)):
+            self.detect(dummy)
+
+    def _crop(self, points: np.ndarray, width: int, height: int) -> Tuple[float, float, float, float]:
+        """Padded pose extent, normalized to the image the points were found in."""
+        # All landmarks, visible or not, so limbs the model placed are kept in view
+        x1, y1 = points[:, :2].min(axis=0)
+        x2, y2 = points[:, :2].max(axis=0)
+        pad_x, pad_y = (x2 - x1) * ROI_MARGIN, (y2 - y1) * ROI_MARGIN
+        return (max(0.0, (x1 - pad_x) / width), max(0.0, (y1 - pad_y) / height),
+                min(1.0, (x2 + pad_x) / width), min(1.0, (y2 + pad_y) / height))
+
+    def _body_state(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """This session's Pose graph and crop."""
+        session_id = state.get("session_id")
+        if session_id is None:
+            if "body" not in state:
+                state["body"] = self._new_body()
+            return state["body"]
+        with self._shared_lock:
+            body = self._remote.get(session_id)
+            if body is None:
+                body = self._remote[session_id] = self._new_body()
+                while len(self._remote) > MAX_REMOTE_SESSIONS:
+                    self.forget({"body": self._remote.popitem(last=False)[1]})
+            self._remote.move_to_end(session_id)
+            return body
+
+    def _track(self, img: np.ndarray, state: Dict[str, Any]) -> List[Detection]:
+        body = self._body_state(state)
+        height, width = img.shape[:2]
+        x0, y0, view = 0, 0, img
+        # The crop is normalized to the previous image; a different size or
+        # framing (ROI crops, resized decode) means it no longer points at the pose
+        roi = body["roi"] if body["shape"] == (height, width) else None
+        body["shape"] = (height, width)
+        if roi is not None:
+            x1, y1 = int(roi[0] * width), int(roi[1] * height)
+            x2, y2 = int(np.ceil(roi[2] * width)), int(np.ceil(roi[3] * height))
+            if x2 - x1 >= 32 and y2 - y1 >= 32:
+                x0, y0 = x1, y1
+                # MediaPipe needs a contiguous buffer; the crop is the only copy
+                view = np.ascontiguousarray(img[y1:y2, x1:x2])
+                self.cropped += 1
+        self.frames += 1
+
+        with body["lock"]:
+            if body["pose"] is None:
+                return []
+            results = body["pose"].process(view)
+        if not results.pose_landmarks:
+            body["roi"] = None
+            return []
+
+        view_h, view_w = view.shape[:2]
+        points = np.array([[lm.x, lm.y, lm.visibility] for lm in results.pose_landmarks.landmark], dtype=np.float64)
+        points[:, 0] = points[:, 0] * view_w + x0
+        points[:, 1] = points[:, 1] * view_h + y0
+        conf = float(points[:, 2].mean())
+        if self.roi_crop:
+            body["roi"] = self._crop(points, width, height) if conf >= ROI_MIN_VISIBILITY else None
+
+        visible = points[points[:, 2] >= VISIBILITY_THRES]
+        if not len(visible):
+            visible = points
+        x1, y1 = np.clip(visible[:, :2].min(axis=0), 0, [width - 1, height - 1])
+        x2, y2 = np.clip(visible[:, :2].max(axis=0), 0, [width - 1, height - 1])
+        detection = {
+            "label": "pose",
+            "conf": round(conf, 3),
+            "bbox": [float(x1), float(y1), float(x2), float(y2)],
+            # Rounded: 0.01 px / visibility is plenty and keeps the payload small
+            "landmarks": np.round(points, 2).tolist(),
+        }
+        if self.world_landmarks and results.pose_world_landmarks:
+            world = [[lm.x, lm.y, lm.z] for lm in results.pose_world_landmarks.landmark]
+            detection["world_landmarks"] = np.round(np.asarray(world, dtype=np.float64), 3).tolist()
+        return [detection]
+
+    def forget(self, state: Dict[str, Any]):
+        """Closes the session's Pose graph (and its MediaPipe threads)."""
+        body = state.pop("body", None)
+        if body is None and state.get("session_id") is not None:
+            with self._shared_lock:
+                body = self._remote.pop(state["session_id"], None)
+        if body is None:
+            return
+        with body["lock"]:
+            body["pose"].close()
+            body["pose"] = None
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        self.load()
+        if state is None:
+            with self._shared_lock:
+                return self._track(img, self._shared_state)
+        return self._track(img, state)
@@ -1,42 +1,21 @@
-import torch
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional
 from PIL import Image
-from transformers import AutoProcessor, AutoModelForCausalLM
+from .base import Detector, Detection, to_detections
+from .precision import PRECISIONS, default_device, resolve_precision, load_model, precision_context
+from .model_cache import from_pretrained
 
 MODEL_NAME = "microsoft/Florence-2-base"
 CONF_THRES = 0.30
 DETECTION_PROMPT = "<OD>"
 IGNORE_CLASSES = {"person", "car", "truck", "bus", "motorcycle", "bicycle"}
 
-# Run Florence once every N frames (1 = every frame, 2 = every 2nd frame, etc.)
-FRAME_SKIP = 2
+# None = cuda, then cpu (does not perform well on MPS)
+DEVICE = None
 
-# Optionally downscale before Florence to save compute (None to disable)
-# e.g., DOWNSCALE = (320, 240)
-DOWNSCALE: Optional[Tuple[int, int]] = None
 
-# Does not perform well on MPS
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-print(f"[Florence2] Loading model on {DEVICE}...")
-processor = AutoProcessor.from_pretrained(MODEL_NAME, trust_remote_code=True)
-model = AutoModelForCausalLM.from_pretrained(
-    MODEL_NAME,
-    trust_remote_code=True,
-    torch_dtype=torch.float32,    # use fp16 later if you want more speed
-    attn_implementation="eager",  # avoid SDPA/flash attention checks
-).to(DEVICE)
-model.eval()
-MODEL_DTYPE = next(model.parameters()).dtype
-print("[Florence2] Model loaded! dtype:", MODEL_DTYPE)
-
-# internal counters / cache
-_frame_count = 0
-_last_detections: List[Dict[str, Any]] = []
-
-
-def _move_to_device(batch: Dict[str, Any], device: str, model_dtype: torch.dtype):
+def _move_to_device(batch: Dict[str, Any], device: str, model_dtype: Any):
+    import torch
     out: Dict[str, Any] = {}
     for k, v in batch.items():
         if isinstance(v, torch.Tensor):
@@ -81,95 +60,96 @@ def _parse_od_result(parsed: Any, task: str):
     return [], [], []
 
 
-@torch.inference_mode()
-def detect_objects(img: np.ndarray, frame: Optional[Any] = None):
-    """
-    Backward-compatible: returns (img, detections).
-    - Runs Florence every FRAME_SKIP frames.
-    - On skipped frames, returns last detections.
-    - No drawing (img is returned unmodified).
-    """
-    global _frame_count, _last_detections
-
-    if img is None or img.size == 0:
-        return img, []
-
-    _frame_count += 1
-    run_now = (_frame_count % FRAME_SKIP == 0)
-
-    if not run_now:
-        # skip Florence, return cached detections
-        return img, _last_detections
-
-    # Optionally downscale to speed up Florence
-    orig_h, orig_w = img.shape[:2]
-    pil_image_full = Image.fromarray(img[..., ::-1])  # BGR -> RGB
-    if DOWNSCALE is not None:
-        dw, dh = DOWNSCALE
-        pil_for_model = pil_image_full.resize((dw, dh))
-        scale_w, scale_h = orig_w / dw, orig_h / dh
-    else:
-        pil_for_model = pil_image_full
-        scale_w, scale_h = 1.0, 1.0
-
-    inputs = processor(text=DETECTION_PROMPT, images=pil_for_model, return_tensors="pt")
-    inputs = _move_to_device(inputs, DEVICE, MODEL_DTYPE)
-
-    # keep generation tiny for speed
-    generated_ids = model.generate(
-        **inputs,
-        max_new_tokens=256,      
-        num_beams=1,             # greedy
-        do_sample=False,
-        use_cache=False,         # avoid KV cache issue
-        return_dict_in_generate=False,
-    )
-
-    generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-    # image_size must match what was fed to the model
-    if DOWNSCALE is not None:
-        img_w, img_h = DOWNSCALE
-    else:
-        img_w, img_h = orig_w, orig_h
-
-    parsed_answer = processor.post_process_generation(
-        generated_text,
-        task=DETECTION_PROMPT,
-        image_size=(img_w, img_h),
-    )
-
-    bboxes, labels, scores = _parse_od_result(parsed_answer, DETECTION_PROMPT)
-
-    detections: List[Dict[str, Any]] = []
-    for bbox, label, score in zip(bboxes, labels, scores):
-        score = float(score) if score is not None else 1.0
-        if score < CONF_THRES:
-            continue
-        if label and label.lower() in IGNORE_CLASSES:
-            continue
-
-        x1, y1, x2, y2 = bbox
+class Florence2Detector(Detector):
+    name = "florence2"
+    color_order = "rgb"
+    input_size = (768, 768)   # Florence-2 processor resolution
+    precisions = PRECISIONS
+
+    def __init__(self, model_name: str = MODEL_NAME, device: Optional[str] = DEVICE):
+        super().__init__()
+        self.model_name = model_name
+        self.device = device
+        self.processor = None
+        self.model = None
+        self.model_dtype = None
+
+    def _load(self):
+        import torch
+        from transformers import AutoProcessor, AutoModelForCausalLM
+
+        self.device = self.device or default_device(allow_mps=False)
+        print(f"[Florence2] Loading model on {self.device}...")
+        self.processor = from_pretrained(AutoProcessor, self.model_name, trust_remote_code=True)
+        self.precision = resolve_precision(self.precision, self.device, "Florence2")
+        self.model = load_model(
+            lambda: from_pretrained(
+                AutoModelForCausalLM,
+                self.model_name,
+                trust_remote_code=True,
+                torch_dtype=torch.float32,    # reduced precision via --precision (int8 / bf16)
+                attn_implementation="eager",  # avoid SDPA/flash attention checks
+            ).to(self.device).eval(),
+            self.model_name, self.precision, self.device, "Florence2",
+        )
+        self.model_dtype = next(self.model.parameters()).dtype
+        print(f"[Florence2] Model loaded! dtype: {self.model_dtype}, precision: {self.precision}")
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        # Frames with an unchanged scene never reach here (see motion_gate.MotionGate)
+        if img is None or img.size == 0:
+            return []
+        return self._run(img)
+
+    def _run(self, img: np.ndarray) -> List[Detection]:
+        import torch
+        with torch.inference_mode():
+            return self._generate(img)
+
+    def _generate(self, img: np.ndarray) -> List[Detection]:
+        # Downscaling (DETECTOR_INPUT_SIZES) happens in the shared letterbox stage
+        img_h, img_w = img.shape[:2]
+        pil_image = Image.fromarray(img)  # already RGB
+
+        inputs = self.processor(text=DETECTION_PROMPT, images=pil_image, return_tensors="pt")
+        inputs = _move_to_device(inputs, self.device, self.model_dtype)
+
+        # keep generation tiny for speed
+        with precision_context(self.precision, self.device):
+            generated_ids = self.model.generate(
+                **inputs,
+                max_new_tokens=256,
+                num_beams=1,             # greedy
+                do_sample=False,
+                use_cache=False,         # avoid KV cache issue
+                return_dict_in_generate=False,
+            )
+
+        generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+        # image_size must match what was fed to the model
+        parsed_answer = self.processor.post_process_generation(
+            generated_text,
+            task=DETECTION_PROMPT,
+            image_size=(img_w, img_h),
+        )
+
+        bboxes, labels, scores = _parse_od_result(parsed_answer, DETECTION_PROMPT)
+        n = min(len(bboxes), len(labels), len(scores))
+        if n == 0:
+            return []
+
+        boxes = np.asarray(bboxes[:n], dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray([1.0 if s is None else s for s in scores[:n]], dtype=np.float32)
+        labels = np.asarray([label or "object" for label in labels[:n]], dtype=object)
+
         # If normalized (<=1), convert to pixels in model space
-        if max(x2, y2) <= 1.5:
-            x1, x2 = x1 * img_w, x2 * img_w
-            y1, y2 = y1 * img_h, y2 * img_h
-
-        # Map back to original image scale if downscaled
-        x1, x2 = x1 * scale_w, x2 * scale_w
-        y1, y2 = y1 * scale_h, y2 * scale_h
-
-        x1 = int(max(0, min(round(x1), orig_w - 1)))
-        y1 = int(max(0, min(round(y1), orig_h - 1)))
-        x2 = int(max(0, min(round(x2), orig_w - 1)))
-        y2 = int(max(0, min(round(y2), orig_h - 1)))
-        if x2 <= x1 or y2 <= y1:
-            continue
-
-        detections.append({
-            "label": label or "object",
-            "conf": score,
-            "bbox": [float(x1), float(y1), float(x2), float(y2)],
-        })
-
-    _last_detections = detections
-    return img, detections
+        normalized = np.maximum(boxes[:, 2], boxes[:, 3]) <= 1.5
+        boxes[normalized] *= np.array([img_w, img_h, img_w, img_h], dtype=np.float32)
+
+        # snap to whole pixels
+        np.rint(boxes, out=boxes)
+
+        ignored = np.isin(np.char.lower(labels.astype(str)), list(IGNORE_CLASSES))
+        scores[ignored] = -1.0
+
+        return to_detections(boxes, scores, labels, img_w, img_h, conf_thres=CONF_THRES)
@@ -1,79 +1,153 @@
-import cv2
 import numpy as np
-import torch
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from PIL import Image
-from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+from .base import Detector, Detection, to_detections
+from .precision import PRECISIONS, default_device, resolve_precision, load_model, precision_context
+from .model_cache import from_pretrained
+from .text_cache import TextEmbeddingCache, group_by_queries
 
 MODEL_ID = "IDEA-Research/grounding-dino-tiny"    # try: "IDEA-Research/grounding-dino-base" for higher accuracy
 PROMPT = "glasses"                                # e.g., "glasses", or "person . laptop ."
 CONF_THRES = 0.35                                 # post-process 'threshold'
 TEXT_THRES = 0.25                                 # text alignment threshold
-DEVICE = (
-    "mps" if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available()
-    else ("cuda" if torch.cuda.is_available() else "cpu")
-)
+DEVICE = None                                     # None = mps, then cuda, then cpu
 
-print(f"Loading Grounding DINO ({MODEL_ID}) on {DEVICE}...")
-_processor = AutoProcessor.from_pretrained(MODEL_ID)
-_model = AutoModelForZeroShotObjectDetection.from_pretrained(MODEL_ID).to(DEVICE)
-_model.eval()
-print("Grounding DINO model loaded!")
+def _to_pil(rgb: np.ndarray) -> Image.Image:
+    # Frames arrive already decoded as RGB, no color conversion copy needed
+    return Image.fromarray(rgb)
 
-def _to_pil(bgr: np.ndarray) -> Image.Image:
-    return Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
 
-def detect_objects(img: np.ndarray, frame=None):
+def _cached_text_backbone(backbone: Any, max_entries: int = 8) -> Any:
     """
-    Returns (img_with_drawings, detections)
-    detections: List[ { 'label': str, 'conf': float, 'bbox': [x1,y1,x2,y2] } ]
+    Wraps DINO's BERT text backbone so it runs once per distinct token
+    sequence; later frames with the same prompt reuse the hidden states.
+    Mask and position ids are derived from input_ids, so they are covered by the key.
+    (Defined on first use so importing this module does not import torch.)
     """
-    try:
-        H, W = img.shape[:2]
-        pil = _to_pil(img)
+    import torch
+    from transformers.modeling_outputs import BaseModelOutput
 
-        # DINO expects list-of-list text for batching
-        inputs = _processor(images=pil, text=[[PROMPT]], return_tensors="pt").to(DEVICE)
+    class CachedTextBackbone(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.backbone = backbone
+            self.cache = TextEmbeddingCache(self._encode, max_entries)
 
-        with torch.inference_mode():
-            outputs = _model(**inputs)
+        def _encode(self, key, input_ids, attention_mask=None, **kwargs):
+            return self.backbone(input_ids, attention_mask, **kwargs)[0]
 
-        results = _processor.post_process_grounded_object_detection(
+        def forward(self, input_ids, attention_mask=None, token_type_ids=None, position_ids=None,
+                    return_dict=None, **kwargs):
+            batch = input_ids.shape[0]
+            if batch > 1 and not bool((input_ids == input_ids[:1]).all()):
+                # Mixed prompts in one batch: nothing to share
+                return self.backbone(input_ids, attention_mask, token_type_ids=token_type_ids,
+                                     position_ids=position_ids, return_dict=return_dict, **kwargs)
+
+            def first(t):
+                return t[:1] if t is not None else None
+
+            hidden = self.cache.get(tuple(input_ids[0].tolist()), first(input_ids), first(attention_mask),
+                                    token_type_ids=first(token_type_ids), position_ids=first(position_ids))
+            return BaseModelOutput(last_hidden_state=hidden.expand(batch, -1, -1))
+
+    return CachedTextBackbone()
+
+
+class GroundingDinoDetector(Detector):
+    name = "grounding_dino"
+    supports_batch = True
+    color_order = "rgb"
+    precisions = PRECISIONS
+
+    def __init__(self, model_id: str = MODEL_ID, prompt: str = PROMPT, conf_thres: float = CONF_THRES,
+                 text_thres: float = TEXT_THRES, device: Optional[str] = DEVICE):
+        super().__init__()
+        self.model_id = model_id
+        self.prompt = prompt
+        self.conf_thres = conf_thres
+        self.text_thres = text_thres
+        self.device = device
+        self._processor = None
+        self._model = None
+        # Tokenized prompt per query set; BERT output is cached by _cached_text_backbone
+        self.text_cache = TextEmbeddingCache(self._tokenize)
+        self._text_backbone = None
+        # Image processor size override from apply_input_size, passed per call
+        # (replaced as a whole; frames may be in flight when it changes)
+        self._size: Optional[Dict[str, int]] = None
+
+    def _load(self):
+        from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+
+        self.device = self.device or default_device()
+        print(f"Loading Grounding DINO ({self.model_id}) on {self.device}...")
+        self._processor = from_pretrained(AutoProcessor, self.model_id)
+        self.precision = resolve_precision(self.precision, self.device, "GroundingDINO")
+        self._model = load_model(
+            lambda: from_pretrained(AutoModelForZeroShotObjectDetection, self.model_id).to(self.device).eval(),
+            self.model_id, self.precision, self.device, "GroundingDINO",
+        )
+        self._text_backbone = _cached_text_backbone(self._model.model.text_backbone)
+        self._model.model.text_backbone = self._text_backbone
+        print(f"Grounding DINO model loaded! precision: {self.precision}")
+
+    def apply_input_size(self, size):
+        # DINO takes variable sizes; stop the processor from upsampling back to 800 px
+        self._size = {
+            "shortest_edge": int(min(size)),
+            "longest_edge": int(max(size)),
+        }
+
+    def _tokenize(self, queries: Tuple[str, ...]) -> Dict[str, Any]:
+        # DINO expects list-of-list text; the processor joins labels into "a . b ."
+        text_inputs = self._processor(text=[list(queries)], return_tensors="pt")
+        return {key: value.to(self.device) for key, value in text_inputs.items()}
+
+    def _run(self, imgs: List[np.ndarray], queries: Tuple[str, ...]) -> List[List[Detection]]:
+        pils = [_to_pil(img) for img in imgs]
+        batch = len(imgs)
+        size = self._size
+        inputs = self._processor.image_processor(images=pils, return_tensors="pt",
+                                                 **({"size": size} if size else {})).to(self.device)
+        inputs = dict(inputs)
+        for key, value in self.text_cache.get(queries).items():
+            inputs[key] = value.expand(batch, -1)
+
+        import torch
+        with torch.inference_mode(), precision_context(self.precision, self.device):
+            outputs = self._model(**inputs)
+
+        batch_results = self._processor.post_process_grounded_object_detection(
             outputs=outputs,
             input_ids=inputs["input_ids"],
-            threshold=CONF_THRES,
-            text_threshold=TEXT_THRES,
-            target_sizes=[(H, W)]
-        )[0]
-
-        boxes = results.get("boxes", [])
-        labels = results.get("labels", [])
-        scores = results.get("scores", [])
-
-        detections: List[Dict[str, Any]] = []
-        for (x1, y1, x2, y2), label, score in zip(boxes, labels, scores):
-            # to python ints/floats
-            x1, y1, x2, y2 = map(lambda v: int(v.item() if hasattr(v, "item") else v), (x1, y1, x2, y2))
-            conf = float(score.item() if hasattr(score, "item") else score)
-            text = str(label)
-
-            if x2 <= x1 or y2 <= y1:
-                continue
-
-            # draw
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img, f"{text} {conf:.2f}", (x1, max(0, y1 - 6)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
-
-            detections.append({
-                "label": text,
-                "conf": conf,
-                "bbox": [float(x1), float(y1), float(x2), float(y2)],
-            })
-
-        return img, detections
-
-    except Exception as e:
-        # keep the server alive on occasional model hiccups
-        print(f"[GroundingDINO] detect_objects error: {e}")
-        return img, []
+            threshold=self.conf_thres,
+            text_threshold=self.text_thres,
+            target_sizes=[img.shape[:2] for img in imgs]
+        )
+
+        detections = []
+        for results, img in zip(batch_results, imgs):
+            height, width = img.shape[:2]
+            labels = [str(label) for label in results.get("labels", [])]
+            detections.append(to_detections(results["boxes"], results["scores"], labels, width, height))
+        return detections
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        return self.detect_batch([img], [state])[0]
+
+    def detect_batch(self, imgs: List[np.ndarray],
+                     states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Detection]]:
+        """
+        One forward pass per query set over several frames (possibly from
+        different sessions). Returns one detections list per input image, in input order.
+        """
+        results: List[List[Detection]] = [[] for _ in imgs]
+        for queries, indices in group_by_queries(states or [None] * len(imgs), [self.prompt]).items():
+            try:
+                for i, dets in zip(indices, self._run([imgs[i] for i in indices], queries)):
+                    results[i] = dets
+            except Exception as e:
+                # keep the server alive on occasional model hiccups
+                print(f"[GroundingDINO] detect_batch error: {e}")
+        return results
@@ -0,0 +1,130 @@
+import threading
+import cv2
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from .base import Detector, Detection
+
+PAD_VALUE = 114  # same grey as YOLO's own letterbox
+
+
+class BoxTransform:
+    """Maps boxes from model-input space back to the original frame."""
+
+    __slots__ = ("scale_x", "scale_y", "pad_x", "pad_y", "width", "height")
+
+    def __init__(self, scale_x: float, scale_y: float, pad_x: float, pad_y: float, width: int, height: int):
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+        self.width = width
+        self.height = height
+
+    @property
+    def is_identity(self) -> bool:
+        return self.scale_x == 1.0 and self.scale_y == 1.0 and self.pad_x == 0 and self.pad_y == 0
+
+    def apply(self, detections: List[Detection]) -> List[Detection]:
+        if not detections or not isinstance(detections, list) or self.is_identity:
+            return detections
+        boxes = np.array([det["bbox"] for det in detections], dtype=np.float32)
+        boxes -= np.array([self.pad_x, self.pad_y, self.pad_x, self.pad_y], dtype=np.float32)
+        boxes /= np.array([self.scale_x, self.scale_y, self.scale_x, self.scale_y], dtype=np.float32)
+        np.clip(boxes[:, 0::2], 0, self.width - 1, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, self.height - 1, out=boxes[:, 1::2])
+        # New dicts: detectors may cache and return the same objects on later frames
+        mapped = [{**det, "bbox": bbox} for det, bbox in zip(detections, boxes.tolist())]
+        for det in mapped:
+            if det.get("landmarks"):
+                points = np.array(det["landmarks"], dtype=np.float64)
+                points[:, 0] = (points[:, 0] - self.pad_x) / self.scale_x
+                points[:, 1] = (points[:, 1] - self.pad_y) / self.scale_y
+                det["landmarks"] = np.round(points, 2).tolist()
+        return mapped
+
+
+class LetterboxDetector(Detector):
+    """
+    Resize / letterbox stage in front of any detector.
+
+    Frames larger than input_size are scaled down (aspect kept and padded to
+    exactly input_size when letterbox=True, stretched otherwise), the wrapped
+    detector runs on the small frame, and all boxes are mapped back to the
+    original frame's coordinates here, in one place. Frames that already fit
+    are passed through untouched.
+    """
+
+    def __init__(self, detector: Detector, input_size: Tuple[int, int], letterbox: bool = True):
+        super().__init__()
+        self.detector = detector
+        self.input_size = (int(input_size[0]), int(input_size[1]))
+        self.letterbox = letterbox
+        self.name = detector.name
+        self.supports_batch = detector.supports_batch
+        self.color_order = detector.color_order
+        self.precisions = detector.precisions
+        self.precision = detector.precision
+        self.backends = detector.backends
+        self.backend = detector.backend
+        # Canvases are reused per thread (the scheduler may run several inferences at once)
+        self._local = threading.local()
+
+    def _load(self):
+        self.detector.load()
+        self.detector.apply_input_size(self.input_size)
+
+    @property
+    def resizable(self) -> bool:
+        # Smaller frames help detectors that take them as they are; one that
+        # resamples to a resolution it cannot change would only lose detail
+        detector = self.detector
+        fixed = type(detector).apply_input_size is not Detector.apply_input_size and not detector.resizable
+        return not fixed
+
+    def apply_input_size(self, size: Tuple[int, int]):
+        self.input_size = (int(size[0]), int(size[1]))
+        self.detector.apply_input_size(self.input_size)
+
+    def forget(self, state: Dict[str, Any]):
+        self.detector.forget(state)
+
+    def _canvas(self, index: int, shape: Tuple[int, int, int]) -> np.ndarray:
+        canvases = getattr(self._local, "canvases", None)
+        if canvases is None:
+            canvases = self._local.canvases = []
+        while len(canvases) <= index:
+            canvases.append(None)
+        if canvases[index] is None or canvases[index].shape != shape:
+            canvases[index] = np.empty(shape, dtype=np.uint8)
+        return canvases[index]
+
+    def prepare(self, img: np.ndarray, index: int = 0) -> Tuple[np.ndarray, BoxTransform]:
+        height, width = img.shape[:2]
+        target_w, target_h = self.input_size
+        if width <= target_w and height <= target_h:
+            return img, BoxTransform(1.0, 1.0, 0, 0, width, height)
+
+        if not self.letterbox:
+            canvas = self._canvas(index, (target_h, target_w, img.shape[2]))
+            cv2.resize(img, (target_w, target_h), dst=canvas, interpolation=cv2.INTER_AREA)
+            return canvas, BoxTransform(target_w / width, target_h / height, 0, 0, width, height)
+
+        scale = min(target_w / width, target_h / height)
+        new_w, new_h = max(1, round(width * scale)), max(1, round(height * scale))
+        pad_x, pad_y = (target_w - new_w) // 2, (target_h - new_h) // 2
+        canvas = self._canvas(index, (target_h, target_w, img.shape[2]))
+        canvas.fill(PAD_VALUE)
+        # Resize straight into the canvas interior, no intermediate image
+        cv2.resize(img, (new_w, new_h), dst=canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+                   interpolation=cv2.INTER_AREA)
+        return canvas, BoxTransform(new_w / width, new_h / height, pad_x, pad_y, width, height)
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        model_img, transform = self.prepare(img)
+        return transform.apply(self.detector.detect(model_img, state=state))
+
+    def detect_batch(self, imgs: List[np.ndarray],
+                     states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Detection]]:
+        prepared = [self.prepare(img, i) for i, img in enumerate(imgs)]
+        results = self.detector.detect_batch([model_img for model_img, _ in prepared], states)
+        return [transform.apply(dets) for (_, transform), dets in zip(prepared, results)]
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import time
+from importlib import metadata
+from typing import Any, Callable
+
+# On-disk cache for model artifacts that only depend on the model, the target
+# device and the installed library versions (int8-quantized models, exports),
+# so restarts after the first one skip the conversion. Set
+# QUESTVISION_CACHE_DIR (or MODEL_CACHE_DIR in config.py) to move it; delete
+# the directory to force a rebuild.
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "questvision")
+VERSIONED_PACKAGES = ("torch", "transformers", "ultralytics", "onnxruntime")
+
+
+def cache_dir() -> str:
+    return os.environ.get("QUESTVISION_CACHE_DIR") or DEFAULT_CACHE_DIR
+
+
+def _versions() -> str:
+    parts = []
+    for package in VERSIONED_PACKAGES:
+        try:
+            parts.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            pass
+    return ";".join(parts)
+
+
+def artifact_path(kind: str, *key: Any, suffix: str = ".pt") -> str:
+    """Cache file for kind keyed by key and the library versions (upgrades invalidate it)."""
+    digest = hashlib.sha1("|".join(str(part) for part in key + (_versions(),)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir(), f"{kind}-{digest}{suffix}")
+
+
+def load_or_build(path: str,
+                  build: Callable[[], Any],
+                  save: Callable[[Any, str], None],
+                  load: Callable[[str], Any],
+                  tag: str = "ModelCache") -> Any:
+    """
+    load(path) when the artifact is cached, otherwise build() and save it.
+    An unreadable or unwritable cache only costs the rebuild.
+    """
+    if os.path.exists(path):
+        start = time.perf_counter()
+        try:
+            value = load(path)
+            print(f"[{tag}] Loaded cached {os.path.basename(path)} in {time.perf_counter() - start:.1f}s")
+            return value
+        except Exception as e:
+            print(f"[{tag}] Ignoring unreadable cache {path}: {e}")
+
+    value = build()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        save(value, tmp)
+        # Atomic, so a concurrent worker process never reads a half-written file
+        os.replace(tmp, path)
+        print(f"[{tag}] Cached {os.path.basename(path)}")
+    except Exception as e:
+        print(f"[{tag}] Could not cache {path}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return value
+
+
+def from_pretrained(cls: Any, model_id: str, **kwargs) -> Any:
+    """
+    cls.from_pretrained() from the local Hugging Face cache when the files are
+    there, skipping the hub round trips; downloads only on the first run.
+    """
+    try:
+        return cls.from_pretrained(model_id, local_files_only=True, **kwargs)
+    except (OSError, ValueError):
+        return cls.from_pretrained(model_id, **kwargs)
+
+
+def export_once(path: str, export: Callable[[str], None], tag: str = "ModelCache") -> str:
+    """
+    Returns path, running export(tmp_path) first when it is not cached yet.
+    For artifacts that are files in their own right (ONNX graphs), so unlike
+    load_or_build a failed export is an error rather than a skipped cache.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    root, ext = os.path.splitext(path)
+    # Exporters pick the format from the extension, so it stays last
+    tmp = f"{root}.{os.getpid()}.tmp{ext}"
+    start = time.perf_counter()
+    try:
+        export(tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    print(f"[{tag}] Exported {os.path.basename(path)} in {time.perf_counter() - start:.1f}s")
+    return path
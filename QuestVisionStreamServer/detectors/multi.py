@@ -0,0 +1,137 @@
+import cv2
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from .base import Detector, Detection
+
+
+def _as_detections(name: str, result: Any) -> List[Detection]:
+    """Tags a child's output with its source."""
+    if isinstance(result, list):
+        return [{**det, "source": name} for det in result]
+    return []
+
+
+class MultiDetector(Detector):
+    """
+    Runs several detectors on the same decoded frame, concurrently, and merges
+    their outputs into one detections list where every entry carries a
+    "source" (the detector's name).
+
+    every[name] = N runs that detector on every Nth call for a session and
+    reuses its previous output in between, so a slow or slowly changing
+    detector (pose, open-vocabulary) can run at a lower rate than a fast one.
+    Per-session counters live in the session's detector state. Where that
+    state is only a per-frame copy (detector worker processes), the caller
+    keeps the cadence instead: due() and merge() run in the server process and
+    the copy carries "multi_only", the detectors to run on that frame.
+    """
+
+    name = "multi"
+
+    def __init__(self, detectors: List[Detector], every: Optional[Dict[str, int]] = None):
+        super().__init__()
+        self.detectors = detectors
+        self.every = {d.name: max(1, int((every or {}).get(d.name, 1))) for d in detectors}
+        self.name = "+".join(d.name for d in detectors)
+        self.supports_batch = any(d.supports_batch for d in detectors)
+        # Decode once in the order most detectors want; the rest get one shared conversion
+        orders = [d.color_order for d in detectors]
+        self.color_order = max(orders, key=orders.count)  # ties: the first detector's
+        # Frames may be decoded down to the largest size any detector can use
+        sizes = [d.input_size for d in detectors]
+        self.input_size = None if any(s is None for s in sizes) else \
+            (max(s[0] for s in sizes), max(s[1] for s in sizes))
+        self._base_size = self.input_size
+        self._base_sizes = sizes
+        self.precision = "/".join(sorted({d.precision for d in detectors}))
+        self.backend = "/".join(sorted({d.backend for d in detectors}))
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _load(self):
+        for detector in self.detectors:
+            detector.load()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.detectors), thread_name_prefix="detector")
+
+    def apply_input_size(self, size: Tuple[int, int]):
+        # Scales every child's configured input size by the same factor
+        if self._base_size is None:
+            return
+        scale = min(size[0] / self._base_size[0], size[1] / self._base_size[1])
+        for detector, base in zip(self.detectors, self._base_sizes):
+            detector.apply_input_size((max(32, round(base[0] * scale)), max(32, round(base[1] * scale))))
+        self.input_size = (int(size[0]), int(size[1]))
+
+    @property
+    def resizable(self) -> bool:
+        return self._base_size is not None and any(d.resizable for d in self.detectors)
+
+    def forget(self, state: Dict[str, Any]):
+        for detector in self.detectors:
+            detector.forget(state)
+
+    def warmup(self, width: int = 640, height: int = 480, runs: int = 1):
+        self.load()
+        for detector in self.detectors:
+            detector.warmup(width, height, runs)
+
+    def due(self, state: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[str]]:
+        """Advances the session's per-detector counters; returns its cache and the detectors to run."""
+        if state is not None and "multi_only" in state:
+            # Cadence kept by the caller: run exactly these, cache nothing here
+            return {"calls": 0, "last": {}}, list(state["multi_only"])
+        cache = state.setdefault("multi", {"calls": 0, "last": {}}) if state is not None else {"calls": 0, "last": {}}
+        calls = cache["calls"]
+        cache["calls"] += 1
+        due = [d.name for d in self.detectors
+               if d.name not in cache["last"] or calls % self.every[d.name] == 0]
+        return cache, due
+
+    def merge(self, cache: Dict[str, Any], names: List[str], detections: List[Detection]) -> List[Detection]:
+        """Stores the output of the detectors in names (tagged by source) in cache; returns the merged list."""
+        for name in names:
+            cache["last"][name] = [det for det in detections if det.get("source") == name]
+        return [det for detector in self.detectors for det in cache["last"].get(detector.name, [])]
+
+    def _run(self, detector: Detector, imgs: List[np.ndarray], states: List[Optional[Dict[str, Any]]],
+             converted: Dict[str, List[np.ndarray]]) -> List[Any]:
+        if detector.color_order != self.color_order:
+            imgs = converted[detector.color_order]
+        if detector.supports_batch and len(imgs) > 1:
+            return detector.detect_batch(imgs, states)
+        return [detector.detect(img, state=state) for img, state in zip(imgs, states)]
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        return self.detect_batch([img], [state])[0]
+
+    def detect_batch(self, imgs: List[np.ndarray],
+                     states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Detection]]:
+        self.load()
+        states = states or [None] * len(imgs)
+        due = [self.due(state) for state in states]
+
+        # Frames each detector has to run on this call
+        work = {}
+        for detector in self.detectors:
+            indices = [i for i, (_, names) in enumerate(due) if detector.name in names]
+            if indices:
+                work[detector.name] = (detector, indices)
+
+        converted: Dict[str, List[np.ndarray]] = {}
+        for order in {d.color_order for d, _ in work.values()} - {self.color_order}:
+            # bgr <-> rgb is the same channel swap either way
+            converted[order] = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in imgs]
+
+        futures = {
+            name: self._executor.submit(self._run, detector,
+                                        [imgs[i] for i in indices], [states[i] for i in indices],
+                                        {o: [c[i] for i in indices] for o, c in converted.items()})
+            for name, (detector, indices) in work.items()
+        }
+        for name, future in futures.items():
+            _, indices = work[name]
+            for i, result in zip(indices, future.result()):
+                due[i][0]["last"][name] = _as_detections(name, result)
+
+        return [[det for detector in self.detectors for det in cache["last"].get(detector.name, [])]
+                for cache, _ in due]
@@ -0,0 +1,77 @@
+import os
+from typing import Any, Optional, Tuple
+from .model_cache import artifact_path, export_once
+
+# ONNX Runtime backend for detectors whose per-frame graph exports cleanly
+# (YOLO, the OWLv2 image tower + heads). The graph is exported from the
+# PyTorch model once and cached (see model_cache); inference then runs on
+# ONNX Runtime's CPU provider with graph optimizations and explicit thread
+# pools. onnxruntime is imported inside the functions so the torch backend
+# does not need it installed.
+#
+#   torch - the PyTorch / ultralytics path (default)
+#   onnx  - ONNX Runtime, CPU only; fp32, or int8 via ONNX Runtime's own
+#           dynamic quantization of the exported graph
+BACKENDS = ("torch", "onnx")
+ONNX_PRECISIONS = ("fp32", "int8")
+OPSET = 17
+
+
+def resolve_precision(precision: str, tag: str = "ONNX") -> str:
+    """Precision the ONNX backend will actually run, falling back to fp32."""
+    if precision not in ONNX_PRECISIONS:
+        print(f"[{tag}] {precision} is not available with ONNX Runtime, using fp32")
+        return "fp32"
+    return precision
+
+
+def _intra_op_default() -> int:
+    # Detector worker processes set OMP_NUM_THREADS to their share of the cores;
+    # 0 lets ONNX Runtime use one thread per physical core
+    try:
+        return max(0, int(os.environ.get("OMP_NUM_THREADS", 0)))
+    except ValueError:
+        return 0
+
+
+def create_session(path: str, intra_op: Optional[int] = None, inter_op: Optional[int] = None) -> Any:
+    """
+    CPU InferenceSession for path. intra_op = threads inside one operator
+    (None: OMP_NUM_THREADS if set, else ONNX Runtime's default); inter_op > 1
+    also runs independent branches of the graph in parallel.
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = _intra_op_default() if intra_op is None else max(0, intra_op)
+    if inter_op and inter_op > 1:
+        options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+        options.inter_op_num_threads = inter_op
+    else:
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def quantized(path: str, tag: str = "ONNX") -> str:
+    """int8 copy of the fp32 graph at path (weights int8, activations quantized per run), cached."""
+    def export(tmp: str):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+
+    return export_once(artifact_path("onnx-int8", path, os.path.getmtime(path), suffix=".onnx"), export, tag)
+
+
+def load_session(path: str,
+                 precision: str = "fp32",
+                 threads: Tuple[Optional[int], Optional[int]] = (None, None),
+                 tag: str = "ONNX") -> Any:
+    """Session for the exported fp32 graph at path, quantized first for int8."""
+    if precision == "int8":
+        path = quantized(path, tag)
+    intra_op, inter_op = threads
+    session = create_session(path, intra_op, inter_op)
+    options = session.get_session_options()
+    print(f"[{tag}] ONNX Runtime session ready ({precision}, "
+          f"intra_op {options.intra_op_num_threads or 'auto'}, inter_op {options.inter_op_num_threads or 1})")
+    return session
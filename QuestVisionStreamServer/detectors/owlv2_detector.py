@@ -1,84 +1,235 @@
-import cv2
+import threading
 import numpy as np
-import torch
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from PIL import Image
-from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+from .base import Detector, Detection, to_detections
+from .precision import PRECISIONS, default_device, resolve_precision, load_model, precision_context
+from .model_cache import from_pretrained, artifact_path, export_once
+from .onnx_runtime import BACKENDS, OPSET, load_session, resolve_precision as resolve_onnx_precision
+from .text_cache import TextEmbeddingCache, group_by_queries
 
 MODEL_ID = "google/owlv2-base-patch16-ensemble"    # alt: "google/owlv2-large-patch14"
 TEXT_QUERIES = ["glasses", "scissors", "phone"]    # edit freely
 CONF_THRES = 0.30
-DEVICE = (
-    "mps" if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available()
-    else ("cuda" if torch.cuda.is_available() else "cpu")
-)
+DEVICE = None  # None = mps, then cuda, then cpu
 
-print(f"Loading OWLv2 ({MODEL_ID}) on {DEVICE}...")
-_processor = AutoProcessor.from_pretrained(MODEL_ID)
-_model = AutoModelForZeroShotObjectDetection.from_pretrained(MODEL_ID).to(DEVICE)
-_model.eval()
-print("OWLv2 model loaded!")
+def _to_pil(rgb: np.ndarray) -> Image.Image:
+    # Frames arrive already decoded as RGB, no color conversion copy needed
+    return Image.fromarray(rgb)
 
-def _to_pil(bgr: np.ndarray) -> Image.Image:
-    return Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
 
-def detect_objects(img: np.ndarray, frame=None):
+def _frame_graph(model: Any, interpolate: bool) -> Any:
     """
-    Returns (img_with_drawings, detections)
-    detections: List[ { 'label': str, 'conf': float, 'bbox': [x1,y1,x2,y2] } ]
+    The per-frame part of OWLv2 (image tower, class and box heads) as one
+    module with tensor inputs, for ONNX export; the text tower stays in torch
+    behind the text cache. (Defined on first use so importing this module does
+    not import torch.)
     """
-    try:
-        H, W = img.shape[:2]
-        pil = _to_pil(img)
-
-        # OWLv2 expects list-of-list for text batch
-        inputs = _processor(images=pil, text=[TEXT_QUERIES], return_tensors="pt").to(DEVICE)
-
-        with torch.inference_mode():
-            outputs = _model(**inputs)
-
-        results = _processor.post_process_object_detection(
+    import torch
+
+    class Owlv2FrameGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+            self.kwargs = {"interpolate_pos_encoding": True} if interpolate else {}
+
+        def forward(self, pixel_values, query_embeds, query_mask):
+            feature_map = self.model.image_embedder(pixel_values=pixel_values, **self.kwargs)[0]
+            batch, grid_h, grid_w, dim = feature_map.shape
+            image_feats = feature_map.reshape(batch, grid_h * grid_w, dim)
+            logits = self.model.class_predictor(image_feats, query_embeds, query_mask)[0]
+            pred_boxes = self.model.box_predictor(image_feats, feature_map, **self.kwargs)
+            return logits, pred_boxes
+
+    return Owlv2FrameGraph().eval()
+
+
+class Owlv2Detector(Detector):
+    name = "owlv2"
+    supports_batch = True
+    color_order = "rgb"
+    input_size = (960, 960)   # OWLv2 base processor resolution
+    precisions = PRECISIONS
+    backends = BACKENDS
+
+    def __init__(self, model_id: str = MODEL_ID, text_queries: Optional[List[str]] = None,
+                 conf_thres: float = CONF_THRES, device: Optional[str] = DEVICE):
+        super().__init__()
+        self.model_id = model_id
+        self.text_queries = list(text_queries or TEXT_QUERIES)
+        self.conf_thres = conf_thres
+        self.device = device
+        self._processor = None
+        self._model = None
+        self._native_side = 960
+        # (side, interpolate_pos_encoding) frames are preprocessed and run at.
+        # apply_input_size may run while frames are in flight, so it replaces
+        # the pair as a whole and every _run reads it once.
+        self._input = (960, False)
+        # Text tower output per query set; frames only run the image tower + heads
+        self.text_cache = TextEmbeddingCache(self._encode_queries)
+        # ONNX backend: (side, session), created on first use at a given side
+        self._session: Optional[Tuple[int, Any]] = None
+        self._session_lock = threading.Lock()
+
+    def _load(self):
+        from transformers import AutoProcessor, AutoModelForZeroShotObjectDetection
+
+        # ONNX Runtime runs on the CPU provider only
+        self.device = "cpu" if self.backend == "onnx" else (self.device or default_device())
+        print(f"Loading OWLv2 ({self.model_id}) on {self.device}...")
+        self._processor = from_pretrained(AutoProcessor, self.model_id)
+        if self.backend == "onnx":
+            # The precision applies to the exported graph; the text tower and
+            # the export itself use the fp32 model
+            self.precision = resolve_onnx_precision(self.precision, "OWLv2")
+            self._model = from_pretrained(AutoModelForZeroShotObjectDetection, self.model_id).eval()
+        else:
+            self.precision = resolve_precision(self.precision, self.device, "OWLv2")
+            self._model = load_model(
+                lambda: from_pretrained(AutoModelForZeroShotObjectDetection, self.model_id).to(self.device).eval(),
+                self.model_id, self.precision, self.device, "OWLv2",
+            )
+        self._native_side = int(self._processor.image_processor.size["height"])
+        self._input = (self._native_side, False)
+        print(f"OWLv2 model loaded! precision: {self.precision}, backend: {self.backend}")
+
+    @property
+    def resizable(self) -> bool:
+        # An ONNX graph has its side baked in: every resize would re-export or
+        # reload the session, so the latency controller leaves the size alone
+        return self.backend != "onnx"
+
+    def apply_input_size(self, size):
+        # OWLv2 pads to a square and runs at a fixed resolution
+        side = int(max(size))
+        self._input = (side, side != self._native_side)
+
+    def _export_onnx(self, side: int, path: str):
+        import torch
+        query_embeds, query_mask = self._encode_queries(tuple(self.text_queries))
+        # no_grad rather than inference_mode: the tracer cannot record inference tensors
+        with torch.no_grad():
+            torch.onnx.export(
+                _frame_graph(self._model, side != self._native_side),
+                (torch.zeros(1, 3, side, side), query_embeds.clone(), query_mask.clone()),
+                path,
+                input_names=["pixel_values", "query_embeds", "query_mask"],
+                output_names=["logits", "pred_boxes"],
+                # Batch and query count vary per call; the side is baked into the graph
+                dynamic_axes={
+                    "pixel_values": {0: "batch"},
+                    "query_embeds": {0: "batch", 1: "queries"},
+                    "query_mask": {0: "batch", 1: "queries"},
+                    "logits": {0: "batch", 2: "queries"},
+                    "pred_boxes": {0: "batch"},
+                },
+                opset_version=OPSET,
+            )
+
+    def _onnx_session(self, side: int) -> Any:
+        with self._session_lock:
+            if self._session is None or self._session[0] != side:
+                path = export_once(artifact_path("owlv2", self.model_id, side, suffix=".onnx"),
+                                   lambda tmp: self._export_onnx(side, tmp), "OWLv2")
+                self._session = (side, load_session(path, self.precision, self.onnx_threads, "OWLv2"))
+            return self._session[1]
+
+    def _pixel_values(self, imgs: List[np.ndarray], side: int, return_tensors: str) -> Any:
+        # Size per call: the shared image processor's own size is never changed
+        return self._processor.image_processor(images=[_to_pil(img) for img in imgs],
+                                               size={"height": side, "width": side},
+                                               return_tensors=return_tensors)["pixel_values"]
+
+    def _encode_queries(self, queries: Tuple[str, ...]):
+        """(query_embeds (1, Q, D), query_mask (1, Q)) for one query set."""
+        import torch
+        text_inputs = self._processor(text=[list(queries)], return_tensors="pt").to(self.device)
+        with torch.inference_mode(), precision_context(self.precision, self.device):
+            embeds = self._model.owlv2.get_text_features(
+                input_ids=text_inputs["input_ids"], attention_mask=text_inputs["attention_mask"]
+            )
+            # Same normalization the full forward applies to its text embeddings
+            embeds = embeds / torch.linalg.norm(embeds, ord=2, dim=-1, keepdim=True)
+        query_mask = (text_inputs["input_ids"][:, 0] > 0).unsqueeze(0)
+        return embeds.unsqueeze(0), query_mask
+
+    def _to_detections(self, results: Dict[str, Any], img: np.ndarray, queries: Tuple[str, ...]) -> List[Detection]:
+        height, width = img.shape[:2]
+        labels = results.get("labels")
+        if labels is None or len(labels) == 0:
+            return []
+        idx = labels.cpu().numpy().astype(np.int64)
+        names = np.asarray(queries, dtype=object)
+        return to_detections(results["boxes"], results["scores"],
+                             names[np.clip(idx, 0, len(names) - 1)], width, height)
+
+    def _forward_torch(self, imgs: List[np.ndarray], query_embeds: Any, query_mask: Any,
+                       side: int, interpolate_pos_encoding: bool) -> Tuple[Any, Any]:
+        import torch
+        pixel_values = self._pixel_values(imgs, side, "pt").to(self.device)
+        batch = len(imgs)
+        # Patch grid differs from the 960 px it was trained at
+        interpolate = {"interpolate_pos_encoding": True} if interpolate_pos_encoding else {}
+
+        with torch.inference_mode(), precision_context(self.precision, self.device):
+            feature_map = self._model.image_embedder(pixel_values=pixel_values, **interpolate)[0]
+            _, grid_h, grid_w, dim = feature_map.shape
+            image_feats = feature_map.reshape(batch, grid_h * grid_w, dim)
+            logits = self._model.class_predictor(
+                image_feats,
+                query_embeds.expand(batch, -1, -1),
+                query_mask.expand(batch, -1),
+            )[0]
+            pred_boxes = self._model.box_predictor(image_feats, feature_map, **interpolate)
+        return logits, pred_boxes
+
+    def _forward_onnx(self, imgs: List[np.ndarray], query_embeds: Any, query_mask: Any,
+                      side: int, interpolate_pos_encoding: bool) -> Tuple[Any, Any]:
+        import torch
+        # The session's graph has the interpolation for its side baked in
+        session = self._onnx_session(side)
+        batch = len(imgs)
+        pixel_values = self._pixel_values(imgs, side, "np")
+        query_embeds, query_mask = query_embeds.cpu().numpy(), query_mask.cpu().numpy()
+        logits, pred_boxes = session.run(None, {
+            "pixel_values": pixel_values.astype(np.float32, copy=False),
+            "query_embeds": np.ascontiguousarray(np.broadcast_to(query_embeds, (batch,) + query_embeds.shape[1:])),
+            "query_mask": np.ascontiguousarray(np.broadcast_to(query_mask, (batch,) + query_mask.shape[1:])),
+        })
+        # Post-processing below is shared with the torch path
+        return torch.from_numpy(logits), torch.from_numpy(pred_boxes)
+
+    def _run(self, imgs: List[np.ndarray], queries: Tuple[str, ...]) -> List[List[Detection]]:
+        from transformers.models.owlv2.modeling_owlv2 import Owlv2ObjectDetectionOutput
+
+        query_embeds, query_mask = self.text_cache.get(queries)
+        forward = self._forward_onnx if self.backend == "onnx" else self._forward_torch
+        side, interpolate_pos_encoding = self._input
+        logits, pred_boxes = forward(imgs, query_embeds, query_mask, side, interpolate_pos_encoding)
+
+        outputs = Owlv2ObjectDetectionOutput(logits=logits, pred_boxes=pred_boxes)
+        batch_results = self._processor.post_process_object_detection(
             outputs=outputs,
-            target_sizes=[(H, W)],
-            threshold=CONF_THRES
-        )[0]
-
-        boxes = results.get("boxes", [])
-        scores = results.get("scores", [])
-        labels = results.get("labels", [])
-
-        # move to CPU lists if needed
-        if hasattr(boxes, "cpu"):
-            boxes = boxes.cpu()
-        if hasattr(scores, "cpu"):
-            scores = scores.cpu()
-        if hasattr(labels, "cpu"):
-            labels = labels.cpu()
-
-        detections: List[Dict[str, Any]] = []
-        for box, score, lab in zip(boxes, scores, labels):
-            x1, y1, x2, y2 = [int(v) for v in (box.tolist() if hasattr(box, "tolist") else box)]
-            conf = float(score.item() if hasattr(score, "item") else score)
-            idx = int(lab.item() if hasattr(lab, "item") else lab)
-            text = TEXT_QUERIES[idx] if 0 <= idx < len(TEXT_QUERIES) else str(idx)
-
-
-            if x2 <= x1 or y2 <= y1:
-                continue
-
-            # draw
-            cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            cv2.putText(img, f"{text} {conf:.2f}", (x1, max(0, y1 - 6)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
-
-            detections.append({
-                "label": text,
-                "conf": conf,
-                "bbox": [float(x1), float(y1), float(x2), float(y2)],
-            })
-
-        return img, detections
-
-    except Exception as e:
-        print(f"[OWLv2] detect_objects error: {e}")
-        return img, []
+            target_sizes=[img.shape[:2] for img in imgs],
+            threshold=self.conf_thres
+        )
+        return [self._to_detections(results, img, queries) for results, img in zip(batch_results, imgs)]
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        return self.detect_batch([img], [state])[0]
+
+    def detect_batch(self, imgs: List[np.ndarray],
+                     states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Detection]]:
+        """
+        One forward pass per query set over several frames (possibly from
+        different sessions). Returns one detections list per input image, in input order.
+        """
+        results: List[List[Detection]] = [[] for _ in imgs]
+        for queries, indices in group_by_queries(states or [None] * len(imgs), self.text_queries).items():
+            try:
+                for i, dets in zip(indices, self._run([imgs[i] for i in indices], queries)):
+                    results[i] = dets
+            except Exception as e:
+                print(f"[OWLv2] detect_batch error: {e}")
+        return results
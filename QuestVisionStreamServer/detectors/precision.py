@@ -0,0 +1,79 @@
+import contextlib
+
+# torch is imported inside the functions so the package can list PRECISIONS
+# without pulling it in (the body tracker does not need it, and the server
+# starts accepting connections before the detectors import it)
+
+# Numeric modes the transformer detectors can run in:
+#   fp32 - full precision (default)
+#   int8 - dynamic int8 quantization of every nn.Linear (CPU only); weights are
+#          stored as int8, activations quantized on the fly per batch
+#   bf16 - bfloat16 autocast (CPUs with native bf16, e.g. AVX512-BF16 / AMX, or CUDA)
+PRECISIONS = ("fp32", "int8", "bf16")
+
+
+def default_device(allow_mps: bool = True) -> str:
+    """Best available torch device: "mps" (if allowed), then "cuda", then "cpu"."""
+    import torch
+    if allow_mps and getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
+        return "mps"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def bf16_supported(device: str) -> bool:
+    import torch
+    if device == "cuda":
+        return torch.cuda.is_available() and torch.cuda.is_bf16_supported()
+    if device != "cpu":
+        return False
+    # Without native instructions bf16 is emulated and slower than fp32
+    probe = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    amx = getattr(torch.cpu, "_is_amx_tile_supported", None)
+    return bool((probe and probe()) or (amx and amx()))
+
+
+def resolve_precision(precision: str, device: str, tag: str = "Precision") -> str:
+    """Returns the precision that will actually be used on device, falling back to fp32."""
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if precision == "int8" and device != "cpu":
+        print(f"[{tag}] int8 dynamic quantization is CPU-only, using fp32 on {device}")
+        return "fp32"
+    if precision == "bf16" and not bf16_supported(device):
+        print(f"[{tag}] bf16 is not natively supported on this {device}, using fp32")
+        return "fp32"
+    return precision
+
+
+def apply_precision(model, precision: str):
+    """Prepares a loaded model for precision (int8 swaps in quantized Linear layers)."""
+    if precision == "int8":
+        import torch
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def precision_context(precision: str, device: str):
+    """Context to run a forward pass in; bf16 autocasts matmuls, weights stay fp32."""
+    if precision == "bf16":
+        import torch
+        return torch.autocast(device_type=device, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
+
+def load_model(build, model_id: str, precision: str, device: str, tag: str = "Precision"):
+    """
+    build() -> fp32 model in eval mode on device, then prepared for precision.
+    int8 models are cached on disk after the first quantization (see model_cache).
+    """
+    if precision != "int8":
+        return apply_precision(build(), precision)
+    import torch
+    from .model_cache import artifact_path, load_or_build
+    return load_or_build(
+        artifact_path("int8", model_id, device),
+        lambda: apply_precision(build(), precision),
+        save=torch.save,
+        load=lambda path: torch.load(path, map_location=device, weights_only=False),
+        tag=tag,
+    )
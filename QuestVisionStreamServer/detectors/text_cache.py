@@ -0,0 +1,77 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Upper bound on queries a headset may set at runtime
+MAX_QUERIES = 32
+
+
+class TextEmbeddingCache:
+    """
+    LRU cache of text-tower outputs keyed by the exact query set (or token ids).
+    The text side of open-vocabulary detectors does not change between frames,
+    so it is encoded once per query set; a changed query set is simply a new
+    key (older sets age out), which keeps invalidation trivially correct.
+    """
+
+    def __init__(self, compute: Callable[..., Any], max_entries: int = 8):
+        self.compute = compute
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, *args) -> Any:
+        """Cached entry for key, computing it as compute(key, *args) on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        # Encode outside the lock; a racing duplicate encode is harmless
+        entry = self.compute(key, *args)
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def normalize_queries(queries: Any) -> Optional[Tuple[str, ...]]:
+    """Validates queries sent by a headset; returns None if they are unusable."""
+    if isinstance(queries, str):
+        queries = [queries]
+    if not isinstance(queries, (list, tuple)):
+        return None
+    cleaned = [q.strip() for q in queries if isinstance(q, str) and q.strip()]
+    if not cleaned or len(cleaned) > MAX_QUERIES:
+        return None
+    return tuple(cleaned)
+
+
+def session_queries(state: Optional[Dict[str, Any]], default: Sequence[str]) -> Tuple[str, ...]:
+    """Queries set by the session over the data channel, or the detector's defaults."""
+    if state:
+        queries = state.get("queries")
+        if queries:
+            return tuple(queries)
+    return tuple(default)
+
+
+def group_by_queries(states: List[Optional[Dict[str, Any]]], default: Sequence[str]) -> "OrderedDict[Tuple[str, ...], List[int]]":
+    """Indices of a batch grouped by query set, so each group shares one text embedding."""
+    groups: "OrderedDict[Tuple[str, ...], List[int]]" = OrderedDict()
+    for i, state in enumerate(states):
+        groups.setdefault(session_queries(state, default), []).append(i)
+    return groups
@@ -1,46 +1,162 @@
+import ast
+import os
+import shutil
 import cv2
 import numpy as np
-import torch
-from ultralytics import YOLO
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from .base import Detector, Detection, to_detections
+from .letterbox import PAD_VALUE
+from .model_cache import artifact_path, export_once
+from .onnx_runtime import BACKENDS, ONNX_PRECISIONS, load_session, resolve_precision
+from .precision import default_device
 
 MODEL_PATH = "models/yolo11n.pt"
 CONF_THRES = 0.6
-DEVICE = (
-    "mps" if torch.backends.mps.is_available() else
-    ("cuda" if torch.cuda.is_available() else "cpu")
-)
-
-print(f"Loading YOLO model on {DEVICE}...")
-model = YOLO(MODEL_PATH)
-print("YOLO model loaded!")
+DEVICE = None  # None = mps, then cuda, then cpu
+# ONNX backend post-processing, same defaults as ultralytics' predict
+NMS_IOU = 0.7
+MAX_DET = 300
+STRIDE = 32
 
 IGNORE_CLASSES = {"person", "car", "truck", "bus", "motorcycle", "bicycle"}
 
-def detect_objects(img: np.ndarray, frame=None):
-    results = model(img, conf=CONF_THRES, device=DEVICE, verbose=False)[0]
-
-    detections: List[Dict[str, Any]] = []
-    if results.boxes is not None:
-        for box in results.boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            cls_id = int(box.cls[0]) if box.cls is not None else -1
-            conf = float(box.conf[0]) if box.conf is not None else 0.0
-            label = results.names[cls_id] if cls_id >= 0 else "object"
-
-            # Filter out ignored classes
-            if label in IGNORE_CLASSES:
-                continue
-
-            # Draw for debug window
-            cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-            cv2.putText(img, f"{label} {conf:.2f}", (int(x1), int(y1) - 6),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
-
-            detections.append({
-                "label": label,
-                "conf": conf,
-                "bbox": [float(x1), float(y1), float(x2), float(y2)],
-            })
-
-    return img, detections
\ No newline at end of file
+
+class YoloDetector(Detector):
+    name = "yolo"
+    supports_batch = True
+    input_size = (640, 640)   # ultralytics default imgsz
+    backends = BACKENDS
+
+    @property
+    def precisions(self) -> Tuple[str, ...]:
+        # ultralytics runs fp32; int8 comes from quantizing the ONNX export
+        return ONNX_PRECISIONS if self.backend == "onnx" else ("fp32",)
+
+    def __init__(self, model_path: str = MODEL_PATH, conf_thres: float = CONF_THRES, device: Optional[str] = DEVICE):
+        super().__init__()
+        self.model_path = model_path
+        self.conf_thres = conf_thres
+        self.device = device
+        self.model = None
+        self.names: np.ndarray = np.empty(0, dtype=object)
+        self.classes: Optional[List[int]] = None
+        self.imgsz = max(self.input_size)
+        self._session = None
+        self._allowed: np.ndarray = np.empty(0, dtype=bool)
+
+    def _load(self):
+        if self.backend == "onnx":
+            self._load_onnx()
+            return
+        from ultralytics import YOLO
+
+        self.device = self.device or default_device()
+        print(f"Loading YOLO model on {self.device}...")
+        self.model = YOLO(self.model_path)
+        names = self.model.names
+        # Index -> label lookup table for vectorized label mapping
+        self.names = np.array([names[i] for i in range(len(names))], dtype=object)
+        # Ignored classes are filtered inside NMS instead of per box afterwards
+        self.classes = [i for i, label in enumerate(self.names) if label not in IGNORE_CLASSES]
+        print("YOLO model loaded!")
+
+    def _export_onnx(self, path: str):
+        from ultralytics import YOLO
+        # Dynamic batch and spatial axes, so one graph serves every imgsz
+        exported = YOLO(self.model_path).export(format="onnx", imgsz=self.imgsz, dynamic=True)
+        shutil.move(exported, path)
+
+    def _load_onnx(self):
+        mtime = os.path.getmtime(self.model_path) if os.path.exists(self.model_path) else 0
+        path = export_once(artifact_path("yolo", os.path.abspath(self.model_path), mtime, suffix=".onnx"),
+                           self._export_onnx, "YOLO")
+        self.device = "cpu"
+        self.precision = resolve_precision(self.precision, "YOLO")
+        self._session = load_session(path, self.precision, self.onnx_threads, "YOLO")
+        # ultralytics stores the class names in the graph's metadata
+        names = ast.literal_eval(self._session.get_modelmeta().custom_metadata_map["names"])
+        self.names = np.array([names[i] for i in range(len(names))], dtype=object)
+        self._allowed = np.array([label not in IGNORE_CLASSES for label in self.names], dtype=bool)
+        self.classes = np.flatnonzero(self._allowed).tolist()
+        print(f"YOLO model loaded! precision: {self.precision}, backend: onnx")
+
+    def apply_input_size(self, size):
+        # Network input is square with stride 32
+        self.imgsz = max(32, (max(size) + 31) // 32 * 32)
+
+    def _predict(self, source):
+        return self.model(source, imgsz=self.imgsz, conf=self.conf_thres, classes=self.classes,
+                          device=self.device, verbose=False)
+
+    def _to_detections(self, results, img: np.ndarray) -> List[Detection]:
+        boxes = results.boxes
+        if boxes is None or len(boxes) == 0:
+            return []
+        height, width = img.shape[:2]
+        cls_ids = boxes.cls.cpu().numpy().astype(np.int64)
+        return to_detections(boxes.xyxy, boxes.conf, self.names[cls_ids], width, height)
+
+    def _prepare_onnx(self, imgs: List[np.ndarray]) -> Tuple[np.ndarray, List[Tuple[float, int, int]]]:
+        """
+        Letterboxes the frames the way ultralytics does (fit in imgsz, centered
+        grey padding up to the stride) onto one shared canvas size; returns the
+        NCHW RGB 0-1 batch and each frame's (scale, pad_x, pad_y).
+        """
+        scales = [min(self.imgsz / img.shape[0], self.imgsz / img.shape[1]) for img in imgs]
+        sizes = [(max(1, round(img.shape[1] * r)), max(1, round(img.shape[0] * r))) for img, r in zip(imgs, scales)]
+        canvas_w = -(-max(w for w, _ in sizes) // STRIDE) * STRIDE
+        canvas_h = -(-max(h for _, h in sizes) // STRIDE) * STRIDE
+        canvas = np.full((len(imgs), canvas_h, canvas_w, 3), PAD_VALUE, dtype=np.uint8)
+        transforms = []
+        for i, (img, (w, h), scale) in enumerate(zip(imgs, sizes, scales)):
+            pad_x, pad_y = (canvas_w - w) // 2, (canvas_h - h) // 2
+            cv2.resize(img, (w, h), dst=canvas[i, pad_y:pad_y + h, pad_x:pad_x + w], interpolation=cv2.INTER_LINEAR)
+            transforms.append((scale, pad_x, pad_y))
+        # BGR -> RGB and HWC -> CHW in the one copy to float
+        batch = np.ascontiguousarray(canvas[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+        batch *= 1.0 / 255.0
+        return batch, transforms
+
+    def _onnx_to_detections(self, pred: np.ndarray, transform: Tuple[float, int, int],
+                            img: np.ndarray) -> List[Detection]:
+        """pred: (4 + classes, anchors) rows cx, cy, w, h, class scores -> class-aware NMS."""
+        scores = pred[4:]
+        cls_ids = scores.argmax(axis=0)
+        conf = scores[cls_ids, np.arange(scores.shape[1])]
+        keep = (conf >= self.conf_thres) & self._allowed[cls_ids]
+        if not keep.any():
+            return []
+        cx, cy, w, h = pred[:4, keep]
+        conf, cls_ids = conf[keep], cls_ids[keep]
+        boxes = np.stack([cx - w / 2, cy - h / 2, w, h], axis=1)
+        idx = np.asarray(cv2.dnn.NMSBoxesBatched(boxes, conf, cls_ids.astype(np.int32), self.conf_thres, NMS_IOU),
+                         dtype=np.int64).reshape(-1)[:MAX_DET]
+
+        scale, pad_x, pad_y = transform
+        xyxy = boxes[idx].copy()
+        xyxy[:, 2:] += xyxy[:, :2]
+        xyxy -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=np.float32)
+        xyxy /= scale
+        height, width = img.shape[:2]
+        return to_detections(xyxy, conf[idx], self.names[cls_ids[idx]], width, height)
+
+    def _detect_onnx(self, imgs: List[np.ndarray]) -> List[List[Detection]]:
+        batch, transforms = self._prepare_onnx(imgs)
+        preds = self._session.run(None, {self._session.get_inputs()[0].name: batch})[0]
+        return [self._onnx_to_detections(pred, transform, img) for pred, transform, img in zip(preds, transforms, imgs)]
+
+    def detect(self, img: np.ndarray, state: Optional[Dict[str, Any]] = None) -> List[Detection]:
+        if self._session is not None:
+            return self._detect_onnx([img])[0]
+        return self._to_detections(self._predict(img)[0], img)
+
+    def detect_batch(self, imgs: List[np.ndarray],
+                     states: Optional[List[Optional[Dict[str, Any]]]] = None) -> List[List[Detection]]:
+        """
+        One forward pass over several frames (possibly from different sessions).
+        Returns one detections list per input image, in input order.
+        """
+        if self._session is not None:
+            return self._detect_onnx(imgs)
+        batch_results = self._predict(imgs)
+        return [self._to_detections(results, img) for results, img in zip(batch_results, imgs)]
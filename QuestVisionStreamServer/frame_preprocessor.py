@@ -0,0 +1,142 @@
+import cv2
+import numpy as np
+from typing import Optional, Any, Dict, Tuple
+
+
+class BufferPool:
+    """
+    Ring of preallocated frame buffers reused across frames.
+    size must exceed the number of frames that can be in flight at once
+    (queued or being worked on), otherwise a buffer is overwritten while a
+    later stage still reads it.
+    """
+
+    def __init__(self, size: int = 4):
+        self.size = max(1, size)
+        self._shape: Optional[Tuple[int, ...]] = None
+        self._buffers = []
+        self._next = 0
+        self.bytes_allocated = 0
+
+    def next(self, shape: Tuple[int, ...]) -> np.ndarray:
+        if shape != self._shape:
+            # Resolution change (or first frame): allocate the ring once
+            self._shape = shape
+            self._buffers = [np.empty(shape, dtype=np.uint8) for _ in range(self.size)]
+            self.bytes_allocated += sum(buf.nbytes for buf in self._buffers)
+            self._next = 0
+        buf = self._buffers[self._next]
+        self._next = (self._next + 1) % self.size
+        return buf
+
+
+class FramePreprocessor:
+    """
+    Turns a decoded av.VideoFrame into the array the active detector consumes
+    with as few full-resolution copies as possible:
+
+    1. one swscale pass (frame.reformat) converts YUV straight to the
+       detector's color order and, if max_size is set, to its resolution
+    2. the converted plane is wrapped as a NumPy view (no copy)
+    3. flip/rotate writes that view once into a pooled buffer
+       (skipped entirely when no flip is configured)
+
+    bytes_allocated counts every buffer allocated per frame: the frame that
+    swscale converts into (reformat_bytes, one per converted frame), pool
+    buffers and fallback copies. Pool buffers stay flat after the first
+    frame; the reformat output is the one remaining per-frame allocation.
+    """
+
+    def __init__(self,
+                 color_order: str = "bgr",
+                 max_size: Optional[Tuple[int, int]] = None,
+                 flip_vertical: bool = True,
+                 flip_horizontal: bool = False,
+                 rotate_180: bool = False,
+                 pool_size: int = 4):
+        if color_order not in ("bgr", "rgb"):
+            raise ValueError(f"Unsupported color order '{color_order}'")
+        self.color_order = color_order
+        self.pixel_format = "rgb24" if color_order == "rgb" else "bgr24"
+        self.max_size = max_size
+        self.flip_code = self._flip_code(flip_vertical, flip_horizontal, rotate_180)
+        self.pool = BufferPool(pool_size)
+
+        self.frames = 0
+        self.fallback_bytes = 0
+        self.reformat_bytes = 0
+        self.last_frame_bytes = 0
+        self._bytes_mark = 0
+
+    @staticmethod
+    def _flip_code(flip_vertical: bool, flip_horizontal: bool, rotate_180: bool) -> Optional[int]:
+        # cv2.flip codes: 0 = vertical, 1 = horizontal, -1 = both (== rotate 180)
+        if rotate_180 or (flip_vertical and flip_horizontal):
+            return -1
+        if flip_vertical:
+            return 0
+        if flip_horizontal:
+            return 1
+        return None
+
+    def target_size(self, width: int, height: int) -> Tuple[int, int]:
+        if self.max_size is None:
+            return width, height
+        max_w, max_h = self.max_size
+        scale = min(max_w / width, max_h / height, 1.0)
+        # even dimensions keep swscale on its fast path
+        return max(2, int(width * scale) & ~1), max(2, int(height * scale) & ~1)
+
+    def decode(self, frame) -> Optional[np.ndarray]:
+        """Color conversion + resize in one pass, returned as a view when possible."""
+        width, height = self.target_size(frame.width, frame.height)
+        converted = frame
+        if (width, height) != (frame.width, frame.height) or frame.format.name != self.pixel_format:
+            converted = frame.reformat(width=width, height=height, format=self.pixel_format)
+            self.reformat_bytes += sum(plane.buffer_size for plane in converted.planes)
+
+        planes = getattr(converted, "planes", None)
+        if planes:
+            plane = planes[0]
+            line_size = abs(plane.line_size)
+            view = np.frombuffer(plane, dtype=np.uint8)[:height * line_size]
+            # Rows may be padded; slice the padding off without copying
+            return view.reshape(height, line_size)[:, :width * 3].reshape(height, width, 3)
+
+        img = converted.to_ndarray(format=self.pixel_format)
+        self.fallback_bytes += img.nbytes
+        return img
+
+    def orient(self, img: np.ndarray) -> np.ndarray:
+        """Applies the configured flip/rotate, writing into a pooled buffer."""
+        if self.flip_code is not None:
+            dst = self.pool.next(img.shape)
+            cv2.flip(img, self.flip_code, dst=dst)
+            img = dst
+        self._finish_frame()
+        return img
+
+    def _finish_frame(self):
+        self.frames += 1
+        total = self.bytes_allocated
+        self.last_frame_bytes = total - self._bytes_mark
+        self._bytes_mark = total
+
+    def __call__(self, frame) -> Optional[np.ndarray]:
+        img = self.decode(frame)
+        if img is None or img.size == 0:
+            return None
+        return self.orient(img)
+
+    @property
+    def bytes_allocated(self) -> int:
+        return self.pool.bytes_allocated + self.fallback_bytes + self.reformat_bytes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "bytes_allocated": self.bytes_allocated,
+            "reformat_bytes": self.reformat_bytes,
+            "last_frame_bytes": self.last_frame_bytes,
+            "bytes_per_frame": (self.bytes_allocated / self.frames) if self.frames else 0.0,
+        }
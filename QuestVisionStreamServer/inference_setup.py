@@ -0,0 +1,99 @@
+import argparse
+from typing import Optional, Any, Dict, List, Tuple
+from config import (DETECTOR_INPUT_SIZES, DETECTOR_PRECISION, DETECTOR_CADENCE, DETECTOR_BACKEND, ONNX_THREADS,
+                    LETTERBOX, DECODE_AT_MODEL_SIZE, MAX_BATCH_SIZE, BATCH_MAX_WAIT_MS, INFERENCE_SLOTS,
+                    DETECTOR_WORKERS, WORKER_THREADS, WARMUP_RUNS)
+from detectors import BACKENDS, MultiDetector
+from batch_engine import BatchInferenceEngine
+from detector_pool import DetectorPool, DEFAULT_SLOT_BYTES
+from scheduler import FairScheduler
+
+# How frames reach the detector, shared by server.py and benchmark_pipeline.py
+# so a benchmark run measures the same setup the server would use.
+
+
+def add_inference_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--backend', choices=BACKENDS, default=None,
+                       help='Inference runtime (onnx = ONNX Runtime on CPU for yolo / owlv2), overrides DETECTOR_BACKEND')
+    parser.add_argument('--batch-size', type=int, default=MAX_BATCH_SIZE,
+                       help=f'Max frames per batched forward across sessions, 1 disables batching (default: {MAX_BATCH_SIZE})')
+    parser.add_argument('--batch-wait-ms', type=float, default=BATCH_MAX_WAIT_MS,
+                       help=f'Max time a frame waits for its batch to fill (default: {BATCH_MAX_WAIT_MS})')
+    parser.add_argument('--inference-slots', type=int, default=INFERENCE_SLOTS,
+                       help=f'Concurrent detector calls shared fairly across sessions (default: {INFERENCE_SLOTS})')
+    parser.add_argument('--workers', type=int, default=DETECTOR_WORKERS,
+                       help=f'Detector worker processes, 1 runs the detector in the server process (default: {DETECTOR_WORKERS})')
+
+
+def detector_arguments(detectors: List[Tuple[str, Optional[int]]],
+                       input_size: Optional[Tuple[int, int]] = None,
+                       precision: Optional[str] = None,
+                       backend: Optional[str] = None) -> Dict[str, Any]:
+    """detectors.get_detectors() arguments for (name, every) pairs; the overrides win over config.py."""
+    names = list(dict.fromkeys(name for name, _ in detectors))
+    return dict(
+        names=names,
+        input_sizes={name: input_size or DETECTOR_INPUT_SIZES.get(name) for name in names},
+        letterbox=LETTERBOX,
+        precisions={name: precision or DETECTOR_PRECISION.get(name, "fp32") for name in names},
+        every={**DETECTOR_CADENCE, **{name: every for name, every in detectors if every}},
+        backends={name: backend or DETECTOR_BACKEND.get(name, "torch") for name in names},
+        onnx_threads=(ONNX_THREADS["intra_op"], ONNX_THREADS["inter_op"]),
+    )
+
+
+def create_inference(detector: Any,
+                     detector_args: Dict[str, Any],
+                     workers: int = DETECTOR_WORKERS,
+                     batch_size: int = MAX_BATCH_SIZE,
+                     batch_wait_ms: float = BATCH_MAX_WAIT_MS,
+                     inference_slots: int = INFERENCE_SLOTS) -> Tuple[Optional[DetectorPool], Any, FairScheduler]:
+    """
+    (pool, inference_engine, scheduler) for detector: a DetectorPool when
+    workers > 1 (detector itself is then only metadata and is never loaded),
+    else a BatchInferenceEngine for batched detectors when batch_size > 1,
+    else no engine and frames run in process. inference_engine is the pool
+    when there is one. The scheduler has enough slots to keep it busy.
+    """
+    pool = None
+    if workers > 1:
+        frame_bytes = DEFAULT_SLOT_BYTES
+        if DECODE_AT_MODEL_SIZE and detector.input_size:
+            frame_bytes = detector.input_size[0] * detector.input_size[1] * 3
+        pool = DetectorPool(
+            detector_args,
+            workers=workers,
+            threads_per_worker=WORKER_THREADS,
+            slot_bytes=frame_bytes,
+            warmup_runs=WARMUP_RUNS,
+            # Per-detector cadences are kept in this process (worker state is a per-frame copy)
+            cadence=detector if isinstance(detector, MultiDetector) else None,
+        )
+
+    inference_engine = pool
+    if pool is None and detector.supports_batch and batch_size > 1:
+        print(f"Batched inference: up to {batch_size} frames, {batch_wait_ms}ms max wait")
+        inference_engine = BatchInferenceEngine(
+            detector.detect_batch,
+            max_batch_size=batch_size,
+            max_wait_ms=batch_wait_ms
+        )
+
+    # Batches only fill if enough sessions can be inside the engine at once
+    slots = max(inference_slots, batch_size) if inference_engine else inference_slots
+    if pool is not None:
+        # One frame in flight per worker plus one queued keeps every worker busy
+        slots = max(inference_slots, pool.slots)
+    return pool, inference_engine, FairScheduler(capacity=slots)
+
+
+def connect_processor(processor: Any, detector: Any, state: Dict[str, Any],
+                      inference_engine: Any, scheduler: FairScheduler):
+    """Sends processor's frames to detector, through inference_engine when there is one, with state as its session state."""
+
+    def frame_callback(img, frame):
+        return detector.detect(img, state=state)
+
+    processor.set_frame_callback(frame_callback)
+    processor.set_inference_engine(inference_engine)
+    processor.set_scheduler(scheduler)
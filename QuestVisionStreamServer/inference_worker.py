@@ -0,0 +1,122 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Callable, Any, Dict
+
+
+class LatestFrameMailbox:
+    """
+    Single-slot mailbox for frames waiting on inference.
+    put() never blocks: a frame that has not been picked up yet is overwritten
+    by the newer one (latest-frame-wins), so stale frames are never queued.
+    """
+
+    def __init__(self):
+        self._item: Any = None
+        self._has_item = False
+        self._event = asyncio.Event()
+        self.dropped = 0
+
+    def put(self, item: Any) -> bool:
+        """Stores item, returns True if a pending frame was overwritten."""
+        overwritten = self._has_item
+        if overwritten:
+            self.dropped += 1
+        self._item = item
+        self._has_item = True
+        self._event.set()
+        return overwritten
+
+    async def get(self) -> Any:
+        while not self._has_item:
+            self._event.clear()
+            await self._event.wait()
+        item = self._item
+        self._item = None
+        self._has_item = False
+        return item
+
+
+class InferenceWorker:
+    """
+    Runs a blocking inference function on a dedicated thread, fed through a
+    LatestFrameMailbox, so the event loop keeps draining the track at full rate.
+
+    infer_fn(item) runs on the worker thread (a coroutine function is awaited
+    on the loop instead, e.g. when it delegates to a BatchInferenceEngine);
+    on_result(item, result) is called back on the event loop thread (safe to
+    touch aiortc objects there).
+    """
+
+    def __init__(self,
+                 infer_fn: Callable[[Any], Any],
+                 on_result: Optional[Callable[[Any, Any], None]] = None,
+                 name: str = "inference"):
+        self.infer_fn = infer_fn
+        self.on_result = on_result
+        self.name = name
+
+        self.frames_received = 0
+        self.frames_inferred = 0
+
+        self._mailbox: Optional[LatestFrameMailbox] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def frames_dropped(self) -> int:
+        return self._mailbox.dropped if self._mailbox else 0
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._mailbox = LatestFrameMailbox()
+        # One thread: inference is serialized, the mailbox absorbs the backlog
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, item: Any):
+        """Hands a frame to the worker. Never blocks; may overwrite a pending frame."""
+        if self._mailbox is None:
+            self.start()
+        self.frames_received += 1
+        self._mailbox.put(item)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._mailbox.get()
+            try:
+                if asyncio.iscoroutinefunction(self.infer_fn):
+                    result = await self.infer_fn(item)
+                else:
+                    result = await loop.run_in_executor(self._executor, self.infer_fn, item)
+            except Exception as e:
+                print(f"[InferenceWorker] Inference failed: {e}")
+                continue
+            self.frames_inferred += 1
+            if self.on_result is not None:
+                try:
+                    self.on_result(item, result)
+                except Exception as e:
+                    print(f"[InferenceWorker] Result handler failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "received": self.frames_received,
+            "inferred": self.frames_inferred,
+            "dropped": self.frames_dropped,
+        }
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            # Do not wait on an in-flight forward pass
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._mailbox = None
@@ -0,0 +1,166 @@
+import asyncio
+import weakref
+import numpy as np
+from typing import Optional, Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Knobs in the order they are turned down; restoring goes the other way
+KNOB_ORDER = ("max_detections", "keyframe_interval", "input_scale")
+
+
+class LatencyController:
+    """
+    Closed loop that keeps the measured latency near target_ms by trading
+    quality for time at runtime, without reloading the model.
+
+    Every interval_s the given percentile of the last interval's latency
+    (metric: a VideoProcessor recorder, "end_to_end" receive-to-publish by
+    default, across all sessions) is compared with the target. Above it, one
+    knob moves one step down its ladder; below headroom * target for
+    settle_checks intervals in a row, the most recent step is undone. Each
+    ladder starts at full quality and its last entry is the bound:
+
+      max_detections    - detections sent per frame, highest
+                          confidence first (None = all); fewer boxes to send
+      keyframe_interval - frames between detector runs when the box tracker is on
+      input_scale       - detector input size relative to its configured size
+                          (in-process detectors with an input size that
+                          they can change at runtime only)
+    """
+
+    def __init__(self,
+                 processors: Callable[[], Iterable[Any]],
+                 detector: Any = None,
+                 target_ms: float = 80.0,
+                 metric: str = "end_to_end",
+                 percentile: float = 95,
+                 interval_s: float = 2.0,
+                 headroom: float = 0.7,
+                 settle_checks: int = 3,
+                 min_samples: int = 10,
+                 max_detections: Sequence[Optional[int]] = (None, 50, 20),
+                 keyframe_intervals: Sequence[int] = (5, 8, 12),
+                 input_scales: Sequence[float] = (1.0, 0.75, 0.5)):
+        self.processors = processors
+        self.detector = detector
+        self.target_ms = target_ms
+        self.metric = metric
+        self.percentile = percentile
+        self.interval = interval_s
+        self.headroom = headroom
+        self.settle_checks = max(1, settle_checks)
+        self.min_samples = min_samples
+
+        self.ladders: Dict[str, Tuple[Any, ...]] = {
+            "max_detections": tuple(max_detections) or (None,),
+            "keyframe_interval": tuple(keyframe_intervals) or (None,),
+            "input_scale": tuple(input_scales) or (1.0,),
+        }
+        # The resolution knob needs a detector in this process that has an input size
+        # and actually runs at a different one when told to (see Detector.resizable)
+        self.base_size: Optional[Tuple[int, int]] = None
+        if detector is not None and getattr(detector, "resizable", False):
+            self.base_size = getattr(detector, "input_size", None)
+        if self.base_size is None:
+            self.ladders["input_scale"] = (1.0,)
+        self.level: Dict[str, int] = {name: 0 for name in KNOB_ORDER}
+        # Knob changes in order, so the latest one is undone first
+        self._steps: List[str] = []
+        self._seen: "weakref.WeakKeyDictionary[Any, int]" = weakref.WeakKeyDictionary()
+        self._calm = 0
+
+        self.observed_ms = 0.0
+        self.adjustments = 0
+
+    def value(self, knob: str) -> Any:
+        return self.ladders[knob][self.level[knob]]
+
+    def configure(self, processor: Any):
+        """Applies the current per-session knobs to a (new) VideoProcessor."""
+        processor.max_detections = self.value("max_detections")
+        interval = self.value("keyframe_interval")
+        if processor.tracker is not None and interval is not None:
+            processor.tracker.keyframe_interval = max(1, int(interval))
+
+    def _apply_input_scale(self):
+        scale = self.value("input_scale")
+        width, height = self.base_size
+        # Multiples of 32 suit every detector's patch / stride size
+        size = (max(32, int(round(width * scale / 32)) * 32), max(32, int(round(height * scale / 32)) * 32))
+        self.detector.apply_input_size(size)
+
+    def _recent_samples(self, processors: List[Any]) -> np.ndarray:
+        samples: List[float] = []
+        for processor in processors:
+            recorder = processor.end_to_end_latency if self.metric == "end_to_end" \
+                else processor.capture_latency if self.metric == "capture_to_publish" \
+                else processor.stage_latency[self.metric]
+            samples += recorder.since(self._seen.get(recorder, 0))
+            self._seen[recorder] = recorder.count
+        return np.asarray(samples, dtype=np.float64)
+
+    def _adjustable(self, knob: str, processors: List[Any]) -> bool:
+        if knob == "keyframe_interval":
+            return any(p.tracker is not None for p in processors)
+        return True
+
+    def _move(self, knob: str, delta: int, processors: List[Any]) -> str:
+        before = self.value(knob)
+        self.level[knob] += delta
+        if knob == "input_scale":
+            self._apply_input_scale()
+        else:
+            for processor in processors:
+                self.configure(processor)
+        self.adjustments += 1
+        return f"{knob} {before} -> {self.value(knob)}"
+
+    def step(self) -> Optional[str]:
+        """One control decision; returns a description of the change, if any."""
+        processors = list(self.processors())
+        samples = self._recent_samples(processors)
+        if samples.size < self.min_samples:
+            return None
+        self.observed_ms = float(np.percentile(samples, self.percentile))
+
+        if self.observed_ms > self.target_ms:
+            self._calm = 0
+            for knob in KNOB_ORDER:
+                if self.level[knob] + 1 < len(self.ladders[knob]) and self._adjustable(knob, processors):
+                    self._steps.append(knob)
+                    return self._move(knob, +1, processors)
+            return None
+
+        if self.observed_ms < self.target_ms * self.headroom and self._steps:
+            self._calm += 1
+            if self._calm >= self.settle_checks:
+                self._calm = 0
+                return self._move(self._steps.pop(), -1, processors)
+            return None
+        self._calm = 0
+        return None
+
+    async def run(self):
+        print(f"[LatencyControl] Target p{self.percentile:g} {self.metric} {self.target_ms:.0f}ms, "
+              f"knobs: {', '.join(k for k in KNOB_ORDER if len(self.ladders[k]) > 1)}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                change = self.step()
+            except Exception as e:
+                print(f"[LatencyControl] Adjustment failed: {e}")
+                continue
+            if change is not None:
+                direction = ">" if self.observed_ms > self.target_ms else "<"
+                print(f"[LatencyControl] p{self.percentile:g} {self.metric} {self.observed_ms:.1f}ms "
+                      f"{direction} {self.target_ms:.0f}ms target: {change}")
+
+    def counters(self) -> Dict[str, int]:
+        return {"latency_adjustments": self.adjustments}
+
+    def gauges(self) -> Dict[str, float]:
+        gauges = {"latency_target_ms": self.target_ms, "latency_observed_ms": round(self.observed_ms, 2)}
+        for knob in KNOB_ORDER:
+            value = self.value(knob)
+            # 0 = unlimited / not in use
+            gauges[f"control_{knob}"] = value if value is not None else 0
+        return gauges
@@ -0,0 +1,78 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+# async handler(writer, path)
+Handler = Callable[[asyncio.StreamWriter, str], Awaitable[None]]
+
+REASONS = {200: "OK", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+async def respond(writer: asyncio.StreamWriter, status: int, content_type: str, body: Union[str, bytes]):
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    writer.write(
+        f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Cache-Control: no-store\r\n"
+        "Connection: close\r\n\r\n".encode("ascii") + body
+    )
+    await writer.drain()
+
+
+class LocalHTTPServer:
+    """
+    Tiny GET-only HTTP server on the event loop for local tooling endpoints
+    (metrics, preview), so the server needs no web framework. Handlers get the
+    stream writer and the request path, and may keep the connection open
+    (e.g. for streaming responses). A route ending in "/" matches every path
+    under it.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100):
+        self.host = host
+        self.port = port
+        self.routes: Dict[str, Handler] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def route(self, path: str, handler: Handler):
+        self.routes[path] = handler
+
+    def _match(self, path: str) -> Optional[Handler]:
+        handler = self.routes.get(path)
+        if handler is not None:
+            return handler
+        prefixes = [p for p in self.routes if p.endswith("/") and path.startswith(p)]
+        return self.routes[max(prefixes, key=len)] if prefixes else None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        print(f"[HTTP] Serving {', '.join(sorted(self.routes))} on http://{self.host}:{self.port}")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            # Skip headers; nothing here needs them
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            if len(request_line) < 2:
+                return
+            method, path = request_line[0], request_line[1].split("?", 1)[0]
+            handler = self._match(path)
+            if method != "GET":
+                await respond(writer, 405, "text/plain", "GET only\n")
+            elif handler is None:
+                await respond(writer, 404, "text/plain", "Not found\n")
+            else:
+                await handler(writer, path)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            print(f"[HTTP] Request failed: {e}")
+        finally:
+            writer.close()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+            self._server = None
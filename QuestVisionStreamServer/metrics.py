@@ -0,0 +1,128 @@
+import bisect
+import collections
+import numpy as np
+from typing import Any, Dict, List, Sequence
+
+# Histogram bucket upper bounds in milliseconds (Prometheus "le" labels)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Metric family of each per-session counter. They overlap (a tracked frame
+# was also received and published), so each is its own family rather than a
+# label value that would double-count when summed.
+SESSION_COUNTERS = {
+    "received": "frames_received",
+    "published": "frames_published",
+    "dropped": "frames_dropped",
+    "skipped": "frames_skipped",
+    "tracked": "tracked_frames",
+    "roi_cropped": "roi_cropped_frames",
+    "dc_dropped": "datachannel_dropped",
+}
+
+
+class LatencyRecorder:
+    """
+    Latency samples (milliseconds) for one measurement point: cumulative
+    histogram buckets and totals over every sample (for graphing), plus the
+    most recent maxlen samples for exact percentiles.
+    record() is safe to call from stage threads.
+    """
+
+    def __init__(self, maxlen: int = 4096, buckets: Sequence[float] = LATENCY_BUCKETS_MS):
+        self.samples = collections.deque(maxlen=maxlen)
+        self.bounds = tuple(buckets)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)  # last one is +Inf
+        self.count = 0
+        self.total_ms = 0.0
+
+    def record(self, ms: float):
+        self.samples.append(ms)
+        self.bucket_counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+
+    def since(self, count: int) -> List[float]:
+        """Samples recorded after the recorder's count was count (at most maxlen of them)."""
+        new = self.count - count
+        if new <= 0:
+            return []
+        samples = list(self.samples)
+        return samples[-new:] if new < len(samples) else samples
+
+    def percentiles(self, qs: Sequence[float] = (50, 95, 99)) -> Dict[str, float]:
+        if not self.samples:
+            return {f"p{q:g}_ms": 0.0 for q in qs}
+        values = np.percentile(np.fromiter(list(self.samples), dtype=np.float64), qs)
+        return {f"p{q:g}_ms": float(v) for q, v in zip(qs, values)}
+
+    def histogram(self) -> List[List[Any]]:
+        """[[le, cumulative count], ...] ending with ["+Inf", count]."""
+        cumulative, out = 0, []
+        for bound, n in zip(list(self.bounds) + ["+Inf"], self.bucket_counts):
+            cumulative += n
+            out.append([bound, cumulative])
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": (self.total_ms / self.count) if self.count else 0.0,
+            **self.percentiles(),
+        }
+
+    def export(self) -> Dict[str, Any]:
+        return {**self.summary(), "sum_ms": self.total_ms, "buckets": self.histogram()}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _counter(prefix: str, name: str) -> str:
+    """Counter family name, with the _total suffix Prometheus expects."""
+    name = SESSION_COUNTERS.get(name, name)
+    return f"{prefix}_{name}" if name.endswith("_total") else f"{prefix}_{name}_total"
+
+
+def render_prometheus(snapshot: Dict[str, Any], prefix: str = "questvision") -> str:
+    """
+    Prometheus text exposition of a server snapshot:
+    {"sessions": {id: {"counters": {...}, "gauges": {...}, "latency": {stage: export()}}},
+     "counters": {...}, "gauges": {...}}
+    """
+    lines = [f"# TYPE {prefix}_latency_ms histogram"]
+    counters: Dict[str, List[str]] = collections.defaultdict(list)
+    gauges: Dict[str, List[str]] = collections.defaultdict(list)
+    for session_id, session in snapshot.get("sessions", {}).items():
+        for stage, hist in session.get("latency", {}).items():
+            base = {"session": session_id, "stage": stage}
+            for le, n in hist["buckets"]:
+                lines.append(f"{prefix}_latency_ms_bucket{_labels({**base, 'le': le})} {n}")
+            lines.append(f"{prefix}_latency_ms_sum{_labels(base)} {hist['sum_ms']:.3f}")
+            lines.append(f"{prefix}_latency_ms_count{_labels(base)} {hist['count']}")
+        for name, value in session.get("counters", {}).items():
+            family = _counter(prefix, name)
+            counters[family].append(f"{family}{_labels({'session': session_id})} {value}")
+        for name, value in session.get("gauges", {}).items():
+            gauges[name].append(f"{prefix}_{name}{_labels({'session': session_id})} {value}")
+
+    for family, samples in counters.items():
+        lines.append(f"# TYPE {family} counter")
+        lines += samples
+    for name, samples in gauges.items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines += samples
+    for name, value in snapshot.get("counters", {}).items():
+        family = _counter(prefix, name)
+        lines.append(f"# TYPE {family} counter")
+        lines.append(f"{family} {value}")
+    for name, value in snapshot.get("gauges", {}).items():
+        lines.append(f"# TYPE {prefix}_{name} gauge")
+        lines.append(f"{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+import numpy as np
+from typing import Optional, Any, Callable, Dict, List, Tuple
+
+# Warmup frame size when the detector has no fixed input size
+DEFAULT_WARMUP_SIZE = (640, 480)
+
+
+def warm_up(detector: Any, runs: int = 2, batch_size: int = 1, size: Optional[Tuple[int, int]] = None):
+    """
+    Runs dummy frames through the detector at the size real frames will have,
+    so kernel selection, allocator growth and lazy initialization happen
+    before the first headset frame. Batched detectors also warm the batch path.
+    """
+    width, height = size or detector.input_size or DEFAULT_WARMUP_SIZE
+    detector.warmup(width, height, runs=max(0, runs))
+    if batch_size > 1 and getattr(detector, "supports_batch", False) and runs > 0:
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        detector.detect_batch([dummy] * batch_size, [{} for _ in range(batch_size)])
+
+
+class ModelLoader:
+    """
+    Loads and warms up the detector (or starts a DetectorPool) in the
+    background while the server already accepts signaling. ready is set once
+    the first real frame can be served at full speed; until then sessions
+    stream video without detections. on_ready callbacks run on the event loop.
+    """
+
+    def __init__(self,
+                 detector: Any,
+                 pool: Any = None,
+                 warmup_runs: int = 2,
+                 warmup_batch: int = 1,
+                 started_at: Optional[float] = None):
+        self.detector = detector
+        self.pool = pool
+        self.warmup_runs = warmup_runs
+        self.warmup_batch = warmup_batch
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+
+        self.ready = threading.Event()
+        self.error: Optional[BaseException] = None
+        self.timings: Dict[str, float] = {}
+        self._callbacks: List[Callable[[], None]] = []
+
+    def on_ready(self, callback: Callable[[], None]):
+        self._callbacks.append(callback)
+
+    def _load(self):
+        start = time.perf_counter()
+        self.detector.load()
+        self.timings["load_seconds"] = time.perf_counter() - start
+
+    def _warm_up(self):
+        start = time.perf_counter()
+        warm_up(self.detector, self.warmup_runs, self.warmup_batch)
+        self.timings["warmup_seconds"] = time.perf_counter() - start
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            if self.pool is not None:
+                # Workers load and warm up in their own processes
+                start = time.perf_counter()
+                await self.pool.start()
+                self.timings["load_seconds"] = time.perf_counter() - start
+            else:
+                await loop.run_in_executor(None, self._load)
+                await loop.run_in_executor(None, self._warm_up)
+        except Exception as e:
+            self.error = e
+            print(f"[ModelLoader] Detector failed to load: {e}")
+            return
+
+        self.timings["time_to_ready_seconds"] = time.perf_counter() - self.started_at
+        self.ready.set()
+        t = self.timings
+        print(f"[ModelLoader] Ready in {t['time_to_ready_seconds']:.1f}s "
+              f"(load {t.get('load_seconds', 0.0):.1f}s, warmup {t.get('warmup_seconds', 0.0):.1f}s)")
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"[ModelLoader] Ready callback failed: {e}")
+
+    def gauges(self) -> Dict[str, float]:
+        gauges = {"model_ready": 1 if self.ready.is_set() else 0}
+        gauges.update({f"startup_{name}": round(value, 3) for name, value in self.timings.items()})
+        return gauges
@@ -0,0 +1,94 @@
+import time
+import cv2
+import numpy as np
+from typing import Optional, Any, Dict, Tuple
+
+
+class MotionGate:
+    """
+    Decides per frame whether the detector needs to run or the last result can
+    be reused, for one stream.
+
+    Each frame is shrunk to a tiny grayscale thumbnail and compared with the
+    thumbnail of the last frame that was actually inferred (not the previous
+    frame, so slow drift still accumulates). Below threshold (mean absolute
+    difference, 0-255) the cached detections are reused, but never for more
+    than max_stale_frames frames or max_stale_ms in a row.
+    """
+
+    def __init__(self,
+                 threshold: float = 3.0,
+                 max_stale_frames: int = 8,
+                 max_stale_ms: float = 500.0,
+                 size: Tuple[int, int] = (32, 24)):
+        self.threshold = threshold
+        self.max_stale_frames = max(0, max_stale_frames)
+        self.max_stale = max(0.0, max_stale_ms) / 1000.0
+        self.size = size
+
+        self.last_detections: Any = None
+        self.last_score = 0.0
+        self._sampled = np.empty((size[1] * 4, size[0] * 4, 3), dtype=np.uint8)
+        self._small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self._thumb = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._reference: Optional[np.ndarray] = None
+        self._stale_frames = 0
+        self._inferred_at = 0.0
+        self._force = False
+
+        self.frames = 0
+        self.inferred = 0
+        self.skipped = 0
+        self.forced = 0  # staleness bound hit on an unchanged scene
+
+    def _thumbnail(self, img: np.ndarray) -> np.ndarray:
+        # Sparse point sampling, then 4x4 averaging: ~10x cheaper than INTER_AREA
+        # over the full frame while still smoothing out sensor noise
+        cv2.resize(img, (self.size[0] * 4, self.size[1] * 4), dst=self._sampled, interpolation=cv2.INTER_NEAREST)
+        cv2.resize(self._sampled, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        # Channel order does not matter for change detection
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._thumb)
+        return self._thumb
+
+    def should_run(self, img: np.ndarray) -> bool:
+        self.frames += 1
+        thumb = self._thumbnail(img)
+        now = time.perf_counter()
+
+        force, self._force = self._force, False
+        if not force and self._reference is not None and self.last_detections is not None:
+            self.last_score = cv2.norm(thumb, self._reference, cv2.NORM_L1) / thumb.size
+            stale = (self._stale_frames >= self.max_stale_frames
+                     or now - self._inferred_at >= self.max_stale)
+            if self.last_score < self.threshold:
+                if not stale:
+                    self._stale_frames += 1
+                    self.skipped += 1
+                    return False
+                self.forced += 1
+
+        if self._reference is None:
+            self._reference = thumb.copy()
+        else:
+            np.copyto(self._reference, thumb)
+        self._stale_frames = 0
+        self._inferred_at = now
+        self.inferred += 1
+        return True
+
+    def update(self, detections: Any):
+        """Stores the result of a frame should_run() let through."""
+        self.last_detections = detections
+
+    def reset(self):
+        """Forces the next frame through, e.g. after the queries changed (any thread)."""
+        self._force = True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "forced": self.forced,
+            "skip_rate": (self.skipped / self.frames) if self.frames else 0.0,
+        }
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Callable, Any, Dict, List
+
+# Drop policies applied when a stage's input queue is full
+BLOCK = "block"              # wait for room (backpressure to the previous stage)
+DROP_OLDEST = "drop_oldest"  # evict the oldest queued item, keep the newest
+DROP_NEWEST = "drop_newest"  # reject the incoming item
+DROP_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+
+@dataclass
+class FramePacket:
+    """Unit of work flowing through the pipeline stages."""
+    number: int
+    frame: Any
+    img: Any = None
+    detections: Any = None
+    received_at: float = field(default_factory=time.perf_counter)
+
+
+class StageQueue:
+    """Bounded asyncio queue with a drop policy instead of unbounded growth."""
+
+    def __init__(self, maxsize: int = 1, drop_policy: str = DROP_OLDEST):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy '{drop_policy}', expected one of {DROP_POLICIES}")
+        self.maxsize = max(1, maxsize)
+        self.drop_policy = drop_policy
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=self.maxsize)
+
+    async def put(self, item: Any):
+        if self.drop_policy == BLOCK:
+            await self._queue.put(item)
+            return
+        if self._queue.full():
+            self.dropped += 1
+            if self.drop_policy == DROP_NEWEST:
+                return
+            self._queue.get_nowait()
+        self._queue.put_nowait(item)
+
+    async def get(self) -> Any:
+        return await self._queue.get()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+
+class PipelineStage:
+    """
+    One step of a FramePipeline.
+    fn(item) returns the item for the next stage, or None to stop it here.
+    Coroutine functions run on the event loop; plain functions run on the
+    stage's own thread when threaded=True, inline on the loop otherwise.
+    """
+
+    def __init__(self,
+                 name: str,
+                 fn: Callable[[Any], Any],
+                 maxsize: int = 1,
+                 drop_policy: str = DROP_OLDEST,
+                 threaded: bool = True):
+        self.name = name
+        self.fn = fn
+        self.queue = StageQueue(maxsize, drop_policy)
+        self.threaded = threaded and not asyncio.iscoroutinefunction(fn)
+
+        self.processed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def _call(self, item: Any) -> Any:
+        if asyncio.iscoroutinefunction(self.fn):
+            return await self.fn(item)
+        if self.threaded:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self.fn, item)
+        return self.fn(item)
+
+    async def run(self, next_stage: Optional["PipelineStage"]):
+        if self.threaded:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"stage-{self.name}")
+        try:
+            while True:
+                item = await self.queue.get()
+                start = time.perf_counter()
+                try:
+                    out = await self._call(item)
+                except Exception as e:
+                    self.failed += 1
+                    print(f"[Pipeline] Stage '{self.name}' failed: {e}")
+                    continue
+                finally:
+                    self.busy_time += time.perf_counter() - start
+                self.processed += 1
+                if out is not None and next_stage is not None:
+                    await next_stage.queue.put(out)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        avg_ms = (self.busy_time / self.processed * 1000.0) if self.processed else 0.0
+        return {
+            "processed": self.processed,
+            "dropped": self.queue.dropped,
+            "failed": self.failed,
+            "queued": self.queue.qsize(),
+            "avg_ms": avg_ms,
+        }
+
+
+class FramePipeline:
+    """
+    Chain of stages connected by bounded queues, each stage running in its own
+    task so that stage N works on frame k while stage N-1 works on frame k+1.
+    Throughput approaches the cost of the slowest stage rather than the sum.
+    """
+
+    def __init__(self, stages: List[PipelineStage]):
+        if not stages:
+            raise ValueError("FramePipeline needs at least one stage")
+        self.stages = stages
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        if self._tasks:
+            return
+        for i, stage in enumerate(self.stages):
+            next_stage = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            self._tasks.append(asyncio.create_task(stage.run(next_stage)))
+
+    async def submit(self, item: Any):
+        await self.stages[0].queue.put(item)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def format_stats(self) -> str:
+        return " | ".join(
+            f"{name}: {s['avg_ms']:.1f}ms drop={s['dropped']}"
+            for name, s in self.stats().items()
+        )
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
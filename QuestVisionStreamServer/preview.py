@@ -0,0 +1,194 @@
+import asyncio
+import threading
+import time
+import cv2
+import numpy as np
+from typing import Any, Optional, Tuple
+
+# Debug preview, kept entirely off the inference path. The frame loop only
+# hands over (a copy of) the newest frame and its detections at most max_fps
+# times per second; overlay drawing and JPEG encoding for the MJPEG stream
+# happen on the renderer's own thread. The HighGUI window itself is pumped from
+# the event loop (the main thread under asyncio.run): macOS only allows window
+# calls on the main thread, so off it the window is disabled.
+
+PREVIEW_FPS = 10
+JPEG_QUALITY = 70
+BOUNDARY = "frame"
+
+
+def draw_detections(img: np.ndarray, detections: Any):
+    """Boxes with label / confidence, plus pose landmarks as points."""
+    if not isinstance(detections, list):
+        return
+    for det in detections:
+        for x, y, visibility in det.get("landmarks", []):
+            if visibility >= 0.5:
+                cv2.circle(img, (int(x), int(y)), 3, (0, 255, 0), -1, cv2.LINE_AA)
+        x1, y1, x2, y2 = (int(v) for v in det["bbox"])
+        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{det['label']} {det['conf']:.2f}"
+        if "id" in det:
+            label = f"#{det['id']} {label}"
+        cv2.putText(img, label, (x1, max(0, y1 - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2, cv2.LINE_AA)
+
+
+class PreviewRenderer:
+    """
+    Renders the debug preview for one stream on a background thread.
+
+    window - show an OpenCV window (pressing "q" sets quit_requested); needs
+             start() to be called on the main thread's event loop
+    stream - keep the latest frame JPEG-encoded for the MJPEG endpoint; frames
+             are only encoded while at least one client is watching
+    """
+
+    def __init__(self,
+                 name: str = "Quest PCA Stream",
+                 window: bool = True,
+                 stream: bool = False,
+                 max_fps: float = PREVIEW_FPS,
+                 color_order: str = "bgr",
+                 jpeg_quality: int = JPEG_QUALITY):
+        self.name = name
+        self.window = window
+        self.stream = stream
+        self.interval = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.color_order = color_order
+        self.jpeg_quality = jpeg_quality
+
+        self.quit_requested = False
+        self.viewers = 0
+        self.jpeg: Optional[bytes] = None
+        self.jpeg_version = 0
+
+        self._cond = threading.Condition()
+        self._pending: Optional[Tuple[np.ndarray, Any]] = None
+        self._last_submit = 0.0
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._shown: Optional[np.ndarray] = None
+        self._shown_version = 0
+        self._pump: Optional[asyncio.Task] = None
+
+        self.rendered = 0
+        self.render_total = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        if self.window and threading.current_thread() is not threading.main_thread():
+            print(f"[Preview] {self.name}: not on the main thread, window disabled (use the MJPEG stream)")
+            self.window = False
+        self._running = True
+        if self.window:
+            self._pump = asyncio.get_running_loop().create_task(self._pump_window())
+        self._thread = threading.Thread(target=self._run, name=f"preview-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def submit(self, img: np.ndarray, detections: Any):
+        """
+        Called from the frame path. Returns immediately; frames arriving faster
+        than max_fps (or with nobody watching) are not copied at all.
+        """
+        if not self._running or not (self.window or self.viewers):
+            return
+        now = time.perf_counter()
+        if now - self._last_submit < self.interval:
+            return
+        self._last_submit = now
+        # Frame buffers are recycled by the preprocessor, so the renderer gets its own copy
+        frame = img.copy()
+        with self._cond:
+            self._pending = (frame, detections)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._running and self._pending is None:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                item, self._pending = self._pending, None
+
+            if item is not None:
+                start = time.perf_counter()
+                self._render(*item)
+                self.rendered += 1
+                self.render_total += time.perf_counter() - start
+
+    async def _pump_window(self):
+        """Shows the newest rendered frame and handles key presses, on the loop (main) thread."""
+        version = 0
+        try:
+            while self._running:
+                if self._shown_version != version:
+                    version = self._shown_version
+                    cv2.imshow(self.name, self._shown)
+                if (cv2.waitKey(1) & 0xFF) == ord("q"):
+                    self.quit_requested = True
+                # The window needs its event loop pumped even without new frames
+                await asyncio.sleep(0.03)
+        finally:
+            # HighGUI calls must all come from the thread that created the window
+            cv2.destroyWindow(self.name)
+            cv2.waitKey(1)
+
+    def _render(self, img: np.ndarray, detections: Any):
+        if self.color_order == "rgb":
+            img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
+        draw_detections(img, detections)
+        if self.window:
+            # Handed over whole; the pump only ever reads a finished frame
+            self._shown = img
+            self._shown_version += 1
+        if self.stream and self.viewers:
+            ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                self.jpeg = encoded.tobytes()
+                self.jpeg_version += 1
+
+    def stats(self):
+        return {
+            "rendered": self.rendered,
+            "avg_render_ms": (self.render_total / self.rendered * 1000.0) if self.rendered else 0.0,
+            "viewers": self.viewers,
+        }
+
+
+async def stream_mjpeg(writer: asyncio.StreamWriter, preview: PreviewRenderer):
+    """multipart/x-mixed-replace response with each newly rendered frame, until the client or stream goes away."""
+    writer.write(
+        "HTTP/1.1 200 OK\r\n"
+        f"Content-Type: multipart/x-mixed-replace; boundary={BOUNDARY}\r\n"
+        "Cache-Control: no-store\r\n"
+        "Connection: close\r\n\r\n".encode("ascii")
+    )
+    preview.viewers += 1
+    try:
+        version = -1
+        while preview.running:
+            if preview.jpeg is not None and preview.jpeg_version != version:
+                jpeg, version = preview.jpeg, preview.jpeg_version
+                writer.write(
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n".encode("ascii")
+                    + jpeg + b"\r\n"
+                )
+                await writer.drain()
+            await asyncio.sleep(preview.interval or 0.01)
+    finally:
+        preview.viewers -= 1
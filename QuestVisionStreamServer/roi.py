@@ -0,0 +1,144 @@
+import time
+import numpy as np
+from typing import Optional, Any, List, Tuple
+
+# (x1, y1, x2, y2), normalized 0-1 in the processed frame (same orientation
+# as the detections the headset receives)
+Region = Tuple[float, float, float, float]
+MAX_REGIONS = 8
+
+
+def parse_regions(regions: Any) -> Optional[List[Region]]:
+    """Validated [[x1, y1, x2, y2], ...] in priority order, or None if malformed."""
+    if not isinstance(regions, (list, tuple)) or len(regions) > MAX_REGIONS:
+        return None
+    parsed = []
+    for region in regions:
+        if not isinstance(region, (list, tuple)) or len(region) != 4:
+            return None
+        try:
+            x1, y1, x2, y2 = (min(1.0, max(0.0, float(v))) for v in region)
+        except (TypeError, ValueError):
+            return None
+        if x2 <= x1 or y2 <= y1:
+            return None
+        parsed.append((x1, y1, x2, y2))
+    return parsed
+
+
+def offset_detections(detections: Any, dx: int, dy: int) -> Any:
+    """Moves boxes and landmarks found in a crop at (dx, dy) back to full-frame pixels."""
+    if not isinstance(detections, list) or not detections:
+        return detections
+    boxes = np.array([det["bbox"] for det in detections], dtype=np.float32)
+    boxes += np.array([dx, dy, dx, dy], dtype=np.float32)
+    moved = []
+    for det, bbox in zip(detections, boxes.tolist()):
+        det = {**det, "bbox": bbox}
+        if det.get("landmarks"):
+            det["landmarks"] = [[x + dx, y + dy, *rest] for x, y, *rest in det["landmarks"]]
+        moved.append(det)
+    return moved
+
+
+class RoiSelector:
+    """
+    Region-of-interest hints for one stream, e.g. around the user's gaze or
+    hands, sent by the headset with an expiry.
+
+    While hints are live, the detector gets one crop per inferred frame: the
+    padded union of as many hints as fit in max_area (a fraction of the frame),
+    taken in the order the headset sent them, so the first region is the
+    highest priority. Every full_frame_interval-th inferred frame (and any
+    frame without live hints) runs on the whole frame, so nothing outside the
+    hinted area goes unseen for long.
+    """
+
+    def __init__(self,
+                 full_frame_interval: int = 10,
+                 margin: float = 0.1,
+                 max_area: float = 0.6,
+                 min_size: int = 64,
+                 default_ttl_ms: float = 500.0,
+                 max_ttl_ms: float = 5000.0):
+        self.full_frame_interval = max(1, full_frame_interval)
+        self.margin = max(0.0, margin)
+        self.max_area = max_area
+        self.min_size = min_size
+        self.default_ttl = default_ttl_ms / 1000.0
+        self.max_ttl = max_ttl_ms / 1000.0
+
+        # Replaced as a whole by set_hints (event loop), read by the infer stage
+        self._hints: List[Region] = []
+        self._expires_at = 0.0
+        self._since_full = 0
+
+        self.roi_frames = 0
+        self.full_frames = 0
+
+    def set_hints(self, regions: List[Region], ttl_ms: Optional[float] = None):
+        """Replaces the live hints; an empty list clears them."""
+        ttl = self.default_ttl if ttl_ms is None else min(self.max_ttl, max(0.0, float(ttl_ms) / 1000.0))
+        self._hints = list(regions)
+        self._expires_at = time.perf_counter() + ttl
+
+    def clear(self):
+        self._hints = []
+
+    @property
+    def active(self) -> bool:
+        return bool(self._hints) and time.perf_counter() < self._expires_at
+
+    def _union(self, regions: List[Region], width: int, height: int) -> Tuple[int, int, int, int]:
+        x1 = min(r[0] for r in regions)
+        y1 = min(r[1] for r in regions)
+        x2 = max(r[2] for r in regions)
+        y2 = max(r[3] for r in regions)
+        pad_x, pad_y = (x2 - x1) * self.margin, (y2 - y1) * self.margin
+        left, right = int(max(0.0, x1 - pad_x) * width), int(np.ceil(min(1.0, x2 + pad_x) * width))
+        top, bottom = int(max(0.0, y1 - pad_y) * height), int(np.ceil(min(1.0, y2 + pad_y) * height))
+        # Grow tiny regions around their center; detectors need some context
+        min_w, min_h = min(self.min_size, width), min(self.min_size, height)
+        if right - left < min_w:
+            left = min(max(0, (left + right - min_w) // 2), width - min_w)
+            right = left + min_w
+        if bottom - top < min_h:
+            top = min(max(0, (top + bottom - min_h) // 2), height - min_h)
+            bottom = top + min_h
+        return left, top, right, bottom
+
+    def crop_for(self, width: int, height: int) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Pixel rect (x1, y1, x2, y2) the detector should see for the next inferred
+        frame, or None for the whole frame. Call once per inferred frame.
+        """
+        hints = self._hints
+        if not hints or time.perf_counter() >= self._expires_at or self._since_full + 1 >= self.full_frame_interval:
+            self._since_full = 0
+            self.full_frames += 1
+            return None
+
+        crop, chosen = None, []
+        for region in hints:
+            candidate = self._union(chosen + [region], width, height)
+            if (candidate[2] - candidate[0]) * (candidate[3] - candidate[1]) > self.max_area * width * height:
+                break
+            crop, chosen = candidate, chosen + [region]
+        if crop is None:
+            # Even the top hint covers most of the frame: cropping saves nothing
+            self._since_full = 0
+            self.full_frames += 1
+            return None
+
+        self._since_full += 1
+        self.roi_frames += 1
+        return crop
+
+    def stats(self):
+        total = self.roi_frames + self.full_frames
+        return {
+            "active": self.active,
+            "roi_frames": self.roi_frames,
+            "full_frames": self.full_frames,
+            "roi_rate": (self.roi_frames / total) if total else 0.0,
+        }
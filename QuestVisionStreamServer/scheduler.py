@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Tuple
+
+
+class _SessionShare:
+    __slots__ = ("weight", "finish", "grants", "wait_time")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0      # virtual finish time of the last granted slot
+        self.grants = 0
+        self.wait_time = 0.0
+
+
+class FairScheduler:
+    """
+    Hands out a fixed number of inference slots across sessions using
+    start-time fair queuing: every grant advances the session's virtual clock
+    by 1/weight, and the waiter with the smallest virtual start time goes
+    next. A session that is always busy therefore gets at most its weighted
+    share while others are waiting, and an idle session does not bank credit.
+
+    Blocking detector calls run on the scheduler's own thread pool, sized to
+    the number of slots.
+    """
+
+    def __init__(self, capacity: int = 1):
+        self.capacity = max(1, capacity)
+        self.executor = ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix="inference")
+
+        self._in_use = 0
+        self._dispatch_pending = False
+        self._vclock = 0.0
+        self._seq = itertools.count()
+        self._waiters: List[Tuple[float, int, asyncio.Future, Any]] = []
+        self._sessions: Dict[Any, _SessionShare] = {}
+
+    def register(self, session_id: Any, weight: float = 1.0):
+        if session_id not in self._sessions:
+            self._sessions[session_id] = _SessionShare(max(weight, 1e-3))
+        else:
+            self.set_weight(session_id, weight)
+
+    def set_weight(self, session_id: Any, weight: float):
+        share = self._sessions.get(session_id)
+        if share is not None:
+            share.weight = max(weight, 1e-3)
+
+    def unregister(self, session_id: Any):
+        self._sessions.pop(session_id, None)
+
+    def _grant(self, session_id: Any, start: float):
+        share = self._sessions.get(session_id)
+        self._in_use += 1
+        self._vclock = start
+        if share is not None:
+            share.finish = start + 1.0 / share.weight
+            share.grants += 1
+
+    def _release(self):
+        self._in_use -= 1
+        if self._waiters and not self._dispatch_pending:
+            # Decide on the next tick so the releasing session can queue its
+            # next request first; otherwise it would never be considered and
+            # weights would degrade to plain round-robin.
+            self._dispatch_pending = True
+            asyncio.get_running_loop().call_soon(self._dispatch)
+
+    def _dispatch(self):
+        self._dispatch_pending = False
+        while self._waiters and self._in_use < self.capacity:
+            start, _, future, session_id = heapq.heappop(self._waiters)
+            if future.done():
+                # Waiter was cancelled (e.g. its session closed)
+                continue
+            self._grant(session_id, start)
+            future.set_result(None)
+
+    async def _acquire(self, session_id: Any):
+        share = self._sessions.get(session_id)
+        if share is None:
+            self.register(session_id)
+            share = self._sessions[session_id]
+        start = max(self._vclock, share.finish)
+
+        if self._in_use < self.capacity and not self._waiters:
+            self._grant(session_id, start)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (start, next(self._seq), future, session_id))
+        waited_from = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted just as we were cancelled, hand it on
+                self._release()
+            raise
+        share.wait_time += time.perf_counter() - waited_from
+
+    @asynccontextmanager
+    async def slot(self, session_id: Any):
+        """Holds one inference slot for the duration of the block."""
+        await self._acquire(session_id)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def run(self, session_id: Any, fn, *args) -> Any:
+        """Runs a blocking fn(*args) on the inference pool within the session's share."""
+        async with self.slot(session_id):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    def session_stats(self, session_id: Any) -> Dict[str, Any]:
+        share = self._sessions.get(session_id)
+        if share is None:
+            return {}
+        return {
+            "weight": share.weight,
+            "grants": share.grants,
+            "avg_wait_ms": (share.wait_time / share.grants * 1000.0) if share.grants else 0.0,
+        }
+
+    def shutdown(self):
+        for _, _, future, _ in self._waiters:
+            if not future.done():
+                future.cancel()
+        self._waiters = []
+        self.executor.shutdown(wait=False)
@@ -1,71 +1,165 @@
 import asyncio
-import json
 import argparse
+import os
+import time
 from video_processor import VideoProcessor
 from webrtc_server import WebRTCServer
+from session import StreamSession
 from config import *
-from detectors import get_detector
+from detectors import get_detectors, DETECTOR_NAMES, PRECISIONS
+from inference_setup import add_inference_arguments, detector_arguments, create_inference, connect_processor
+from model_loader import ModelLoader
+from latency_controller import LatencyController
+from stream_negotiation import StreamNegotiator
+
+def parse_size(value):
+    try:
+        width, height = (int(v) for v in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WxH, got '{value}'")
+    return width, height
+
+def parse_detector(value):
+    name, _, every = value.partition(':')
+    if name not in DETECTOR_NAMES:
+        raise argparse.ArgumentTypeError(f"unknown detector '{name}', expected one of {DETECTOR_NAMES}")
+    try:
+        every = int(every) if every else None
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected NAME or NAME:EVERY, got '{value}'")
+    return name, every
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='QuestVisionStream Server')
     parser.add_argument('--detector', 
-                       choices=['yolo', 'florence2', 'owl2', 'body'], 
-                       default='yolo',
-                       help='Type of detector to use (default: yolo)')
+                       type=parse_detector,
+                       nargs='+',
+                       default=[('yolo', None)],
+                       help=f'Detectors to run on each frame, NAME or NAME:EVERY (every Nth frame), '
+                            f'from {", ".join(DETECTOR_NAMES)} (default: yolo)')
+    parser.add_argument('--input-size', type=parse_size, default=None,
+                       help='Detector input size WxH, overrides DETECTOR_INPUT_SIZES (e.g. 480x480)')
+    parser.add_argument('--precision', choices=PRECISIONS, default=None,
+                       help='Numeric precision for transformer detectors, overrides DETECTOR_PRECISION')
+    add_inference_arguments(parser)
+    parser.add_argument('--latency-target', type=float, default=None,
+                       help='Enable the latency controller with this p95 target in ms, overrides LATENCY_CONTROL')
+    parser.add_argument('--lan', action='store_true', default=ICE_LAN_ONLY,
+                       help='Same-network headsets: host ICE candidates only, no STUN / TURN (overrides ICE_LAN_ONLY)')
     return parser.parse_args()
 
 async def main():
+    started_at = time.perf_counter()
     args = parse_arguments()
+    if MODEL_CACHE_DIR:
+        # Environment, so detector worker processes see it too
+        os.environ["QUESTVISION_CACHE_DIR"] = MODEL_CACHE_DIR
     
-    detector_func = get_detector(args.detector)
-    if detector_func is None:
-        print(f"Error: Unknown detector '{args.detector}'")
+    detector_args = detector_arguments(args.detector, args.input_size, args.precision, args.backend)
+    names = detector_args["names"]
+    detector = get_detectors(**detector_args)
+    if detector is None:
+        print(f"Error: Unknown detector in {names}")
         return
     
     print(f"WebSocket server: ws://{HOST}:{PORT}")
-    print(f"Using detector: {args.detector}")
+    for name in names:
+        input_size = detector_args["input_sizes"][name]
+        precision = detector_args["precisions"][name]
+        backend = detector_args["backends"][name]
+        every = detector_args["every"].get(name, 1) if len(names) > 1 else 1
+        print(f"Using detector: {name}" + (f" @ {input_size[0]}x{input_size[1]}" if input_size else "")
+              + (f" ({precision})" if precision != "fp32" else "")
+              + (f" on {backend}" if backend != "torch" else "")
+              + (f", every {every} frames" if every > 1 else ""))
     
-    video_processor = VideoProcessor(
-        enable_display=ENABLE_DISPLAY,
-        flip_vertical=FLIP_VERTICAL,
-        flip_horizontal=FLIP_HORIZONTAL,
-        rotate_180=ROTATE_180,
-        log_interval=LOG_INTERVAL
+    # With workers > 1 they load the model; this process only needs its metadata
+    pool, inference_engine, scheduler = create_inference(
+        detector, detector_args, args.workers, args.batch_size, args.batch_wait_ms, args.inference_slots
     )
-    
-    def frame_callback(img, frame):
-        if args.detector == 'body':
-            # body_tracker returns different format
-            return detector_func(img, frame)
-        else:
-            # Other detectors return (img, detections)
-            processed_img, detections = detector_func(img, frame)
-            return detections
 
-    video_processor.set_frame_callback(frame_callback)
+    # Models load and warm up in the background; signaling starts right away
+    loader = ModelLoader(
+        detector,
+        pool=pool,
+        warmup_runs=WARMUP_RUNS,
+        warmup_batch=args.batch_size if inference_engine is not None and pool is None else 1,
+        started_at=started_at,
+    )
+
+    # Sessions only exist once the server does; the controller looks them up per step
+    server = None
+    controller = None
+    latency_control = LATENCY_CONTROL
+    if args.latency_target is not None:
+        latency_control = {**(LATENCY_CONTROL or {}), "target_ms": args.latency_target}
+    if latency_control is not None:
+        controller = LatencyController(
+            processors=lambda: [s.processor for s in list(server.sessions.values())] if server else [],
+            # Detectors inside worker processes cannot be resized from here
+            detector=detector if pool is None else None,
+            **{**LATENCY_CONTROL_DEFAULTS, **latency_control},
+        )
+
+    def create_processor(session: StreamSession) -> VideoProcessor:
+        video_processor = VideoProcessor(
+            enable_display=ENABLE_DISPLAY,
+            flip_vertical=FLIP_VERTICAL,
+            flip_horizontal=FLIP_HORIZONTAL,
+            rotate_180=ROTATE_180,
+            log_interval=LOG_INTERVAL,
+            execution_mode=EXECUTION_MODE,
+            pipeline_stages=PIPELINE_STAGES,
+            color_order=detector.color_order,
+            decode_max_size=detector.input_size if DECODE_AT_MODEL_SIZE else None,
+            motion_gate=MOTION_GATE,
+            tracker=TRACKER,
+            roi=ROI,
+            preview_fps=PREVIEW_FPS,
+            preview_stream=PREVIEW_STREAM
+        )
+        connect_processor(video_processor, detector, session.detector_state, inference_engine, scheduler)
+        session.release_state = detector.forget
+        video_processor.set_model_ready(loader.ready)
+        if controller is not None:
+            controller.configure(video_processor)
+        return video_processor
+
+    stream = None
+    if STREAM is not None:
+        stream = StreamNegotiator(**{**STREAM, "max_size": STREAM.get("max_size") or detector.input_size})
 
     server = WebRTCServer(
         host=HOST,
         port=PORT,
-        video_processor=video_processor
+        processor_factory=create_processor,
+        scheduler=scheduler,
+        metrics_host=METRICS_HOST,
+        metrics_port=METRICS_PORT,
+        model_loader=loader,
+        latency_controller=controller,
+        ice_servers=ICE_SERVERS,
+        lan_only=args.lan,
+        stream=stream
     )
-
-    # Wire data channel sender so the processor can emit detections per frame
-    def send_over_dc(payload: dict):
-        try:
-            if server.detections_channel and server.detections_channel.readyState == "open":
-                server.detections_channel.send(json.dumps(payload))
-        except Exception as e:
-            print(f"[Server] Failed to send over DC: {e}")
-
-    video_processor.set_data_channel_sender(send_over_dc)
     
+    loader_task = asyncio.create_task(loader.run())
+    controller_task = asyncio.create_task(controller.run()) if controller is not None else None
+    print(f"Accepting connections after {time.perf_counter() - started_at:.1f}s, detector loading in the background")
     try:
         await server.start()
     except KeyboardInterrupt:
         print("\nShutting down...")
     finally:
         server.cleanup()
+        scheduler.shutdown()
+        loader_task.cancel()
+        if controller_task is not None:
+            controller_task.cancel()
+        if pool is not None:
+            await pool.stop()
+        elif inference_engine is not None:
+            await inference_engine.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,189 @@
+import json
+from typing import Optional, Callable, Any, Dict, List
+from aiortc import RTCDataChannel
+from video_processor import VideoProcessor
+from detectors.text_cache import normalize_queries
+from roi import parse_regions
+from wire_format import DetectionEncoder, FORMATS
+from dc_publisher import ChannelPublisher, Message
+
+
+class StreamSession:
+    """
+    Everything that belongs to one connected headset: its peer connection,
+    its own VideoProcessor (frame counters, pipeline, FPS), per-session
+    detector state and its detections data channel.
+    """
+
+    def __init__(self,
+                 session_id: str,
+                 pc: Any,
+                 processor_factory: Callable[["StreamSession"], VideoProcessor],
+                 weight: float = 1.0):
+        self.session_id = session_id
+        self.pc = pc
+        self.weight = weight
+        # Mutable state detectors keep between frames of this stream only
+        self.detector_state: Dict[str, Any] = {}
+        self.detections_channel: Optional[RTCDataChannel] = None
+        # Drops stale detections instead of queueing them behind a slow link
+        self.publisher: Optional[ChannelPublisher] = None
+        # Set once the headset negotiates the binary format; None = JSON
+        self.encoder: Optional[DetectionEncoder] = None
+        # Releases what detectors keep in detector_state (e.g. MediaPipe graphs)
+        # when the session ends; set by the processor factory
+        self.release_state: Optional[Callable[[Dict[str, Any]], None]] = None
+        # Connection setup milestones (remote_description, gathered, answer_sent,
+        # ice_connected, connected, channel_open), ms since the offer arrived
+        self.connect_timing: Dict[str, float] = {}
+        # Video codec picked in the SDP answer
+        self.codec: Optional[str] = None
+
+        self.processor = processor_factory(self)
+        self.processor.session_id = session_id
+        self.processor.detector_state = self.detector_state
+        self.processor.set_data_channel_sender(self.send)
+
+    def attach_channel(self, channel: RTCDataChannel):
+        self.detections_channel = channel
+        self.publisher = ChannelPublisher(channel, encode=self._encode, latency=self.processor.stage_latency)
+
+    def _encode(self, payload: Dict[str, Any]) -> List[Message]:
+        # Called when the payload is actually sent, with the format in effect then
+        if self.encoder is not None:
+            return self.encoder.encode(payload)
+        return [json.dumps(payload)]
+
+    def send(self, payload: Dict[str, Any]):
+        try:
+            if self.publisher is None:
+                return
+            if payload.get("type") == "detections":
+                self.publisher.publish(payload)
+            else:
+                self.publisher.send_control(payload)
+        except Exception as e:
+            print(f"[Session {self.session_id}] Failed to send over DC: {e}")
+
+    def handle_message(self, message: Any):
+        """Control messages the headset sends over the detections channel."""
+        try:
+            data = json.loads(message)
+        except (TypeError, ValueError):
+            print(f"[Session {self.session_id}] Ignoring non-JSON message")
+            return
+        if not isinstance(data, dict):
+            return
+
+        if data.get("type") == "set_queries":
+            self.set_queries(data.get("queries"))
+        elif data.get("type") == "set_format":
+            self.set_format(data.get("format"), bool(data.get("delta", False)))
+        elif data.get("type") == "set_roi":
+            self.set_roi(data.get("regions"), data.get("ttl_ms"))
+
+    def set_roi(self, regions: Any, ttl_ms: Any = None):
+        """
+        Region-of-interest hints, normalized [[x1, y1, x2, y2], ...] with the
+        most important first, valid for ttl_ms. Sent often (e.g. following the
+        gaze), so only rejections are answered. An empty list clears them.
+        """
+        if self.processor.roi is None:
+            return
+        parsed = parse_regions(regions if regions is not None else [])
+        if parsed is None or (ttl_ms is not None and not isinstance(ttl_ms, (int, float))):
+            print(f"[Session {self.session_id}] Rejected ROI hints: {regions!r}")
+            self.send({"type": "roi", "ok": False})
+            return
+        self.processor.roi.set_hints(parsed, ttl_ms)
+
+    def set_format(self, wire_format: Any, delta: bool = False):
+        """Switches detections to the binary format (see wire_format.py) or back to JSON."""
+        if wire_format not in FORMATS:
+            print(f"[Session {self.session_id}] Unknown format {wire_format!r}, keeping {self.wire_format}")
+        elif wire_format == "binary":
+            # Fresh encoder: the label table is resent with the next frame
+            self.encoder = DetectionEncoder(delta=delta)
+        else:
+            self.encoder = None
+        print(f"[Session {self.session_id}] Detections format: {self.wire_format}")
+        # Control replies are always JSON text
+        self.send({
+            "type": "format",
+            "format": self.wire_format,
+            "delta": bool(self.encoder and self.encoder.delta),
+        })
+
+    @property
+    def wire_format(self) -> str:
+        return "binary" if self.encoder is not None else "json"
+
+    def set_queries(self, queries: Any):
+        """
+        Replaces this session's open-vocabulary queries (OWLv2 / Grounding DINO).
+        An empty list restores the detector defaults. Takes effect from the next
+        inferred frame; the new text embedding is computed once and cached.
+        """
+        if queries in (None, [], ()):
+            self.detector_state.pop("queries", None)
+        else:
+            cleaned = normalize_queries(queries)
+            if cleaned is None:
+                print(f"[Session {self.session_id}] Rejected queries: {queries!r}")
+                self.send({"type": "queries", "ok": False, "queries": list(self.detector_state.get("queries", []))})
+                return
+            self.detector_state["queries"] = cleaned
+        # Cached and tracked detections belong to the old queries
+        if self.processor.motion_gate is not None:
+            self.processor.motion_gate.reset()
+        if self.processor.tracker is not None:
+            self.processor.tracker.reset()
+        print(f"[Session {self.session_id}] Queries: {list(self.detector_state.get('queries', [])) or 'default'}")
+        self.send({"type": "queries", "ok": True, "queries": list(self.detector_state.get("queries", []))})
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "session": self.session_id,
+            "frames": self.processor.frame_count,
+            "fps": self.processor.fps,
+            "latency_ms": self.processor.latency_ms,
+            "codec": self.codec,
+            "decode_ms": self.processor.stage_latency["decode"].summary()["mean_ms"],
+        }
+        if self.processor.motion_gate is not None:
+            stats["skip_rate"] = self.processor.motion_gate.stats()["skip_rate"]
+        if self.processor.tracker is not None:
+            stats["keyframe_rate"] = self.processor.tracker.stats()["keyframe_rate"]
+        if self.processor.roi is not None:
+            stats["roi_rate"] = self.processor.roi.stats()["roi_rate"]
+        if self.publisher is not None:
+            dc = self.publisher.stats()
+            stats["dc_dropped"] = dc["dropped"]
+            stats["dc_avg_queue_ms"] = dc["avg_queue_ms"]
+            stats["dc_max_queue_ms"] = dc["max_queue_ms"]
+        if "connected" in self.connect_timing:
+            stats["connect_ms"] = round(self.connect_timing["connected"], 1)
+        if self.processor.scheduler is not None:
+            stats.update(self.processor.scheduler.session_stats(self.session_id))
+        return stats
+
+    def metrics(self) -> Dict[str, Any]:
+        """Counters, gauges and latency histograms for the metrics endpoint."""
+        metrics = self.processor.metrics()
+        if self.publisher is not None:
+            dc = self.publisher.stats()
+            metrics["counters"]["dc_dropped"] = dc["dropped"]
+            metrics["gauges"]["dc_buffered_bytes"] = dc["buffered"]
+        if "connected" in self.connect_timing:
+            metrics["gauges"]["connect_ms"] = round(self.connect_timing["connected"], 1)
+        return metrics
+
+    def cleanup(self):
+        self.detections_channel = None
+        self.publisher = None
+        self.processor.cleanup()
+        if self.release_state is not None:
+            try:
+                self.release_state(self.detector_state)
+            except Exception as e:
+                print(f"[Session {self.session_id}] Failed to release detector state: {e}")
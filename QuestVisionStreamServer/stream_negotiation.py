@@ -0,0 +1,118 @@
+from typing import Optional, Any, Dict, List, Sequence, Tuple
+
+# Rough H.264 / VP8 bits per pixel for a clean picture at moderate motion
+BITS_PER_PIXEL = 0.1
+
+
+class StreamNegotiator:
+    """
+    What the server asks the headset to send: codec preference order for the
+    SDP answer, and a target size / frame rate / bitrate.
+
+    Codecs are preferred on a receive transceiver added before the offer is
+    applied, so aiortc answers with the first listed codec the headset also
+    offers (codecs not listed stay acceptable, after the listed ones). The
+    target goes into the answer's video section (b=AS / b=TIAS, which WebRTC
+    senders cap their bitrate to, plus a=framerate and a=imageattr) and into
+    the loading / ready message as "stream", for clients that set up their
+    capture and encoder from it.
+
+    max_size is the largest frame worth sending; by default the active
+    detector's input size, since frames are decoded straight down to it
+    anyway. bitrate_kbps defaults to max_size at fps and BITS_PER_PIXEL.
+    """
+
+    def __init__(self,
+                 codecs: Sequence[str] = ("H264", "VP8"),
+                 max_size: Optional[Tuple[int, int]] = None,
+                 fps: Optional[int] = 30,
+                 bitrate_kbps: Optional[int] = None):
+        self.codecs = [codec.upper() for codec in codecs]
+        self.max_size = tuple(max_size) if max_size else None
+        self.fps = fps
+        if bitrate_kbps is None and self.max_size is not None and fps:
+            bitrate_kbps = int(self.max_size[0] * self.max_size[1] * fps * BITS_PER_PIXEL / 1000)
+        self.bitrate_kbps = bitrate_kbps
+
+    def target(self) -> Dict[str, Any]:
+        """The "stream" entry of the loading / ready message."""
+        target: Dict[str, Any] = {"codecs": self.codecs}
+        if self.max_size is not None:
+            target["width"], target["height"] = self.max_size
+        if self.fps:
+            target["fps"] = self.fps
+        if self.bitrate_kbps:
+            target["bitrate_kbps"] = self.bitrate_kbps
+        return target
+
+    def describe(self) -> str:
+        parts = ["/".join(self.codecs)]
+        if self.max_size is not None:
+            parts.append(f"{self.max_size[0]}x{self.max_size[1]}")
+        if self.fps:
+            parts.append(f"{self.fps}fps")
+        if self.bitrate_kbps:
+            parts.append(f"{self.bitrate_kbps}kbps")
+        return ", ".join(parts)
+
+    def _preferred_codecs(self) -> List[Any]:
+        from aiortc import RTCRtpReceiver
+        available = RTCRtpReceiver.getCapabilities("video").codecs
+        media = [c for c in available if c.mimeType.lower() != "video/rtx"]
+        rtx = [c for c in available if c.mimeType.lower() == "video/rtx"]
+        ordered = []
+        for name in self.codecs:
+            matches = [c for c in media if c.mimeType.lower() == f"video/{name.lower()}"]
+            if not matches:
+                print(f"[Stream] Codec {name} is not supported by aiortc, skipped")
+            ordered += [c for c in matches if c not in ordered]
+        # Anything else the headset might offer stays acceptable, last
+        return ordered + [c for c in media if c not in ordered] + rtx
+
+    def prepare(self, pc: Any):
+        """Call before setRemoteDescription: the offer's video track lands on this transceiver."""
+        transceiver = pc.addTransceiver("video", direction="recvonly")
+        transceiver.setCodecPreferences(self._preferred_codecs())
+
+    def answer_sdp(self, sdp: str) -> str:
+        """The answer to send, with the target added to every video section."""
+        lines = sdp.splitlines()
+        out: List[str] = []
+        in_video = False
+        for line in lines:
+            if line.startswith("m="):
+                if in_video:
+                    out += self._attributes()
+                in_video = line.startswith("m=video")
+            # Bandwidth lines belong right after the connection line (RFC 8866 order)
+            if in_video and self.bitrate_kbps and line.startswith("b="):
+                continue
+            out.append(line)
+            if in_video and line.startswith("c=") and self.bitrate_kbps:
+                out += [f"b=AS:{self.bitrate_kbps}", f"b=TIAS:{self.bitrate_kbps * 1000}"]
+        if in_video:
+            out += self._attributes()
+        return "\r\n".join(out) + "\r\n"
+
+    def _attributes(self) -> List[str]:
+        attributes = []
+        if self.fps:
+            attributes.append(f"a=framerate:{self.fps}")
+        if self.max_size is not None:
+            attributes.append(f"a=imageattr:* recv [x=[2:{self.max_size[0]}],y=[2:{self.max_size[1]}]]")
+        return attributes
+
+
+def negotiated_codec(sdp: str) -> Optional[str]:
+    """Codec of the first video section in an SDP answer (its first payload type)."""
+    payload_type = None
+    for line in sdp.splitlines():
+        if line.startswith("m="):
+            if payload_type is not None:
+                break
+            fields = line.split()
+            if line.startswith("m=video") and len(fields) > 3:
+                payload_type = fields[3]
+        elif payload_type is not None and line.startswith(f"a=rtpmap:{payload_type} "):
+            return line.split(" ", 1)[1].split("/", 1)[0]
+    return None
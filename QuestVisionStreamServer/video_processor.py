@@ -1,115 +1,492 @@
 import cv2
 import asyncio
-from typing import Optional, Callable, Any, Dict, List
+from typing import Optional, Callable, Any, Dict, List, Tuple
 import json
+import threading
+import time
+from inference_worker import InferenceWorker
+from pipeline import FramePacket, FramePipeline, PipelineStage
+from batch_engine import BatchInferenceEngine
+from scheduler import FairScheduler
+from frame_preprocessor import FramePreprocessor
+from motion_gate import MotionGate
+from box_tracker import BoxTracker
+from roi import RoiSelector, offset_detections
+from metrics import LatencyRecorder
+from preview import PreviewRenderer, PREVIEW_FPS
+
+# How frames flow from track.recv() to the data channel
+MODE_INLINE = "inline"      # everything sequential on the event loop
+MODE_WORKER = "worker"      # inference on a worker thread, latest frame wins
+MODE_PIPELINE = "pipeline"  # decode / preprocess / infer / publish as concurrent stages
+EXECUTION_MODES = (MODE_INLINE, MODE_WORKER, MODE_PIPELINE)
+
+PIPELINE_STAGE_NAMES = ("decode", "preprocess", "infer", "publish")
+PIPELINE_STAGE_DEFAULTS = {
+    "decode": {"maxsize": 2, "drop_policy": "drop_oldest"},
+    "preprocess": {"maxsize": 2, "drop_policy": "drop_oldest"},
+    # Single slot: the detector always picks up the freshest frame
+    "infer": {"maxsize": 1, "drop_policy": "drop_oldest"},
+    "publish": {"maxsize": 4, "drop_policy": "drop_oldest"},
+}
+
+# Timed steps of a frame's life. recv = waiting on the track for the next frame;
+# serialize / send are recorded by the session's data channel publisher.
+LATENCY_STAGES = ("recv", "decode", "preprocess", "infer", "serialize", "send")
 
 class VideoProcessor:
-    def __init__(self, 
+    def __init__(self,
                  enable_display: bool = True,
                  flip_vertical: bool = True,
                  flip_horizontal: bool = False,
                  rotate_180: bool = False,
-                 log_interval: int = 30):
+                 log_interval: int = 30,
+                 execution_mode: str = MODE_INLINE,
+                 pipeline_stages: Optional[Dict[str, Dict[str, Any]]] = None,
+                 color_order: str = "bgr",
+                 decode_max_size: Optional[Tuple[int, int]] = None,
+                 motion_gate: Optional[Dict[str, Any]] = None,
+                 tracker: Optional[Dict[str, Any]] = None,
+                 roi: Optional[Dict[str, Any]] = None,
+                 preview_fps: float = PREVIEW_FPS,
+                 preview_stream: bool = False):
         self.enable_display = enable_display
         self.flip_vertical = flip_vertical
         self.flip_horizontal = flip_horizontal
         self.rotate_180 = rotate_180
         self.log_interval = log_interval
-        
+
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode '{execution_mode}', expected one of {EXECUTION_MODES}")
+        self.execution_mode = execution_mode
+        # Per-stage queue settings for pipeline mode: {"infer": {"maxsize": 1, "drop_policy": "drop_oldest"}}
+        self.pipeline_stages = pipeline_stages or {}
+        self.inference_worker: Optional[InferenceWorker] = None
+        self.pipeline: Optional[FramePipeline] = None
+
+        # Decode straight into the detector's color order / resolution, flip into reused buffers
+        self.preprocessor = FramePreprocessor(
+            color_order=color_order,
+            max_size=decode_max_size,
+            flip_vertical=flip_vertical,
+            flip_horizontal=flip_horizontal,
+            rotate_180=rotate_180,
+            pool_size=self._frames_in_flight(),
+        )
+
+        # Reuses the last detections while the scene is static; None = infer every frame
+        self.motion_gate: Optional[MotionGate] = MotionGate(**motion_gate) if motion_gate is not None else None
+        # Moves boxes with optical flow between detector keyframes; None = detect every frame
+        self.tracker: Optional[BoxTracker] = BoxTracker(**tracker) if tracker is not None else None
+        # Crops the detector input to the headset's region-of-interest hints; None = whole frame
+        self.roi: Optional[RoiSelector] = RoiSelector(**roi) if roi is not None else None
+        # Detections kept per inferred frame, highest confidence first; None = all
+        # (lowered at runtime by the latency controller)
+        self.max_detections: Optional[int] = None
+        # Window and / or MJPEG preview, drawn on its own thread at <= preview_fps
+        self.preview: Optional[PreviewRenderer] = None
+        if enable_display or preview_stream:
+            self.preview = PreviewRenderer(window=enable_display, stream=preview_stream,
+                                           max_fps=preview_fps, color_order=color_order)
+
         self.frame_count = 0
         self.last_fps_time = 0
         self.fps_frame_count = 0
         self.frame_callback: Optional[Callable] = None
         self.data_channel_sender = None  # function to send JSON over data channel
-    
+        # Shared cross-session engine; replaces frame_callback when set
+        self.inference_engine: Optional[BatchInferenceEngine] = None
+        # Shared fair-share scheduler; inference runs within this session's slots when set
+        self.scheduler: Optional[FairScheduler] = None
+        self.session_id: Any = None
+        # Per-session detector state, handed to the engine with each frame
+        self.detector_state: Dict[str, Any] = {}
+        # Set once the detector is loaded and warm; frames before that get no detections
+        self.model_ready: Optional[threading.Event] = None
+        self._stop_requested = False
+
+        # Per-stream stats (smoothed)
+        self.fps = 0.0
+        self.latency_ms = 0.0
+        self.frames_published = 0
+        # Per-stage wall time histograms and receive-to-publish latency
+        self.stage_latency: Dict[str, LatencyRecorder] = {name: LatencyRecorder() for name in LATENCY_STAGES}
+        self.end_to_end_latency = LatencyRecorder()
+        # Capture-to-publish from the frame's pts, relative to the least delayed
+        # frame seen so far (sender and server clocks are not synchronized)
+        self.capture_latency = LatencyRecorder()
+        self._capture_offset: Optional[float] = None
+
     def set_frame_callback(self, callback: Callable):
         self.frame_callback = callback
 
     def set_data_channel_sender(self, sender: Callable[[Dict[str, Any]], None]):
         self.data_channel_sender = sender
-    
+
+    def set_inference_engine(self, engine: Optional[BatchInferenceEngine]):
+        self.inference_engine = engine
+
+    def set_scheduler(self, scheduler: Optional[FairScheduler]):
+        self.scheduler = scheduler
+
+    def set_model_ready(self, ready: Optional[threading.Event]):
+        self.model_ready = ready
+
+    @property
+    def window_name(self) -> str:
+        if self.session_id is None:
+            return "Quest PCA Stream"
+        return f"Quest PCA Stream [{self.session_id}]"
+
+    def _frames_in_flight(self) -> int:
+        """Upper bound on frames alive at once, sizes the preprocessor's buffer ring."""
+        if self.execution_mode == MODE_INLINE:
+            return 2
+        if self.execution_mode == MODE_WORKER:
+            return 4  # mailbox + inferring + publishing + being decoded
+        queued = sum(self._stage_settings(name)["maxsize"] for name in PIPELINE_STAGE_NAMES)
+        return queued + len(PIPELINE_STAGE_NAMES) + 2
+
+    def _stage_settings(self, name: str) -> Dict[str, Any]:
+        return {**PIPELINE_STAGE_DEFAULTS[name], **self.pipeline_stages.get(name, {})}
+
+    def decode_frame(self, frame) -> Optional[cv2.Mat]:
+        start = time.perf_counter()
+        img = self.preprocessor.decode(frame)
+        self.stage_latency["decode"].record((time.perf_counter() - start) * 1000.0)
+        if img is None or img.size == 0:
+            return None
+        return img
+
+    def preprocess_image(self, img: cv2.Mat) -> cv2.Mat:
+        start = time.perf_counter()
+        img = self.preprocessor.orient(img)
+        self.stage_latency["preprocess"].record((time.perf_counter() - start) * 1000.0)
+        return img
+
     def process_frame(self, frame) -> Optional[cv2.Mat]:
         try:
-            img = frame.to_ndarray(format="bgr24")
-            
-            if img is None or img.size == 0:
+            img = self.decode_frame(frame)
+            if img is None:
                 return None
-            
-            if self.rotate_180:
-                img = cv2.rotate(img, cv2.ROTATE_180)
-            else:
-                if self.flip_vertical:
-                    img = cv2.flip(img, 0)
-                if self.flip_horizontal:
-                    img = cv2.flip(img, 1)
-            
-            return img
-            
+            return self.preprocess_image(img)
+
         except Exception as e:
             print(f"[VideoProcessor] Error processing frame: {e}")
             return None
-    
-    def display_frame(self, img: cv2.Mat) -> bool:
-        if not self.enable_display:
-            return True
-        
-        cv2.imshow("Quest PCA Stream", img)
-        
-        key = cv2.waitKey(1) & 0xFF
-        if key == ord("q"):
-            return False
-        
-        return True
-    
+
+    def show_preview(self, packet: FramePacket):
+        """Hands the frame to the preview thread; no drawing happens here."""
+        if self.preview is None:
+            return
+        self.preview.submit(packet.img, packet.detections)
+        if self.preview.quit_requested:
+            self._stop_requested = True
+
     def log_frame_info(self, frame, fps: float):
         if self.frame_count % self.log_interval == 0:
-            print(f"[VideoProcessor] Frame {self.frame_count} | Size: {frame.width}x{frame.height} | FPS: {fps:.1f}")
-    
+            info = f"[VideoProcessor] Frame {self.frame_count} | Size: {frame.width}x{frame.height} | FPS: {fps:.1f} | Latency: {self.latency_ms:.1f}ms"
+            # Frame conversion to the detector's size; grows with the stream's resolution
+            info += f" | Decode: {self.stage_latency['decode'].percentiles((50,))['p50_ms']:.1f}ms"
+            alloc = self.preprocessor.stats()
+            info += f" | Alloc: {alloc['last_frame_bytes'] / 1024:.0f}KB/frame"
+            if self.session_id is not None:
+                info = info.replace("[VideoProcessor]", f"[VideoProcessor {self.session_id}]", 1)
+            if self.inference_worker is not None:
+                stats = self.inference_worker.stats()
+                info += f" | Inferred: {stats['inferred']} | Dropped: {stats['dropped']}"
+            if self.pipeline is not None:
+                info += f" | {self.pipeline.format_stats()}"
+            if self.motion_gate is not None:
+                info += f" | Skipped: {self.motion_gate.stats()['skip_rate'] * 100:.0f}%"
+            if self.tracker is not None:
+                stats = self.tracker.stats()
+                info += f" | Keyframes: {stats['keyframe_rate'] * 100:.0f}% | Tracks: {stats['tracks']}"
+            if self.roi is not None and self.roi.roi_frames:
+                info += f" | ROI: {self.roi.stats()['roi_rate'] * 100:.0f}%"
+            if self.inference_engine is not None:
+                stats = self.inference_engine.stats()
+                if "workers" in stats:
+                    info += f" | Workers: {stats['workers']} @ {stats['avg_infer_ms']:.1f}ms"
+                else:
+                    info += f" | Batch: {stats['avg_batch_size']:.1f} @ {stats['avg_batch_ms']:.1f}ms"
+            print(info)
+
+    def latency_report(self) -> Dict[str, Dict[str, float]]:
+        """p50 / p95 / p99 per stage and end to end (receive to publish)."""
+        report = {name: recorder.summary() for name, recorder in self.stage_latency.items()}
+        report["end_to_end"] = self.end_to_end_latency.summary()
+        if self.capture_latency.count:
+            report["capture_to_publish"] = self.capture_latency.summary()
+        return report
+
+    def counters(self) -> Dict[str, int]:
+        dropped = 0
+        if self.pipeline is not None:
+            dropped += sum(s["dropped"] for s in self.pipeline.stats().values())
+        if self.inference_worker is not None:
+            dropped += self.inference_worker.stats()["dropped"]
+        return {
+            "received": self.frame_count,
+            "published": self.frames_published,
+            "dropped": dropped,
+            "skipped": self.motion_gate.skipped if self.motion_gate is not None else 0,
+            "tracked": self.tracker.tracked_frames if self.tracker is not None else 0,
+            "roi_cropped": self.roi.roi_frames if self.roi is not None else 0,
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        """Snapshot for the metrics endpoint."""
+        latency = {name: recorder.export() for name, recorder in self.stage_latency.items()}
+        latency["end_to_end"] = self.end_to_end_latency.export()
+        latency["capture_to_publish"] = self.capture_latency.export()
+        return {
+            "counters": self.counters(),
+            "gauges": {"fps": round(self.fps, 2), "latency_ms": round(self.latency_ms, 2)},
+            "latency": latency,
+        }
+
+    def send_detections(self, frame_number: int, img: cv2.Mat, detections: Any):
+        if detections is None or self.data_channel_sender is None:
+            return
+        try:
+            height, width = img.shape[:2]
+            self.data_channel_sender({
+                "type": "detections",
+                "frame": frame_number,
+                "width": int(width),
+                "height": int(height),
+                "detections": detections,
+            })
+        except Exception as e:
+            print(f"[VideoProcessor] Failed to send detections: {e}")
+
+    # Stage functions, shared by the worker and pipeline modes
+
+    def _decode_stage(self, packet: FramePacket) -> Optional[FramePacket]:
+        packet.img = self.decode_frame(packet.frame)
+        return packet if packet.img is not None else None
+
+    def _preprocess_stage(self, packet: FramePacket) -> FramePacket:
+        packet.img = self.preprocess_image(packet.img)
+        return packet
+
+    def _gate(self, packet: FramePacket) -> bool:
+        """
+        False when this frame is served without the detector: the motion gate
+        reuses the last detections on a static scene, otherwise the tracker
+        moves the last boxes forward until it wants a new keyframe. While the
+        model is still loading, frames pass through without detections.
+        """
+        if self.model_ready is not None and not self.model_ready.is_set():
+            packet.detections = None
+            return False
+        if self.motion_gate is not None and not self.motion_gate.should_run(packet.img):
+            packet.detections = self.motion_gate.last_detections
+            return False
+        if self.tracker is not None and not self.tracker.needs_keyframe():
+            packet.detections = self._cap(self.tracker.propagate(packet.img))
+            if self.motion_gate is not None:
+                self.motion_gate.update(packet.detections)
+            return False
+        return True
+
+    def _detector_input(self, packet: FramePacket) -> Tuple[cv2.Mat, Optional[Tuple[int, int, int, int]]]:
+        """The frame, or its region-of-interest crop and where it sits in the frame."""
+        if self.roi is None:
+            return packet.img, None
+        height, width = packet.img.shape[:2]
+        crop = self.roi.crop_for(width, height)
+        if crop is None:
+            return packet.img, None
+        x1, y1, x2, y2 = crop
+        # Contiguous copy (a fraction of the frame), safe to hand to any detector or worker
+        return packet.img[y1:y2, x1:x2].copy(), crop
+
+    def _from_crop(self, detections: Any, crop: Optional[Tuple[int, int, int, int]]) -> Any:
+        """Full-frame detections from the detector output."""
+        if crop is not None:
+            detections = offset_detections(detections, crop[0], crop[1])
+        return detections
+
+    def _cap(self, detections: Any) -> Any:
+        """The max_detections most confident detections."""
+        limit = self.max_detections
+        if limit is not None and isinstance(detections, list) and len(detections) > limit:
+            detections = sorted(detections, key=lambda det: det.get("conf", 0.0), reverse=True)[:limit]
+        return detections
+
+    def _after_inference(self, packet: FramePacket, crop: Optional[Tuple[int, int, int, int]] = None):
+        if self.tracker is not None:
+            # Attaches persistent track ids and seeds flow points for the next frames.
+            # The tracker gets every detection and is told what the detector did not
+            # look at, so the cap and ROI crops never end a track; only what is sent is capped.
+            packet.detections = self.tracker.update(packet.img, packet.detections, region=crop)
+        packet.detections = self._cap(packet.detections)
+        if self.motion_gate is not None:
+            self.motion_gate.update(packet.detections)
+
+    def _infer_stage(self, packet: FramePacket) -> FramePacket:
+        start = time.perf_counter()
+        if self._gate(packet):
+            crop = None
+            if self.frame_callback:
+                img, crop = self._detector_input(packet)
+                packet.detections = self._from_crop(self.frame_callback(img, packet.frame), crop)
+            self._after_inference(packet, crop)
+        self.stage_latency["infer"].record((time.perf_counter() - start) * 1000.0)
+        return packet
+
+    async def _infer_async_stage(self, packet: FramePacket) -> FramePacket:
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # Gate and tracker work off the event loop (optical flow is a few ms)
+        if not await loop.run_in_executor(None, self._gate, packet):
+            # Skipped frames never queue for a scheduler slot or a batch
+            self.stage_latency["infer"].record((time.perf_counter() - start) * 1000.0)
+            return packet
+        img, crop = self._detector_input(packet)
+        if self.inference_engine is not None:
+            if self.scheduler is not None:
+                async with self.scheduler.slot(self.session_id):
+                    packet.detections = await self.inference_engine.infer(img, self.session_id, self.detector_state)
+            else:
+                packet.detections = await self.inference_engine.infer(img, self.session_id, self.detector_state)
+        elif self.frame_callback:
+            packet.detections = await self.scheduler.run(
+                self.session_id, self.frame_callback, img, packet.frame
+            )
+        packet.detections = self._from_crop(packet.detections, crop)
+        if self.tracker is not None or self.motion_gate is not None:
+            await loop.run_in_executor(None, self._after_inference, packet, crop)
+        else:
+            packet.detections = self._cap(packet.detections)
+        self.stage_latency["infer"].record((time.perf_counter() - start) * 1000.0)
+        return packet
+
+    def _select_infer_stage(self) -> Callable:
+        if self.inference_engine is not None or self.scheduler is not None:
+            return self._infer_async_stage
+        return self._infer_stage
+
+    def _record_published(self, packet: FramePacket):
+        now = time.perf_counter()
+        latency_ms = (now - packet.received_at) * 1000.0
+        self.end_to_end_latency.record(latency_ms)
+        self._record_capture_latency(packet, now)
+        self.latency_ms = latency_ms if self.frames_published == 0 else 0.9 * self.latency_ms + 0.1 * latency_ms
+        self.frames_published += 1
+
+    def _record_capture_latency(self, packet: FramePacket, now: float):
+        pts = getattr(packet.frame, "pts", None)
+        time_base = getattr(packet.frame, "time_base", None)
+        if pts is None or not time_base:
+            return
+        media_time = float(pts * time_base)
+        offset = packet.received_at - media_time
+        if self._capture_offset is None or offset < self._capture_offset:
+            self._capture_offset = offset
+        self.capture_latency.record((now - (media_time + self._capture_offset)) * 1000.0)
+
+    def _publish_stage(self, packet: FramePacket):
+        self.send_detections(packet.number, packet.img, packet.detections)
+        self._record_published(packet)
+        self.show_preview(packet)
+
+    def _on_inference_result(self, packet: FramePacket, packet_out: FramePacket):
+        self.send_detections(packet_out.number, packet_out.img, packet_out.detections)
+        self._record_published(packet_out)
+        self.show_preview(packet_out)
+
+    def _build_pipeline(self) -> FramePipeline:
+        stage_fns = {
+            "decode": self._decode_stage,
+            "preprocess": self._preprocess_stage,
+            "infer": self._select_infer_stage(),
+            "publish": self._publish_stage,
+        }
+        stages = []
+        for name in PIPELINE_STAGE_NAMES:
+            settings = self._stage_settings(name)
+            stages.append(PipelineStage(
+                name,
+                stage_fns[name],
+                maxsize=settings["maxsize"],
+                drop_policy=settings["drop_policy"],
+                # aiortc channels must stay on the loop thread
+                threaded=(name != "publish"),
+            ))
+        return FramePipeline(stages)
+
     async def process_video_stream(self, track):
-        print("[VideoProcessor] Starting video processing...")
-        
+        print(f"[VideoProcessor] Starting video processing ({self.execution_mode})...")
+        self._stop_requested = False
+        if self.session_id is None:
+            self.session_id = getattr(track, "id", None)
+        if self.preview is not None:
+            self.preview.name = self.window_name
+            self.preview.start()
+
+        if self.execution_mode == MODE_WORKER:
+            self.inference_worker = InferenceWorker(self._select_infer_stage(), self._on_inference_result)
+            self.inference_worker.start()
+        elif self.execution_mode == MODE_PIPELINE:
+            self.pipeline = self._build_pipeline()
+            self.pipeline.start()
+
         try:
-            while True:
+            while not self._stop_requested:
+                recv_start = time.perf_counter()
                 frame = await track.recv()
+                self.stage_latency["recv"].record((time.perf_counter() - recv_start) * 1000.0)
                 self.frame_count += 1
                 self.fps_frame_count += 1
-                
+
                 should_log = self.frame_count % self.log_interval == 0
                 current_time = asyncio.get_event_loop().time() if should_log else 0
-                
+
                 if should_log:
                     fps = self.fps_frame_count / (current_time - self.last_fps_time) if (current_time - self.last_fps_time) > 0 else 0
+                    self.fps = fps
                     self.log_frame_info(frame, fps)
                     self.last_fps_time = current_time
                     self.fps_frame_count = 0
-                
-                processed_img = self.process_frame(frame)
-                if processed_img is None:
+
+                if self.pipeline is not None:
+                    # Decoding happens in the pipeline; the loop only drains the track
+                    await self.pipeline.submit(FramePacket(self.frame_count, frame))
+                    continue
+
+                packet = FramePacket(self.frame_count, frame)
+                packet.img = self.process_frame(frame)
+                if packet.img is None:
+                    continue
+
+                if self.inference_worker is not None:
+                    # Never blocks: a frame still waiting for the worker gets replaced
+                    self.inference_worker.submit(packet)
                     continue
-                
-                if self.frame_callback:
-                    # Expect callback to optionally return detections to forward
-                    detections = self.frame_callback(processed_img, frame)
-                    if detections is not None and self.data_channel_sender is not None:
-                        try:
-                            height, width = processed_img.shape[:2]
-                            self.data_channel_sender({
-                                "type": "detections",
-                                "frame": self.frame_count,
-                                "width": int(width),
-                                "height": int(height),
-                                "detections": detections,
-                            })
-                        except Exception as e:
-                            print(f"[VideoProcessor] Failed to send detections: {e}")
-                
-                if not self.display_frame(processed_img):
-                    break
-                    
+
+                # Expect callback to optionally return detections to forward
+                infer = self._select_infer_stage()
+                if asyncio.iscoroutinefunction(infer):
+                    await infer(packet)
+                else:
+                    infer(packet)
+                self._publish_stage(packet)
+
         except Exception as e:
             print(f"[VideoProcessor] Video processing ended: {e}")
         finally:
-            cv2.destroyAllWindows()
-    
+            if self.inference_worker is not None:
+                await self.inference_worker.stop()
+                self.inference_worker = None
+            if self.pipeline is not None:
+                await self.pipeline.stop()
+                self.pipeline = None
+            if self.preview is not None:
+                self.preview.stop()
+
     def cleanup(self):
-        cv2.destroyAllWindows() 
\ No newline at end of file
+        if self.preview is not None:
+            self.preview.stop()
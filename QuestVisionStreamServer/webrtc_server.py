@@ -1,6 +1,10 @@
 import asyncio
+import itertools
 import json
+import math
+import time
 import websockets
+from typing import Any, Optional, Callable, Dict, List
 from aiortc import (
     RTCPeerConnection,
     RTCSessionDescription,
@@ -8,48 +12,165 @@ from aiortc import (
     RTCIceServer,
     RTCDataChannel,
 )
-from aiortc.sdp import candidate_from_sdp, candidate_to_sdp
+from aiortc.sdp import candidate_from_sdp
 from video_processor import VideoProcessor
+from session import StreamSession
+from scheduler import FairScheduler
+from wire_format import FORMATS
+from local_http import LocalHTTPServer, respond
+from preview import stream_mjpeg
+from metrics import render_prometheus
+from stream_negotiation import StreamNegotiator, negotiated_codec
 
 class WebRTCServer:
-    def __init__(self, host: str = "0.0.0.0", port: int = 3000, video_processor: VideoProcessor = None):
+    def __init__(self,
+                 host: str = "0.0.0.0",
+                 port: int = 3000,
+                 processor_factory: Optional[Callable[[StreamSession], VideoProcessor]] = None,
+                 scheduler: Optional[FairScheduler] = None,
+                 metrics_host: str = "127.0.0.1",
+                 metrics_port: Optional[int] = None,
+                 model_loader: Any = None,
+                 latency_controller: Any = None,
+                 ice_servers: Optional[List[Dict[str, Any]]] = None,
+                 lan_only: bool = False,
+                 stream: Optional[StreamNegotiator] = None):
         self.host = host
         self.port = port
-        self.video_processor = video_processor or VideoProcessor()
+        # [{"urls": [...], "username": ..., "credential": ...}]; lan_only skips
+        # STUN / TURN entirely so ICE gathering is host candidates only (no
+        # waiting on servers an isolated network cannot reach)
+        self.ice_servers = [] if lan_only else list(ice_servers or [])
+        self.lan_only = lan_only
+        # Codec order and target size / fps / bitrate asked of the headset; None answers as offered
+        self.stream = stream
+        # Each connected headset gets its own VideoProcessor from this factory
+        self.processor_factory = processor_factory or (lambda session: VideoProcessor())
+        self.scheduler = scheduler
         self.pcs = set()
-        from typing import Optional
-        self.detections_channel: Optional[RTCDataChannel] = None
+        self.sessions: Dict[str, StreamSession] = {}
+        self._session_ids = itertools.count(1)
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        self.http: Optional[LocalHTTPServer] = None
+        self.sessions_total = 0
+        self.last_connect_ms = 0.0
+        # Signaling starts before the model is ready; headsets get "loading" until then
+        self.model_loader = model_loader
+        if model_loader is not None:
+            model_loader.on_ready(self.announce_ready)
+        # Reported alongside the sessions; it adjusts them on its own task
+        self.latency_controller = latency_controller
     
-    def set_video_processor(self, video_processor: VideoProcessor):
-        self.video_processor = video_processor
+    def set_processor_factory(self, processor_factory: Callable[[StreamSession], VideoProcessor]):
+        self.processor_factory = processor_factory
+
+    def session_stats(self):
+        return [session.stats() for session in self.sessions.values()]
+
+    @property
+    def model_ready(self) -> bool:
+        return self.model_loader is None or self.model_loader.ready.is_set()
+
+    def _status_message(self) -> Dict[str, Any]:
+        # Advertise wire formats; the headset may answer with set_format
+        message = {"type": "ready" if self.model_ready else "loading", "formats": list(FORMATS)}
+        if self.stream is not None:
+            message["stream"] = self.stream.target()
+        return message
+
+    def announce_ready(self):
+        """Tells headsets that connected while the model was loading."""
+        for session in list(self.sessions.values()):
+            session.send(self._status_message())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Metrics of every live session, as rendered by the metrics endpoint."""
+        snapshot = {
+            "sessions": {session_id: session.metrics() for session_id, session in list(self.sessions.items())},
+            "counters": {"sessions_total": self.sessions_total},
+            "gauges": self.model_loader.gauges() if self.model_loader is not None else {},
+        }
+        if self.last_connect_ms:
+            snapshot["gauges"]["last_connect_ms"] = round(self.last_connect_ms, 1)
+        if self.latency_controller is not None:
+            snapshot["counters"].update(self.latency_controller.counters())
+            snapshot["gauges"].update(self.latency_controller.gauges())
+        return snapshot
+
+    async def _serve_metrics(self, writer, path: str):
+        await respond(writer, 200, "text/plain; version=0.0.4", render_prometheus(self.snapshot()))
+
+    async def _serve_metrics_json(self, writer, path: str):
+        await respond(writer, 200, "application/json", json.dumps(self.snapshot()))
+
+    async def _serve_preview(self, writer, path: str):
+        """MJPEG stream of /preview/<session id>, or of the newest session for /preview/."""
+        session_id = path[len("/preview/"):]
+        previews = {sid: s.processor.preview for sid, s in list(self.sessions.items())
+                    if s.processor.preview is not None and s.processor.preview.stream and s.processor.preview.running}
+        if not session_id and previews:
+            session_id = list(previews)[-1]
+        preview = previews.get(session_id)
+        if preview is None:
+            await respond(writer, 404, "text/plain", f"No preview for '{session_id}', live: {sorted(previews)}\n")
+            return
+        await stream_mjpeg(writer, preview)
     
+    def _rtc_configuration(self) -> RTCConfiguration:
+        return RTCConfiguration(iceServers=[
+            RTCIceServer(urls=server["urls"], username=server.get("username"), credential=server.get("credential"))
+            for server in self.ice_servers
+        ])
+
+    def _describe_ice(self) -> str:
+        if not self.ice_servers:
+            return "host candidates only" + (" (LAN mode)" if self.lan_only else "")
+        urls = [url for server in self.ice_servers
+                for url in ([server["urls"]] if isinstance(server["urls"], str) else server["urls"])]
+        return ", ".join(urls)
+
     async def handle_signaling(self, websocket):
-        print("[WebRTC] Quest connected")
+        session_id = f"quest-{next(self._session_ids)}"
+        print(f"[WebRTC] Quest connected ({session_id})")
         
-        # Configure WebRTC with STUN server
-        config = RTCConfiguration(
-            iceServers=[
-                RTCIceServer(urls=["stun:stun.l.google.com:19302"]),
-                RTCIceServer(
-                    urls=["turn:openrelay.metered.ca:443?transport=tcp"],
-                    username="openrelayproject",
-                    credential="openrelayproject",
-                ),
-            ]
-        )
-        pc = RTCPeerConnection(configuration=config)
+        pc = RTCPeerConnection(configuration=self._rtc_configuration())
+        if self.stream is not None:
+            self.stream.prepare(pc)
         self.pcs.add(pc)
+        session = StreamSession(session_id, pc, self.processor_factory)
+        self.sessions[session_id] = session
+        self.sessions_total += 1
+        if self.scheduler is not None:
+            self.scheduler.register(session_id, session.weight)
         
         offer_received = False
         video_task = None
+        answer_task = None
+        # Remote candidates that arrive before the offer has been applied
+        pending_candidates: List[Any] = []
+        # Connection setup milestones, ms since the offer arrived
+        timing = session.connect_timing
+        offer_at = 0.0
+
+        def mark(name: str):
+            if offer_at and name not in timing:
+                timing[name] = (time.perf_counter() - offer_at) * 1000.0
         
         @pc.on("iceconnectionstatechange")
         async def on_ice_state_change():
             print(f"[WebRTC] ICE: {pc.iceConnectionState}")
+            if pc.iceConnectionState in ("connected", "completed"):
+                mark("ice_connected")
         
         @pc.on("connectionstatechange")
         async def on_connection_state_change():
             print(f"[WebRTC] PC: {pc.connectionState}")
+            if pc.connectionState == "connected" and "connected" not in timing:
+                mark("connected")
+                self.last_connect_ms = timing["connected"]
+                steps = ", ".join(f"{name} {ms:.0f}ms" for name, ms in timing.items() if name != "connected")
+                print(f"[WebRTC] {session_id} offer to connected in {timing['connected']:.0f}ms ({steps})")
         
         @pc.on("track")
         async def on_track(track):
@@ -59,7 +180,7 @@ class WebRTCServer:
                 # Start video processing in separate task
                 nonlocal video_task
                 video_task = asyncio.create_task(
-                    self.video_processor.process_video_stream(track)
+                    session.processor.process_video_stream(track)
                 )
                 print("[WebRTC] Processing started")
 
@@ -67,32 +188,48 @@ class WebRTCServer:
         def on_datachannel(channel: RTCDataChannel):
             print(f"[WebRTC] DC: {channel.label}")
             if channel.label == "detections":
-                self.detections_channel = channel
+                session.attach_channel(channel)
                 @channel.on("open")
                 def _on_open():
-                    try:
-                        channel.send(json.dumps({"type": "ready"}))
-                    except Exception:
-                        pass
+                    mark("channel_open")
+                    session.send(self._status_message())
                 @channel.on("message")
                 def _on_message(message):
-                    # No-op; Quest may send messages if needed
-                    return
-
-        @pc.on("icecandidate")
-        async def on_icecandidate(cand):
-            if cand is None:
-                return
-            payload = {
-                "type": "candidate",
-                "candidate": candidate_to_sdp(cand),
-                "sdpMid": cand.sdpMid,
-                "sdpMLineIndex": cand.sdpMLineIndex,
-            }
+                    # e.g. {"type": "set_queries", "queries": ["mug", "keys"]}
+                    session.handle_message(message)
+
+        # aiortc gathers every local candidate inside setLocalDescription and
+        # puts them in the answer SDP, so nothing trickles from this side. What
+        # it waits on there is the STUN / TURN servers; with none configured
+        # (LAN mode) gathering is host candidates only and takes milliseconds.
+        remote_applied = False
+
+        async def answer_offer(sdp: str):
+            nonlocal remote_applied
             try:
-                await websocket.send(json.dumps(payload))
-            except Exception:
+                await pc.setRemoteDescription(RTCSessionDescription(sdp=sdp, type="offer"))
+                mark("remote_description")
+                # Candidates the headset trickled while the offer was being applied
+                for cand in pending_candidates:
+                    await pc.addIceCandidate(cand)
+                pending_candidates.clear()
+                remote_applied = True
+
+                answer = await pc.createAnswer()
+                await pc.setLocalDescription(answer)
+                mark("gathered")
+                sdp = pc.localDescription.sdp
+                if self.stream is not None:
+                    sdp = self.stream.answer_sdp(sdp)
+                await websocket.send(json.dumps({"type": "answer", "sdp": sdp}))
+                mark("answer_sent")
+                session.codec = negotiated_codec(sdp)
+                print(f"[WebRTC] Answer ({session.codec or 'no video'}, {timing['answer_sent']:.0f}ms after offer)")
+            except websockets.ConnectionClosed:
                 pass
+            except Exception as e:
+                print(f"[WebRTC] Offer failed: {e}")
+                await websocket.close()
         
         try:
             async for message in websocket:
@@ -105,30 +242,45 @@ class WebRTCServer:
                         continue
                     
                     offer_received = True
+                    offer_at = time.perf_counter()
                     print("[WebRTC] Offer")
+
+                    # Optional scheduling weight for this headset's share of inference
+                    if "weight" in data and self.scheduler is not None:
+                        try:
+                            weight = float(data["weight"])
+                        except (TypeError, ValueError):
+                            weight = float("nan")
+                        if math.isfinite(weight) and weight > 0:
+                            session.weight = weight
+                            self.scheduler.set_weight(session_id, session.weight)
+                        else:
+                            print(f"[WebRTC] Ignoring invalid weight {data['weight']!r}, keeping {session.weight}")
                     
-                    offer = RTCSessionDescription(sdp=data["sdp"], type="offer")
-                    await pc.setRemoteDescription(offer)
-                    
-                    answer = await pc.createAnswer()
-                    await pc.setLocalDescription(answer)
-                    
-                    response = {"type": "answer", "sdp": pc.localDescription.sdp}
-                    await websocket.send(json.dumps(response))
-                    print("[WebRTC] Answer")
+                    # Answered in the background so trickled candidates keep
+                    # being read (and applied) while the answer is prepared
+                    answer_task = asyncio.create_task(answer_offer(data["sdp"]))
                 
                 elif data["type"] == "candidate":
+                    if not data.get("candidate"):
+                        # End of candidates
+                        continue
                     # add remote candidate
                     cand = candidate_from_sdp(data["candidate"])
                     cand.sdpMid = data["sdpMid"]
                     cand.sdpMLineIndex = int(data["sdpMLineIndex"])
-                    await pc.addIceCandidate(cand)
+                    if remote_applied:
+                        await pc.addIceCandidate(cand)
+                    else:
+                        pending_candidates.append(cand)
         
         except websockets.ConnectionClosed:
             print("[WebRTC] Quest disconnected")
         except Exception as e:
             print(f"[WebRTC] Error: {e}")
         finally:
+            if answer_task is not None and not answer_task.done():
+                answer_task.cancel()
             # Clean up video processing task
             if video_task and not video_task.done():
                 video_task.cancel()
@@ -139,10 +291,26 @@ class WebRTCServer:
             
             await pc.close()
             self.pcs.discard(pc)
-            self.video_processor.cleanup()
+            print(f"[WebRTC] Session closed: {session.stats()}")
+            session.cleanup()
+            self.sessions.pop(session_id, None)
+            if self.scheduler is not None:
+                self.scheduler.unregister(session_id)
+            engine = session.processor.inference_engine
+            if engine is not None:
+                engine.forget_session(session_id)
     
     async def start(self):
         print(f"[WebRTC] Starting server on {self.host}:{self.port}")
+        print(f"[WebRTC] ICE servers: {self._describe_ice()}")
+        if self.stream is not None:
+            print(f"[WebRTC] Requested stream: {self.stream.describe()}")
+        if self.metrics_port:
+            self.http = LocalHTTPServer(self.metrics_host, self.metrics_port)
+            self.http.route("/metrics", self._serve_metrics)
+            self.http.route("/metrics.json", self._serve_metrics_json)
+            self.http.route("/preview/", self._serve_preview)
+            await self.http.start()
         
         async with websockets.serve(
             self.handle_signaling, 
@@ -154,7 +322,12 @@ class WebRTCServer:
             await asyncio.Future()
     
     def cleanup(self):
+        if self.http is not None:
+            self.http.close()
+            self.http = None
         for pc in self.pcs:
             asyncio.create_task(pc.close())
         self.pcs.clear()
-        self.video_processor.cleanup() 
\ No newline at end of file
+        for session in self.sessions.values():
+            session.cleanup()
+        self.sessions.clear() 
\ No newline at end of file
@@ -0,0 +1,198 @@
+import struct
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+# Detections wire formats on the data channel:
+#   "json"   - {"type": "detections", ...} text messages (default, always understood)
+#   "binary" - packed little-endian binary messages, opted into by the headset
+#              with {"type": "set_format", "format": "binary", "delta": true}
+#
+# Every binary message starts with a 4 byte header:
+#   magic "QV" | u8 version | u8 kind
+#
+# KIND_LABELS (sent before the first detections and whenever labels are added):
+#   u16 count, then count x (u8 length, utf-8 bytes); label index = position.
+#   Always the whole table, which replaces the client's; once it would pass
+#   MAX_LABELS it restarts from the labels of the current frame.
+# KIND_FULL (every object on this frame):
+#   u32 frame | u16 width | u16 height | u16 count | count x record
+# KIND_DELTA (changes since the previous message, delta mode only):
+#   u32 frame | u16 width | u16 height | u16 changed | u16 removed |
+#   changed x record | removed x u32 id
+#
+# record (16 bytes): u32 id | u16 label index | u16 conf * 65535 | u16 x1, y1, x2, y2 (px)
+# id is the tracker's persistent id, 0 when tracking is disabled.
+# With several detectors, table labels are "source/label" (e.g. "yolo/cup");
+# extra fields such as pose landmarks are only sent in the JSON format.
+FORMATS = ("json", "binary")
+MAGIC = b"QV"
+VERSION = 1
+KIND_LABELS = 1
+KIND_FULL = 2
+KIND_DELTA = 3
+
+RECORD_DTYPE = np.dtype([
+    ("id", "<u4"),
+    ("label", "<u2"),
+    ("conf", "<u2"),
+    ("box", "<u2", (4,)),
+])
+_HEADER = struct.Struct("<2sBB")
+_FULL = struct.Struct("<IHHH")
+_DELTA = struct.Struct("<IHHHH")
+
+# Send a full frame at least this often in delta mode, so a client can resync
+FULL_FRAME_INTERVAL = 30
+# Label table size before it is rebuilt (open-vocabulary queries keep adding labels)
+MAX_LABELS = 1024
+
+
+def _table_label(detection: Dict[str, Any]) -> str:
+    label = str(detection.get("label", ""))
+    return f"{detection['source']}/{label}" if "source" in detection else label
+
+
+def _encode_label(label: str) -> bytes:
+    """UTF-8 bytes of label, cut to 255 bytes on a character boundary."""
+    encoded = label.encode("utf-8")
+    if len(encoded) > 255:
+        encoded = encoded[:255].decode("utf-8", "ignore").encode("utf-8")
+    return encoded
+
+
+class DetectionEncoder:
+    """
+    Packs detections payloads into the binary format for one channel. Holds
+    the label table already sent and, in delta mode, the last record sent per
+    track id.
+    """
+
+    def __init__(self, delta: bool = False, full_frame_interval: int = FULL_FRAME_INTERVAL,
+                 max_labels: int = MAX_LABELS):
+        self.delta = delta
+        self.full_frame_interval = max(1, full_frame_interval)
+        self.max_labels = max(1, min(max_labels, 0xFFFF))
+        self.labels: Dict[str, int] = {}
+        self._labels_changed = False
+        self._previous: Dict[int, bytes] = {}
+        self._since_full = 0
+
+        self.messages = 0
+        self.bytes_sent = 0
+
+    def _label_index(self, label: Any) -> int:
+        label = str(label)
+        index = self.labels.get(label)
+        if index is None:
+            index = self.labels[label] = len(self.labels)
+            self._labels_changed = True
+        return index
+
+    def _labels_message(self) -> bytes:
+        parts = [_HEADER.pack(MAGIC, VERSION, KIND_LABELS), struct.pack("<H", len(self.labels))]
+        for label in self.labels:
+            encoded = _encode_label(label)
+            parts.append(struct.pack("<B", len(encoded)))
+            parts.append(encoded)
+        self._labels_changed = False
+        return b"".join(parts)
+
+    def _records(self, detections: List[Dict[str, Any]], width: int, height: int) -> np.ndarray:
+        records = np.zeros(len(detections), dtype=RECORD_DTYPE)
+        if not detections:
+            return records
+        labels = [_table_label(det) for det in detections]
+        if len(self.labels) + len(set(labels) - self.labels.keys()) > self.max_labels:
+            # Start over with this frame's labels; the new table goes out with it
+            self.labels = {}
+        records["id"] = [det.get("id", 0) for det in detections]
+        records["label"] = [self._label_index(label) for label in labels]
+        conf = np.array([det.get("conf", 0.0) for det in detections], dtype=np.float32)
+        records["conf"] = np.rint(np.clip(conf, 0.0, 1.0) * 65535.0)
+        boxes = np.rint(np.array([det["bbox"] for det in detections], dtype=np.float32).reshape(-1, 4))
+        np.clip(boxes[:, 0::2], 0, max(0, width - 1), out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, max(0, height - 1), out=boxes[:, 1::2])
+        records["box"] = boxes
+        return records
+
+    def encode(self, payload: Dict[str, Any]) -> List[bytes]:
+        """Messages to send for one detections payload (label table first when it grew)."""
+        detections = payload.get("detections")
+        if not isinstance(detections, list):
+            detections = []
+        frame = int(payload.get("frame", 0)) & 0xFFFFFFFF
+        width, height = int(payload.get("width", 0)), int(payload.get("height", 0))
+
+        records = self._records(detections, width, height)
+        messages = []
+        if self._labels_changed:
+            messages.append(self._labels_message())
+
+        # Delta needs stable ids; untracked detections always go as full frames
+        tracked = bool(len(records)) and bool(np.all(records["id"] > 0))
+        use_delta = (self.delta and (tracked or not len(records))
+                     and self._since_full < self.full_frame_interval - 1
+                     # a grown label table goes out with a full frame
+                     and not messages)
+        if use_delta:
+            messages.append(self._delta_message(records, frame, width, height))
+            self._since_full += 1
+        else:
+            messages.append(_HEADER.pack(MAGIC, VERSION, KIND_FULL)
+                            + _FULL.pack(frame, width, height, len(records))
+                            + records.tobytes())
+            self._since_full = 0
+        if self.delta:
+            self._previous = {int(r["id"]): r.tobytes() for r in records}
+
+        self.messages += len(messages)
+        self.bytes_sent += sum(len(m) for m in messages)
+        return messages
+
+    def _delta_message(self, records: np.ndarray, frame: int, width: int, height: int) -> bytes:
+        changed = [i for i, r in enumerate(records) if self._previous.get(int(r["id"])) != r.tobytes()]
+        current = set(int(i) for i in records["id"])
+        removed = np.array([i for i in self._previous if i not in current], dtype="<u4")
+        return (_HEADER.pack(MAGIC, VERSION, KIND_DELTA)
+                + _DELTA.pack(frame, width, height, len(changed), len(removed))
+                + records[changed].tobytes()
+                + removed.tobytes())
+
+
+def decode(message: bytes) -> Optional[Dict[str, Any]]:
+    """Reference decoder for the binary format (labels stay indices)."""
+    magic, version, kind = _HEADER.unpack_from(message, 0)
+    if magic != MAGIC or version != VERSION:
+        return None
+    offset = _HEADER.size
+    if kind == KIND_LABELS:
+        (count,) = struct.unpack_from("<H", message, offset)
+        offset += 2
+        labels = []
+        for _ in range(count):
+            (length,) = struct.unpack_from("<B", message, offset)
+            offset += 1
+            labels.append(message[offset:offset + length].decode("utf-8"))
+            offset += length
+        return {"kind": "labels", "labels": labels}
+
+    if kind == KIND_FULL:
+        frame, width, height, count = _FULL.unpack_from(message, offset)
+        offset += _FULL.size
+        removed = np.empty(0, dtype="<u4")
+    elif kind == KIND_DELTA:
+        frame, width, height, count, removed_count = _DELTA.unpack_from(message, offset)
+        offset += _DELTA.size
+        removed = np.frombuffer(message, dtype="<u4", count=removed_count,
+                                offset=offset + count * RECORD_DTYPE.itemsize)
+    else:
+        return None
+    records = np.frombuffer(message, dtype=RECORD_DTYPE, count=count, offset=offset)
+    return {
+        "kind": "full" if kind == KIND_FULL else "delta",
+        "frame": frame,
+        "width": width,
+        "height": height,
+        "records": records,
+        "removed": removed.tolist(),
+    }